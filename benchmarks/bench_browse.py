@@ -0,0 +1,85 @@
+"""
+Browsing a 1M-card deck loaded from a snapshot: one page of BrowseDeckPage
+against printing every card, as the page did before it had pages.
+
+A deck from clnki.snapshot decodes a card's text only when it is read, so a
+page costs PAGE_SIZE cards wherever it is in the deck. Reported: the time to
+render the first, middle and last page, the last one again after deleting a
+card (CardStore.page then walks the ids up to the page instead of slicing
+them), and the time to print the whole deck. Output goes to /dev/null.
+
+Run from the repository root:
+    python -m benchmarks.bench_browse
+"""
+from clnki.cardstore import CardStore
+from clnki.deck_pages import BrowseDeckPage
+from clnki.snapshot import Snapshot, write_snapshot
+import argparse
+import contextlib
+import os
+import tempfile
+import time
+
+
+class _App:
+    def __init__(self, cards):
+        self.decks = {"deck": _Deck(cards)}
+
+    def open_deck(self, deck_name):
+        return self.decks[deck_name]
+
+
+class _Deck:
+    def __init__(self, cards):
+        self.cards = cards
+
+
+def time_page(page, number):
+    page.on_mount("deck", page=number)
+    start = time.perf_counter()
+    page.render()
+    return time.perf_counter() - start
+
+
+def print_all(cards):
+    start = time.perf_counter()
+    for card_id in cards:
+        print(f"Card {card_id}" + "\n" + "Front:")
+        print(cards[card_id]["front"])
+        print("Back:" + "\n" + cards[card_id]["back"] + "\n")
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="bench_browse")
+    parser.add_argument("--cards", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    store = CardStore()
+    ids = [str(i) for i in range(1, args.cards + 1)]
+    store.extend_new(ids, [f"question {i}" for i in ids], [f"answer {i}" for i in ids])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "collection.snap")
+        with open(path, 'wb') as f:
+            write_snapshot(f, {"deck": store})
+        del store
+        cards = Snapshot(path).load_deck("deck")
+
+        page = BrowseDeckPage(_App(cards))
+        with open(os.devnull, 'w') as null, contextlib.redirect_stdout(null):
+            last = -(-args.cards // page.PAGE_SIZE)
+            times = [time_page(page, number) for number in (1, last // 2, last)]
+            del cards["1"]
+            times.append(time_page(page, last))
+            everything = print_all(cards)
+
+    print(f"{args.cards} cards, {BrowseDeckPage.PAGE_SIZE} per page")
+    for name, seconds in zip(("first page", "middle page", "last page",
+                              "last, deleted"), times):
+        print(f"{name + ':':15} {seconds * 1000:10.2f} ms")
+    print(f"{'every card:':15} {everything * 1000:10.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
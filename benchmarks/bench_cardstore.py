@@ -0,0 +1,64 @@
+"""
+Memory of 1M cards: a dict of card dicts vs a CardStore.
+
+Both hold the same cards (80% reviewed, short front and back). The front and
+back strings are built before measuring and shared by both, so the numbers
+are the cost of everything else: the dicts, the per-field objects and the ids.
+The card_id strings are made with the dicts and reused by the CardStore.
+
+Run from the repository root:
+    python -m benchmarks.bench_cardstore
+"""
+from clnki.cardstore import CardStore, encode_card
+from datetime import date, timedelta
+import argparse
+import gc
+import random
+import tracemalloc
+
+
+def card_dicts(n, texts, seed=0):
+    rng = random.Random(seed)
+    today = date.today()
+    cards = {}
+    for i in range(n):
+        card = {"front": texts[2 * i], "back": texts[2 * i + 1], "is_new": rng.random() < 0.2}
+        if not card["is_new"]:
+            card["stability"] = rng.uniform(0.5, 300)
+            card["difficulty"] = rng.uniform(1, 10)
+            card["last_review_date"] = today - timedelta(days=rng.randint(0, 100))
+            card["due_date"] = card["last_review_date"] + timedelta(days=rng.randint(1, 200))
+        cards[str(i + 1)] = card
+    return cards
+
+
+def measure(build):
+    """Bytes allocated by build() that are still alive once it returns."""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="bench_cardstore")
+    parser.add_argument("--cards", type=int, default=1_000_000)
+    args = parser.parse_args()
+    n = args.cards
+
+    texts = [f"text of card side {i}" for i in range(2 * n)]
+    cards, dict_bytes = measure(lambda: card_dicts(n, texts))
+    store, store_bytes = measure(lambda: CardStore(cards))
+    assert store["1"] == encode_card(cards["1"]) and len(store) == n
+
+    print(f"{n} cards, front/back text not counted")
+    print(f"dict of dicts: {dict_bytes / 1e6:8.1f} MB, {dict_bytes / n:6.0f} bytes per card")
+    print(f"CardStore:     {store_bytes / 1e6:8.1f} MB, {store_bytes / n:6.0f} bytes per card "
+          f"({store.nbytes() / n:.0f} of them in typed columns)")
+    print(f"{dict_bytes / store_bytes:.1f}x smaller")
+
+
+if __name__ == "__main__":
+    main()
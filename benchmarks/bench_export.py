@@ -0,0 +1,50 @@
+"""
+Exporting a 1M-card deck as TSV, gzipped TSV and JSONL: time and peak memory.
+
+The deck is built first, from the same cards as bench_startup. Each export
+is timed, then run again under tracemalloc for the peak of what it allocated
+on top of the deck, which stays around the size of the write buffer however
+big the deck is.
+
+Run from the repository root:
+    python -m benchmarks.bench_export
+"""
+from benchmarks.bench_startup import random_cards
+from clnki.cardstore import CardStore
+from clnki.exporter import export
+from datetime import date
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+EXPORTS = [("tsv", "deck.tsv"), ("tsv", "deck.tsv.gz"), ("jsonl", "deck.jsonl")]
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="bench_export")
+    parser.add_argument("--cards", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    cards = CardStore(random_cards(args.cards, date.today(), random.Random(0)))
+    print(f"{args.cards} cards")
+    print(f"{'file':<12} {'time (s)':>9} {'cards/s':>10} {'size (MB)':>10} {'peak (MB)':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for fmt, name in EXPORTS:
+            path = os.path.join(tmp, name)
+            start = time.perf_counter()
+            export([("deck", cards)], path, fmt, with_deck=False)
+            elapsed = time.perf_counter() - start
+
+            tracemalloc.start()
+            export([("deck", cards)], path, fmt, with_deck=False)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"{name:<12} {elapsed:>9.2f} {args.cards / elapsed:>10,.0f} "
+                  f"{os.path.getsize(path) / 1e6:>10.1f} {peak / 1e6:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
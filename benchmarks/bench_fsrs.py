@@ -0,0 +1,62 @@
+"""
+Scalar fsrs() in a Python loop vs fsrs_batch() over NumPy arrays.
+
+Run from the repository root:
+    python -m benchmarks.bench_fsrs
+"""
+from clnki.fsrs import fsrs, fsrs_batch
+import numpy as np
+import argparse
+import json
+import time
+
+SIZES = [10_000, 100_000, 1_000_000]
+
+
+def random_cards(n, seed=0):
+    rng = np.random.default_rng(seed)
+    elapsed_days = rng.integers(0, 365, n)
+    grades = rng.integers(1, 5, n)
+    s = np.round(rng.uniform(0.1, 365, n), 2)
+    d = np.round(rng.uniform(1, 10, n), 2)
+    return elapsed_days, grades, s, d
+
+
+def run_scalar(elapsed_days, grades, s, d, desired_r, w):
+    # .tolist() so the loop sees plain floats, like cards loaded from json.
+    return [fsrs(e, g, s_i, d_i, desired_r, w)
+            for e, g, s_i, d_i in zip(elapsed_days.tolist(), grades.tolist(),
+                                      s.tolist(), d.tolist())]
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="bench_fsrs")
+    parser.add_argument("--settings", default="clnki/data/settings.json")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    args = parser.parse_args()
+
+    with open(args.settings, 'r', encoding='utf-8') as f:
+        settings = json.load(f)
+    w, desired_r = settings["fsrs"], settings["fsrs_desired_R"]
+
+    print(f"{'cards':>10} {'scalar (s)':>12} {'batch (s)':>12} {'speedup':>9}")
+    for n in args.sizes:
+        cards = random_cards(n)
+
+        start = time.perf_counter()
+        scalar = run_scalar(*cards, desired_r, w)
+        scalar_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        batch = fsrs_batch(*cards, desired_r, w)
+        batch_time = time.perf_counter() - start
+
+        # Both paths must agree exactly, not just approximately.
+        assert np.array_equal(np.array(scalar), np.column_stack(batch))
+
+        print(f"{n:>10} {scalar_time:>12.3f} {batch_time:>12.4f} "
+              f"{scalar_time / batch_time:>8.0f}x")
+
+
+if __name__ == "__main__":
+    main()
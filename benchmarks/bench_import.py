@@ -0,0 +1,106 @@
+"""
+Throughput of importing an Anki text file: rows per second on a 1M-row file.
+
+The file has the usual headers (#separator:tab, #html:true, #columns) and a
+mix of plain fields, quoted fields holding tabs, line breaks and "" quotes,
+and fields with HTML. Four numbers:
+    parse    iter_rows alone, with the peak memory it allocated (tracemalloc,
+             in a separate pass so that tracing does not slow the timed one)
+    import   import_file into an empty Deck, in batches of BATCH_SIZE
+    one by one   the same rows with Deck.add_card per row, for comparison
+    again, skip  the file once more into the imported deck with
+                 duplicates="skip": every row is a duplicate and is left out
+
+Run from the repository root:
+    python -m benchmarks.bench_import
+"""
+from clnki.deck import Deck
+from clnki.importer import BATCH_SIZE, import_file, iter_rows
+import argparse
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+
+def write_notes(path, n, seed=0):
+    rng = random.Random(seed)
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        f.write("#separator:tab\n#html:true\n#columns:Front\tBack\tTags\n")
+        for i in range(n):
+            kind = rng.random()
+            if kind < 0.1:
+                front = f'"question {i}\twith a tab and a ""quote"""'
+                back = f'"answer {i}\nover two lines"'
+            elif kind < 0.2:
+                front = f"<b>question {i}</b>"
+                back = f"answer {i}<br>&amp; more"
+            else:
+                front = f"question {i} " + "x" * rng.randint(5, 40)
+                back = f"answer {i} " + "y" * rng.randint(5, 80)
+            f.write(f"{front}\t{back}\ttag{i % 10}\n")
+
+
+def time_parse(path):
+    start = time.perf_counter()
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        rows = sum(1 for _ in iter_rows(f))
+    return rows, time.perf_counter() - start
+
+
+def parse_peak(path):
+    tracemalloc.start()
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        for _ in iter_rows(f):
+            pass
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def time_one_by_one(path):
+    deck = Deck({})
+    start = time.perf_counter()
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        for front, back in iter_rows(f):
+            deck.add_card(front, back)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="bench_import")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "notes.txt")
+        write_notes(path, args.rows)
+        size = os.path.getsize(path)
+
+        rows, parse_time = time_parse(path)
+        peak = parse_peak(path)
+
+        deck = Deck({})
+        start = time.perf_counter()
+        added = import_file(path, deck)
+        import_time = time.perf_counter() - start
+        assert added == rows == args.rows == len(deck.cards)
+
+        single_time = time_one_by_one(path)
+
+        deck.duplicates  # built here, not timed
+        start = time.perf_counter()
+        assert import_file(path, deck, duplicates="skip") == 0
+        skip_time = time.perf_counter() - start
+
+    print(f"{rows} rows, {size / 1e6:.0f} MB, batches of {BATCH_SIZE}")
+    print(f"parse:       {parse_time:6.2f} s {rows / parse_time:>10,.0f} rows/s, "
+          f"peak {peak / 1e6:.2f} MB")
+    print(f"import:      {import_time:6.2f} s {rows / import_time:>10,.0f} rows/s")
+    print(f"one by one:  {single_time:6.2f} s {rows / single_time:>10,.0f} rows/s")
+    print(f"again, skip: {skip_time:6.2f} s {rows / skip_time:>10,.0f} rows/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Fit FSRS parameters on a synthetic review log of about a million reviews.
+
+The log is simulated with known "true" parameters, then the optimizer starts
+from the default ones. The fit should take seconds and lower the log loss.
+
+Run from the repository root:
+    python -m benchmarks.bench_optimizer
+"""
+from clnki.fsrs import fsrs_batch, fsrs_init_batch, forgetting_curve_batch
+from clnki.optimizer import review_histories, num_predictions, optimize, log_loss
+from clnki.storage import JsonStorage
+import numpy as np
+import argparse
+import json
+import os
+import tempfile
+import time
+
+DEFAULT_W = [0.212, 1.2931, 2.3065, 8.2956, 6.4133,
+             0.8334, 3.0194, 0.001, 1.8722, 0.1666,
+             0.796, 1.4835, 0.0614, 0.2629, 1.6483,
+             0.6014, 1.8729, 0.5425, 0.0912, 0.0658,
+             0.1542]
+
+TRUE_W = [0.4, 1.8, 3.5, 12.0, 6.4133,
+          0.8334, 3.0194, 0.001, 1.5, 0.2,
+          1.1, 1.2, 0.08, 0.3, 1.9,
+          0.5, 2.2, 0.5425, 0.0912, 0.0658,
+          0.25]
+
+
+def simulate_log(path, n_cards, n_reviews, w, desired_r=0.9, seed=0):
+    """Write a review log where n_cards cards are each reviewed n_reviews times."""
+    rng = np.random.default_rng(seed)
+    card_ids = np.arange(n_cards)
+    with open(path, 'w', encoding='utf-8') as f:
+        grades = rng.integers(1, 5, n_cards)
+        s, d, interval = fsrs_init_batch(grades, desired_r, w)
+        for i in range(n_reviews):
+            if i == 0:
+                rows = zip(card_ids.tolist(), grades.tolist())
+                f.writelines(json.dumps(["bench", c, "", None, g, g > 1, None, None]) + "\n"
+                             for c, g in rows)
+                continue
+
+            # Users are rarely exactly on time.
+            elapsed = np.maximum(np.round(interval * rng.uniform(0.5, 1.5, n_cards)), 1)
+            recalled = rng.random(n_cards) < forgetting_curve_batch(elapsed, s, w)
+            grades = np.where(recalled, rng.integers(2, 5, n_cards), 1)
+            rows = zip(card_ids.tolist(), elapsed.astype(int).tolist(), grades.tolist(),
+                       recalled.tolist(), s.tolist(), d.tolist())
+            f.writelines(json.dumps(["bench", c, "", e, g, r, s_i, d_i]) + "\n"
+                         for c, e, g, r, s_i, d_i in rows)
+            s, d, interval = fsrs_batch(elapsed, grades, s, d, desired_r, w)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="bench_optimizer")
+    parser.add_argument("--cards", type=int, default=100_000)
+    parser.add_argument("--reviews-per-card", type=int, default=10)
+    parser.add_argument("--epochs", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "revlog.jsonl")
+        simulate_log(path, args.cards, args.reviews_per_card, TRUE_W)
+
+        start = time.perf_counter()
+        histories = review_histories(JsonStorage(os.path.join(tmp, "decks.json"), None,
+                                                 path).iter_reviews())
+        load_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    fitted = optimize(histories, DEFAULT_W, epochs=args.epochs)
+    fit_time = time.perf_counter() - start
+
+    print(f"reviews: {args.cards * args.reviews_per_card}, "
+          f"predicted: {num_predictions(histories)}")
+    print(f"load: {load_time:.2f}s, fit ({args.epochs} epochs): {fit_time:.2f}s")
+    print(f"log loss: default {log_loss(np.array(DEFAULT_W), histories)[0]:.4f}, "
+          f"fitted {log_loss(np.array(fitted), histories)[0]:.4f}, "
+          f"true {log_loss(np.array(TRUE_W), histories)[0]:.4f}")
+
+
+if __name__ == "__main__":
+    main()
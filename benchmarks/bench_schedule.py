@@ -0,0 +1,74 @@
+"""
+Finding today's due cards: the old full scan of deck.cards vs the due date index.
+
+Run from the repository root:
+    python -m benchmarks.bench_schedule
+"""
+from clnki.cardstore import to_day
+from clnki.deck import Deck
+from datetime import date, timedelta
+import argparse
+import random
+import time
+
+SIZES = [10_000, 100_000, 1_000_000]
+
+
+def scan_due(deck, today, cards_daily_limit):
+    """What schedule_daily did before the index."""
+    due_cards = []
+    today = to_day(today)
+    for card_id in deck.cards:
+        if len(due_cards) == cards_daily_limit:
+            break
+        if deck.cards[card_id].get("due_date") is None:
+            continue
+        if deck.cards[card_id].get("due_date") <= today:
+            due_cards.append(card_id)
+    return due_cards
+
+
+def random_deck(n, n_due, today, seed=0):
+    """n reviewed cards of which n_due are due, the rest due within a year."""
+    rng = random.Random(seed)
+    due_ids = set(rng.sample(range(n), n_due))
+    cards = {}
+    for i in range(n):
+        offset = -rng.randint(0, 30) if i in due_ids else rng.randint(1, 365)
+        cards[str(i)] = {"front": "", "back": "", "is_new": False,
+                         "due_date": today + timedelta(days=offset)}
+    return Deck(cards)
+
+
+def best_of(func, repeat=5):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="bench_schedule")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--due", type=int, default=20, help="Cards due today per deck.")
+    parser.add_argument("--limit", type=int, default=25)
+    args = parser.parse_args()
+
+    today = date.today()
+    print(f"{args.due} cards due, limit {args.limit}")
+    print(f"{'cards':>10} {'scan (ms)':>12} {'index (ms)':>12} {'speedup':>9}")
+    for n in args.sizes:
+        deck = random_deck(n, args.due, today)
+        assert sorted(scan_due(deck, today, args.limit)) == sorted(
+            deck.due_card_ids(today, args.limit))
+
+        scan_time = best_of(lambda: scan_due(deck, today, args.limit))
+        index_time = best_of(lambda: deck.due_card_ids(today, args.limit))
+        print(f"{n:>10} {scan_time * 1000:>12.2f} {index_time * 1000:>12.4f} "
+              f"{scan_time / index_time:>8.0f}x")
+
+
+if __name__ == "__main__":
+    main()
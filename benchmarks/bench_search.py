@@ -0,0 +1,83 @@
+"""
+Searching a 100k-card deck: the inverted index (Deck.search) vs a scan of every card.
+
+The cards' text is made of words drawn from a vocabulary of VOCABULARY words
+(Zipf-like, so some words are common and most are rare), plus an id, a number
+and a name on each card, so that the number of distinct tokens grows with the
+deck as in real decks (about 4 per card at 100k cards). Reported: the time
+to build the index on the first search, then the average time per query of
+the index and of a scan that tokenizes every card, over the same queries:
+one full word, one prefix, and two words.
+
+Run from the repository root:
+    python -m benchmarks.bench_search
+"""
+from clnki.deck import Deck
+from clnki.search import tokenize
+import argparse
+import itertools
+import random
+import time
+
+VOCABULARY = 20_000
+
+
+def make_deck(n, rng):
+    words = [f"w{i}x" for i in range(VOCABULARY)]
+    cum_weights = list(itertools.accumulate(1 / (i + 1) for i in range(VOCABULARY)))
+    names = [f"{rng.choice('bdgkmprstvz')}{i}ana" for i in range(n)]
+    cards = {}
+    for i in range(1, n + 1):
+        front = " ".join(rng.choices(words, cum_weights=cum_weights, k=rng.randint(3, 8)) +
+                         [f"id{i:06d}", str(rng.randrange(10 * n)), rng.choice(names)])
+        back = " ".join(rng.choices(words, cum_weights=cum_weights, k=rng.randint(3, 15)))
+        cards[str(i)] = {"front": front, "back": back, "is_new": True}
+    return Deck(cards), words
+
+
+def scan(deck, query):
+    words = tokenize(query)
+    return [card_id for card_id in deck.cards
+            if all(any(token.startswith(word) for token in
+                       tokenize(deck.cards[card_id]["front"]) | tokenize(deck.cards[card_id]["back"]))
+                   for word in words)]
+
+
+def time_queries(search, queries):
+    start = time.perf_counter()
+    for query in queries:
+        search(query)
+    return (time.perf_counter() - start) / len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="bench_search")
+    parser.add_argument("--cards", type=int, default=100_000)
+    parser.add_argument("--queries", type=int, default=20)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    deck, words = make_deck(args.cards, rng)
+    queries = []
+    for _ in range(args.queries):
+        word = rng.choice(words)
+        queries += [word, word[:3], f"{rng.choice(words[:100])} {word}"]
+
+    start = time.perf_counter()
+    deck.search_index
+    build = time.perf_counter() - start
+
+    for query in queries[:3]:
+        assert deck.search(query) == scan(deck, query)
+    indexed = time_queries(deck.search, queries)
+    scanned = time_queries(lambda query: scan(deck, query), queries[:3])
+
+    print(f"{args.cards} cards, {len(queries)} queries")
+    print(f"index build:  {build:8.2f} s, once")
+    print(f"index query:  {indexed * 1000:8.2f} ms")
+    print(f"scan query:   {scanned * 1000:8.2f} ms")
+    print(f"{scanned / indexed:.0f}x faster")
+
+
+if __name__ == "__main__":
+    main()
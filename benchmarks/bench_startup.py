@@ -0,0 +1,101 @@
+"""
+Startup: loading a collection with 1, 8 and 64 decks, from json shards with one
+process and with a pool, and from a binary snapshot.
+
+The same cards are split over more and more decks. Two things are timed:
+
+    home     what Home waits for, CollectionCache.load: with deck summaries
+             saved next to the decks, it reads only those and builds lazy Decks
+    all      loading every deck's cards and building its Deck, as when the
+             summaries are out of date (Storage.load_decks), from json shards
+             with max_workers=1 and with the default pool, and from SnapshotStorage
+
+The pool only pays off with several cores and enough shards to share. The
+snapshot decodes no card text.
+
+Run from the repository root:
+    python -m benchmarks.bench_startup
+"""
+from clnki.deck import Deck
+from clnki.storage import ShardedJsonStorage, SnapshotStorage, CollectionCache
+from datetime import date, timedelta
+import argparse
+import os
+import random
+import tempfile
+import time
+
+DECK_COUNTS = [1, 8, 64]
+
+
+def random_cards(n, today, rng):
+    cards = {}
+    for i in range(1, n + 1):
+        card = {"front": f"front of card {i} " + "x" * rng.randint(5, 40),
+                "back": f"back of card {i} " + "y" * rng.randint(5, 80),
+                "is_new": rng.random() < 0.2}
+        if not card["is_new"]:
+            card["stability"] = round(rng.uniform(0.5, 300), 4)
+            card["difficulty"] = round(rng.uniform(1, 10), 4)
+            card["last_review_date"] = today - timedelta(days=rng.randint(0, 100))
+            card["due_date"] = card["last_review_date"] + timedelta(days=rng.randint(1, 200))
+        cards[str(i)] = card
+    return cards
+
+
+def write_collection(data_dir, n_cards, n_decks, seed=0):
+    rng = random.Random(seed)
+    today = date.today()
+    per_deck = n_cards // n_decks
+    decks = {f"deck {i}": random_cards(per_deck, today, rng) for i in range(n_decks)}
+    ShardedJsonStorage(data_dir).save_decks(decks)
+
+
+def time_home(make_storage, repeat=3):
+    times = []
+    for _ in range(repeat):
+        cache = CollectionCache(make_storage())
+        start = time.perf_counter()
+        cache.load()
+        times.append(time.perf_counter() - start)
+        assert not any(deck.loaded for deck in cache.decks.values())
+    return min(times)
+
+
+def time_all(make_storage, repeat=3):
+    times = []
+    for _ in range(repeat):
+        storage = make_storage()
+        start = time.perf_counter()
+        decks = {deck_name: Deck(cards) for deck_name, cards in storage.load_decks().items()}
+        times.append(time.perf_counter() - start)
+        del decks
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="bench_startup")
+    parser.add_argument("--cards", type=int, default=256_000, help="Cards in the whole collection.")
+    parser.add_argument("--decks", type=int, nargs="+", default=DECK_COUNTS)
+    parser.add_argument("--workers", type=int, help="Pool size, os.cpu_count() by default.")
+    args = parser.parse_args()
+
+    print(f"{args.cards} cards, {args.workers or os.cpu_count()} workers")
+    print(f"{'':>6} {'home (s)':>19} {'all (s)':>37}")
+    print(f"{'decks':>6} {'json':>9} {'snapshot':>9} {'serial':>9} {'pool':>9} {'speedup':>8} "
+          f"{'snapshot':>9} {'speedup':>8}")
+    for n_decks in args.decks:
+        with tempfile.TemporaryDirectory() as tmp:
+            write_collection(tmp, args.cards, n_decks)
+            home = time_home(lambda: ShardedJsonStorage(tmp))
+            serial = time_all(lambda: ShardedJsonStorage(tmp, max_workers=1))
+            pooled = time_all(lambda: ShardedJsonStorage(tmp, max_workers=args.workers))
+            SnapshotStorage(tmp).save_decks(ShardedJsonStorage(tmp).load_decks())
+            home_mapped = time_home(lambda: SnapshotStorage(tmp))
+            mapped = time_all(lambda: SnapshotStorage(tmp))
+        print(f"{n_decks:>6} {home:>9.3f} {home_mapped:>9.3f} {serial:>9.2f} {pooled:>9.2f} "
+              f"{serial / pooled:>7.2f}x {mapped:>9.2f} {serial / mapped:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
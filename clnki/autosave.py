@@ -0,0 +1,97 @@
+"""
+Saving the collection from a background thread while the user reviews.
+
+Every change is appended to the journal (clnki.journal) on the UI thread,
+which only writes to a file buffer. The Autosaver thread makes those lines
+durable every SYNC_INTERVAL seconds, and saves a snapshot of the changed
+decks after SAVE_EVERY changes or once no change came for IDLE_SECONDS, which
+also empties the journal. The UI thread is never the one waiting on the disk,
+and a crash loses at most the last SYNC_INTERVAL seconds of reviews.
+"""
+import threading
+import time
+
+SAVE_EVERY = 50  # changes
+IDLE_SECONDS = 5.0
+SYNC_INTERVAL = 2.0
+
+
+class Autosaver:
+    def __init__(self, save, sync, every: int = SAVE_EVERY, idle: float = IDLE_SECONDS,
+                 sync_interval: float = SYNC_INTERVAL):
+        """
+        Args:
+            save: saves the changes made so far, called from the thread
+            sync: makes the journal durable, called from the thread
+            every: save after this many changes
+            idle: or once this many seconds passed since the last change
+            sync_interval: call sync this often (when not saving)
+        """
+        self._save = save
+        self._sync = sync
+        self.every = every
+        self.idle = idle
+        self.sync_interval = sync_interval
+        self._changes = 0  # since the last save
+        self._last_change = time.monotonic()
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._thread = None
+        # The exception of the last save or sync, if it failed, for the UI to show.
+        self.error = None
+
+    def start(self):
+        if self._thread is None:
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="autosave", daemon=True)
+            self._thread.start()
+
+    def notify(self, changes: int = 1):
+        """Count changes just made (and journaled). Never waits for a save."""
+        with self._cond:
+            self._changes += changes
+            self._last_change = time.monotonic()
+            if self._changes >= self.every:
+                self._cond.notify()
+
+    def stop(self):
+        """Stop the thread, once the save it is in the middle of (if any) is done."""
+        if self._thread is None:
+            return
+        with self._cond:
+            self._stopping = True
+            self._cond.notify()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        failed = False
+        while True:
+            with self._cond:
+                # Enough changes may have come during the last save, then there is no waiting.
+                if not self._stopping and (failed or self._changes < self.every):
+                    self._cond.wait(self.sync_interval)
+                if self._stopping:
+                    return
+                changes = self._changes
+                save = changes >= self.every or (
+                    changes and time.monotonic() - self._last_change >= self.idle)
+                if save:
+                    self._changes = 0
+            failed = False
+            try:
+                if save:
+                    self._save()
+                else:
+                    self._sync()
+            except Exception as e:  # any storage's errors: OSError, sqlite3.Error, ...
+                failed = True
+                self.error = e
+                # A failed save leaves its changes to the next one (see
+                # Clnki.save_changes). Try again after sync_interval, and if it
+                # keeps failing, on_quit saves on the UI thread, where it shows.
+                if save:
+                    with self._cond:
+                        self._changes += changes
+            else:
+                self.error = None
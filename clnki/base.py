@@ -91,7 +91,12 @@ class App:
         next_kwargs = {}
         while self.page is not None:
             try:
-                self.page.on_mount(**next_kwargs)
+                try:
+                    self.page.on_mount(**next_kwargs)
+                except Navigate as nav:
+                    # The page sends elsewhere before it is shown, e.g. to create a missing deck.
+                    self.page, next_kwargs = nav.next_page, nav.next_kwargs
+                    continue
                 clear_terminal()
                 self.page.render()
 
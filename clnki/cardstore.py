@@ -0,0 +1,354 @@
+"""
+Column storage for the cards of a deck.
+
+A card as a dict costs a dict plus a float, date or bool object per field,
+several hundred bytes before its text. CardStore keeps one typed array per
+scheduling field instead, indexed by a dense row number. Front and back stay
+Python strings in lists.
+
+Dates are day numbers, days since EPOCH, in memory and on disk, so loading and
+saving a card does no date parsing or formatting. to_day still reads dates and
+the ISO strings of files saved before.
+
+CardStore is a mapping card_id -> card, where a card is a CardView that reads
+and writes the arrays and behaves like the old card dict, so code written for
+dicts of dicts (the pages, Deck.review, the storages) keeps working.
+
+Card ids stay the strings they have always been, with a dict (rows) from id to
+row, rather than becoming the dense integers the columns use. They are the
+keys of every saved collection (decks.json, shards, snapshots, SQLite, the
+journal and the review log) and of the pages, so integer ids would change
+every format and call site. What costs, the per-card objects, is gone either
+way: code that walks many cards (scheduling, summaries, the snapshot writer)
+goes over the rows, and an id costs one dict lookup only where a single card is
+asked for by id.
+"""
+from array import array
+from collections import Counter
+from collections.abc import Mapping, MutableMapping
+from datetime import date
+import itertools
+import math
+
+FIELDS = ("front", "back", "is_new", "stability", "difficulty", "due_date",
+          "last_review_date", "priority")
+
+_FIELD_SET = frozenset(FIELDS)
+
+DATE_FIELDS = ("due_date", "last_review_date")
+
+EPOCH = date(1970, 1, 1)
+_EPOCH_ORDINAL = EPOCH.toordinal()
+
+# Day number of "no date" and priority of "no priority" in the columns.
+NO_DAY = -(1 << 31)
+NO_PRIORITY = -(1 << 63)
+
+
+def to_day(value):
+    """
+    The day number of value: a day number already, a datetime.date, or an ISO
+    date string as saved before day numbers. None and "" stay None.
+    """
+    if value is None or isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        if not value:
+            return None
+        value = date.fromisoformat(value)
+    return value.toordinal() - _EPOCH_ORDINAL
+
+
+def from_day(day: int) -> date:
+    return date.fromordinal(day + _EPOCH_ORDINAL)
+
+
+def encode_card(card):
+    """A json-ready dict of card, without touching card."""
+    encoded = dict(card)
+    for field in DATE_FIELDS:
+        if field in encoded and not isinstance(encoded[field], int):
+            encoded[field] = to_day(encoded[field])
+    return encoded
+
+
+def decode_card(card):
+    """Turn the dates of a card read from json into day numbers, in place."""
+    for field in DATE_FIELDS:
+        if isinstance(card.get(field), str):
+            card[field] = to_day(card[field])
+    return card
+
+
+def summarize(cards) -> dict:
+    """
+    What Home shows of a deck without loading it: {"total": cards, "new": new
+    cards, "due": [[day, cards due that day], ...] in order of day}.
+    """
+    if not isinstance(cards, CardStore):
+        cards = CardStore(cards)
+    due = Counter()
+    new = 0
+    for row in cards.rows.values():
+        new += cards.is_new[row]
+        if cards.due[row] != NO_DAY:
+            due[cards.due[row]] += 1
+    return {"total": len(cards), "new": new, "due": sorted(map(list, due.items()))}
+
+
+class CardView(Mapping):
+    """One card of a CardStore, read and written through like a dict."""
+
+    __slots__ = ("store", "row")
+
+    def __init__(self, store, row):
+        self.store = store
+        self.row = row
+
+    def __getitem__(self, field):
+        return self.store.get_field(self.row, field)
+
+    def __setitem__(self, field, value):
+        self.store.set_field(self.row, field, value)
+
+    def __iter__(self):
+        yield from (field for field in FIELDS if self.store.has_field(self.row, field))
+        yield from self.store.extra.get(self.row, ())
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return f"CardView({dict(self)!r})"
+
+
+class CardStore(MutableMapping):
+    """
+    card_id -> card, in insertion order, with the cards' fields in columns.
+
+    Rows are never reused: deleting a card leaves an empty row, which copy()
+    drops. Missing optional fields are stored as NaN (stability, difficulty),
+    NO_DAY (dates) or NO_PRIORITY. Fields not in FIELDS (say, tags from a file
+    edited by hand) are kept as they are in a dict per row, so that they are
+    saved back to json; the snapshot and SQLite storages have no place for them.
+    """
+
+    def __init__(self, cards=None):
+        """
+        Args:
+            cards: optional mapping card_id -> card dict to start with
+        """
+        self.ids = []  # row -> card_id, None for a deleted card
+        self.rows = {}  # card_id -> row
+        self.front = []
+        self.back = []
+        self.is_new = array('b')
+        self.stability = array('d')
+        self.difficulty = array('d')
+        self.due = array('i')  # day numbers
+        self.last_review = array('i')
+        self.priority = array('q')
+        self.extra = {}  # row -> {field: value} for fields not in FIELDS
+        if cards is not None:
+            for card_id, card in cards.items():
+                self[card_id] = card
+
+    # Mapping interface
+
+    def __getitem__(self, card_id):
+        return CardView(self, self.rows[card_id])
+
+    def __setitem__(self, card_id, card):
+        """Add or replace a card, given as any mapping of its fields."""
+        row = self.rows.get(card_id)
+        if row is None and isinstance(card, dict) and card.keys() <= _FIELD_SET:
+            self._append_dict(card_id, card)  # the common case when loading
+            return
+        if row is None:
+            row = self._append_row(card_id)
+        else:
+            if isinstance(card, CardView) and card.store is self and card.row == row:
+                return  # the card as it is
+            card = dict(card)  # read before the row is cleared, in case it reads the row
+            self._clear_row(row)
+        for field, value in card.items():
+            self.set_field(row, field, value)
+
+    def __delitem__(self, card_id):
+        row = self.rows.pop(card_id)
+        self.ids[row] = None
+        self.front[row] = self.back[row] = ""
+        self.extra.pop(row, None)
+
+    def __iter__(self):
+        return (card_id for card_id in self.ids if card_id is not None)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, card_id):
+        return card_id in self.rows
+
+    def page(self, start: int, stop: int) -> list:
+        """
+        card_id's of the cards start to stop (as in a slice) in insertion
+        order. Reads no column, only the ids: a slice of them while no card
+        was deleted, a walk up to stop otherwise.
+        """
+        if len(self.rows) == len(self.ids):
+            return self.ids[start:stop]
+        return list(itertools.islice(iter(self), start, stop))
+
+    def __repr__(self):
+        return f"CardStore({len(self)} cards)"
+
+    # Rows
+
+    def _append_row(self, card_id):
+        row = len(self.ids)
+        self.ids.append(card_id)
+        self.rows[card_id] = row
+        self.front.append("")
+        self.back.append("")
+        self.is_new.append(1)
+        self.stability.append(math.nan)
+        self.difficulty.append(math.nan)
+        self.due.append(NO_DAY)
+        self.last_review.append(NO_DAY)
+        self.priority.append(NO_PRIORITY)
+        return row
+
+    def _append_dict(self, card_id, card):
+        self.rows[card_id] = len(self.ids)
+        self.ids.append(card_id)
+        self.front.append(card.get("front", ""))
+        self.back.append(card.get("back", ""))
+        self.is_new.append(bool(card.get("is_new", True)))
+        stability = card.get("stability")
+        self.stability.append(math.nan if stability is None else stability)
+        difficulty = card.get("difficulty")
+        self.difficulty.append(math.nan if difficulty is None else difficulty)
+        due = to_day(card.get("due_date"))
+        self.due.append(NO_DAY if due is None else due)
+        last_review = to_day(card.get("last_review_date"))
+        self.last_review.append(NO_DAY if last_review is None else last_review)
+        priority = card.get("priority")
+        self.priority.append(NO_PRIORITY if priority is None else priority)
+
+    def extend_new(self, card_ids, fronts, backs):
+        """
+        Append new cards, given as parallel sequences, in one go per column.
+        The card_id's must not be in the store yet.
+        """
+        n = len(card_ids)
+        start = len(self.ids)
+        self.ids.extend(card_ids)
+        self.rows.update(zip(card_ids, range(start, start + n)))
+        self.front.extend(fronts)
+        self.back.extend(backs)
+        self.is_new.extend(array('b', [1]) * n)
+        self.stability.extend(array('d', [math.nan]) * n)
+        self.difficulty.extend(array('d', [math.nan]) * n)
+        self.due.extend(array('i', [NO_DAY]) * n)
+        self.last_review.extend(array('i', [NO_DAY]) * n)
+        self.priority.extend(array('q', [NO_PRIORITY]) * n)
+
+    def iter_dicts(self):
+        """
+        (card_id, card dict) for every card, built straight from the columns
+        with dates as day numbers, ready for json.
+        """
+        for card_id, row in self.rows.items():
+            card = {"front": self.front[row], "back": self.back[row],
+                    "is_new": bool(self.is_new[row])}
+            if (stability := self.stability[row]) == stability:  # not NaN
+                card["stability"] = stability
+            if (difficulty := self.difficulty[row]) == difficulty:
+                card["difficulty"] = difficulty
+            if (due := self.due[row]) != NO_DAY:
+                card["due_date"] = due
+            if (last_review := self.last_review[row]) != NO_DAY:
+                card["last_review_date"] = last_review
+            if (priority := self.priority[row]) != NO_PRIORITY:
+                card["priority"] = priority
+            if row in self.extra:
+                card.update(self.extra[row])
+            yield card_id, card
+
+    def _clear_row(self, row):
+        self.front[row] = self.back[row] = ""
+        self.is_new[row] = 1
+        self.stability[row] = self.difficulty[row] = math.nan
+        self.due[row] = self.last_review[row] = NO_DAY
+        self.priority[row] = NO_PRIORITY
+        self.extra.pop(row, None)
+
+    def has_field(self, row, field):
+        if field in ("front", "back", "is_new"):
+            return True
+        if field in ("stability", "difficulty"):
+            return not math.isnan(getattr(self, field)[row])
+        if field == "due_date":
+            return self.due[row] != NO_DAY
+        if field == "last_review_date":
+            return self.last_review[row] != NO_DAY
+        if field == "priority":
+            return self.priority[row] != NO_PRIORITY
+        return field in self.extra.get(row, ())
+
+    def get_field(self, row, field):
+        if not self.has_field(row, field):
+            raise KeyError(field)
+        if field == "front":
+            return self.front[row]
+        if field == "back":
+            return self.back[row]
+        if field == "is_new":
+            return bool(self.is_new[row])
+        if field == "due_date":
+            return self.due[row]
+        if field == "last_review_date":
+            return self.last_review[row]
+        if field not in _FIELD_SET:
+            return self.extra[row][field]
+        return getattr(self, field)[row]
+
+    def set_field(self, row, field, value):
+        if field == "front":
+            self.front[row] = value
+        elif field == "back":
+            self.back[row] = value
+        elif field == "is_new":
+            self.is_new[row] = bool(value)
+        elif field in ("stability", "difficulty"):
+            getattr(self, field)[row] = math.nan if value is None else value
+        elif field == "due_date":
+            day = to_day(value)
+            self.due[row] = NO_DAY if day is None else day
+        elif field == "last_review_date":
+            day = to_day(value)
+            self.last_review[row] = NO_DAY if day is None else day
+        elif field == "priority":
+            self.priority[row] = NO_PRIORITY if value is None else value
+        else:
+            self.extra.setdefault(row, {})[field] = value
+
+    def copy(self):
+        """An independent copy, made by copying the columns (without deleted rows)."""
+        if len(self.rows) < len(self.ids):
+            return CardStore(self)
+        store = CardStore()
+        store.ids = self.ids.copy()
+        store.rows = self.rows.copy()
+        store.front = self.front.copy()
+        store.back = self.back.copy()
+        for column in ("is_new", "stability", "difficulty", "due", "last_review", "priority"):
+            setattr(store, column, array(getattr(self, column).typecode, getattr(self, column)))
+        store.extra = {row: fields.copy() for row, fields in self.extra.items()}
+        return store
+
+    def nbytes(self):
+        """Bytes of the typed columns, the text and the ids not included."""
+        return sum(len(column) * column.itemsize
+                   for column in (self.is_new, self.stability, self.difficulty, self.due,
+                                  self.last_review, self.priority))
@@ -1,68 +1,496 @@
-from clnki.fsrs import fsrs, fsrs_init
-from datetime import date, timedelta, datetime
+from clnki.cardstore import CardStore, NO_DAY, NO_PRIORITY, to_day
+from clnki.duplicates import DuplicateIndex, card_key
+from clnki.search import SearchIndex
+from clnki.fsrs import FSRSModel
+from datetime import date
+import bisect
+import heapq
+import itertools
 import math
+import random
 
+# Orders new cards can be learned in, see NewCardQueue.
+NEW_CARD_ORDERS = ("insertion", "random", "priority")
+
+# Interval fuzz as in Anki: (start, end, factor). An interval of ivl days may move
+# by 1 day plus factor * (the part of ivl between start and end) for every range.
+FUZZ_RANGES = [(2.5, 7.0, 0.15), (7.0, 20.0, 0.1), (20.0, math.inf, 0.05)]
+
+
+def fuzz_range(interval):
+    """The (shortest, longest) interval in days a card may be given instead of interval."""
+    if interval < 2.5:
+        return interval, interval
+    delta = 1.0 + sum(factor * max(min(interval, end) - start, 0.0)
+                      for start, end, factor in FUZZ_RANGES)
+    return max(round(interval - delta), 2), round(interval + delta)
+
+
+class NewCardQueue:
+    """
+    The new cards of a deck in the order they should be learned.
+
+    "insertion" keeps the order cards were added in, in a dict used as an ordered
+    set. "random" and "priority" (card["priority"], lowest first, then insertion
+    order) keep a heap instead, where removed cards are skipped lazily. Either
+    way, taking the next k cards costs O(k) (O(k log n) for the heap) instead of
+    a scan over the deck.
+    """
+
+    def __init__(self, order="insertion"):
+        if order not in NEW_CARD_ORDERS:
+            raise ValueError(f"Unknown new card order {order!r}.")
+        self.order = order
+        self._cards = {}  # card_id -> heap entry (or None for "insertion")
+        self._heap = []
+        self._counter = itertools.count()  # keeps heap entries unique and stable
+
+    def __len__(self):
+        return len(self._cards)
+
+    def __contains__(self, card_id):
+        return card_id in self._cards
+
+    def add(self, card_id, priority=0):
+        if self.order == "insertion":
+            self._cards[card_id] = None
+            return
+
+        key = random.random() if self.order == "random" else priority
+        entry = (key, next(self._counter), card_id)
+        self._cards[card_id] = entry
+        heapq.heappush(self._heap, entry)
+
+    def extend(self, card_ids, priority=0):
+        """add() for many cards with the same priority."""
+        if self.order == "insertion":
+            self._cards.update(dict.fromkeys(card_ids))
+            return
+        for card_id in card_ids:
+            self.add(card_id, priority)
+
+    def remove(self, card_id):
+        if self._cards.pop(card_id, None) is not None and len(self._heap) > 2 * len(self._cards):
+            # Too many removed entries left in the heap, drop them.
+            self._heap = list(self._cards.values())
+            heapq.heapify(self._heap)
+
+    def first(self, k, exclude=()):
+        """The next k card_id's to learn, skipping those in exclude."""
+        if self.order == "insertion":
+            return list(itertools.islice(
+                (card_id for card_id in self._cards if card_id not in exclude), k))
+
+        taken = []
+        popped = []
+        while len(taken) < k and self._heap:
+            entry = heapq.heappop(self._heap)
+            if self._cards.get(entry[2]) is not entry:
+                continue  # removed from the queue
+            popped.append(entry)
+            if entry[2] not in exclude:
+                taken.append(entry[2])
+        for entry in popped:
+            heapq.heappush(self._heap, entry)
+        return taken
 
-# No Card class for now so that json.dump is simple.
 
 class Deck:
-    def __init__(self, cards_dict):
-        self.cards = cards_dict
-        self.due_cards = None  # a list of due card_id's
-        self.num_due = 0
-    
-    def update_due(self, cards_list):
-        self.due_cards = cards_list
-        self.num_due = len(cards_list)
-    
-    def review(self, card_id, grade, settings):
-        """Update FSRS-related attributes of a card and pop it out of due."""
+    def __init__(self, cards=None, new_order="insertion", summary=None, loader=None):
+        """
+        Args:
+            cards: a CardStore, or a dict card_id -> card dict to fill one with
+            summary: instead of cards, for a deck loaded only when its cards are
+                     first needed: the deck's clnki.cardstore.summarize
+            loader: with summary, a function returning the deck's cards
+        """
+        self.summary = summary
+        self._loader = loader
+        self._cards = None
+        self.new_queue = NewCardQueue(new_order)
+        # Today's queues, see schedule()
+        self.due_reviews = []  # card_id's of due cards
+        self.due_new = []  # card_id's of new cards to learn today
+        self._today = None
+        self._reviews_done = 0  # reviews and new cards done on self._today
+        self._new_done = 0
+        # What each queue was last computed from. A queue is only recomputed when
+        # its key changes or the cards changed under it (the *_stale flags).
+        self._reviews_key = None
+        self._new_per_day = None
+        self._reviews_stale = True
+        self._new_stale = True
+        # Size of today's queues of a deck not loaded yet, from its summary.
+        self._summary_due = 0
+        # Reviews not yet written to the review log file, see Clnki.save_changes.
+        self.review_log = []
+        # Whether cards changed since the deck was last handed to the storage.
+        self.dirty = False
+        # card_key -> card_id's, built on first use, see duplicates.
+        self._duplicates = None
+        # Called with (key, added) for every card added or removed, see CollectionDuplicates.
+        self.key_listener = None
+        # Words of the cards' text -> card_id's, built on the first search.
+        self._search_index = None
+        if loader is None:
+            self._build(CardStore() if cards is None else cards)
+
+    @property
+    def loaded(self):
+        return self._cards is not None
+
+    @property
+    def cards(self):
+        if self._cards is None:
+            self.load()
+        return self._cards
+
+    def load(self):
+        """Load the cards of a deck made from a summary, if not loaded yet."""
+        if self._cards is not None:
+            return
+        self._build(self._loader())
+        self._loader = None
+        self.summary = None
+        self._reviews_stale = self._new_stale = True
+
+    @property
+    def total(self):
+        """Number of cards, without loading them."""
+        return self.summary["total"] if self._cards is None else len(self._cards)
+
+    def _build(self, cards):
+        self._cards = cards if isinstance(cards, CardStore) else CardStore(cards)
+        store = self._cards
+        for card_id, row in store.rows.items():
+            if store.is_new[row]:
+                priority = store.priority[row]
+                self.new_queue.add(card_id, 0 if priority == NO_PRIORITY else priority)
+        # card_id's are "1", "2", ... in order of creation
+        self._next_id = max((int(card_id) for card_id in store if card_id.isdigit()),
+                            default=0) + 1
+
+        # Due date index: card_id's bucketed by due day, plus the sorted list of
+        # days that have a bucket. Finding today's cards then only touches the
+        # buckets up to today instead of every card. Days are day numbers as in
+        # the CardStore (see clnki.cardstore.to_day).
+        self._due_buckets = {}  # day -> {card_id: None}, a dict as an ordered set
+        self._due_days = []
+        for card_id, row in store.rows.items():
+            if store.due[row] != NO_DAY:
+                self._index_due(card_id, store.due[row])
+
+    def _index_due(self, card_id, due_day):
+        bucket = self._due_buckets.get(due_day)
+        if bucket is None:
+            bucket = self._due_buckets[due_day] = {}
+            bisect.insort(self._due_days, due_day)
+        bucket[card_id] = None
+
+    def _unindex_due(self, card_id, due_day):
+        bucket = self._due_buckets[due_day]
+        del bucket[card_id]
+        if not bucket:
+            del self._due_buckets[due_day]
+            del self._due_days[bisect.bisect_left(self._due_days, due_day)]
+
+    def iter_due(self, today: date):
+        """card_id's of the reviewed cards due on or before today, most overdue first."""
+        today_day = to_day(today)
+        for due_day in self._due_days[:bisect.bisect_right(self._due_days, today_day)]:
+            yield from self._due_buckets[due_day]
+
+    def due_card_ids(self, today: date, limit=None):
+        """
+        The first `limit` card_id's of iter_due(today).
+
+        Costs O(log(number of due days) + number of cards returned).
+        """
+        due_ids = []
+        for card_id in self.iter_due(today):
+            if len(due_ids) == limit:
+                break
+            due_ids.append(card_id)
+        return due_ids
+
+    def least_retrievable_ids(self, today: date, limit, model: FSRSModel):
+        """
+        The `limit` due cards most likely to be forgotten by now, lowest R first.
+
+        heapq.nsmallest keeps a heap of only `limit` cards, so this costs
+        O(n log limit) for n due cards instead of sorting all of them.
+        """
+        store = self.cards
+        today_day = to_day(today)
+
+        def retrievability(card_id):
+            row = store.rows[card_id]
+            return model.forgetting_curve(today_day - store.last_review[row],
+                                          store.stability[row])
+
+        return heapq.nsmallest(limit, self.iter_due(today), key=retrievability)
+
+    @property
+    def due_cards(self):
+        """card_id's to review today, due cards then new cards."""
+        return self.due_reviews + self.due_new
+
+    @property
+    def num_due(self):
+        if self._cards is None:
+            return self._summary_due
+        return len(self.due_reviews) + len(self.due_new)
+
+    def schedule(self, today: date, cards_daily_limit: int, new_cards_per_day: int,
+                 model: FSRSModel | None = None, due_order: str = "due_date",
+                 new_order: str = "insertion"):
+        """
+        Bring today's queues up to date, recomputing only what changed.
+
+        A new day recomputes both queues. Otherwise the review queue is only
+        recomputed when the limit or order (or the model, for the retrievability
+        order) changed, and new_cards_per_day only grows or shrinks the new queue.
+        Changing new_order reorders the deck's NewCardQueue first.
+
+        A deck not loaded yet only counts its queues from its summary.
+
+        Returns: whether anything was recomputed
+        """
+        if self._cards is None:
+            today_day = to_day(today)
+            due = sum(count for day, count in self.summary["due"] if day <= today_day)
+            summary_due = (min(due, cards_daily_limit)
+                           + min(self.summary["new"], new_cards_per_day))
+            changed = self._today != today or self._summary_due != summary_due
+            self._today = today
+            self._summary_due = summary_due
+            return changed
+
+        if today != self._today:
+            self._today = today
+            self._reviews_done = self._new_done = 0
+            self._reviews_stale = self._new_stale = True
+
+        self.set_new_order(new_order)
+
+        changed = False
+        reviews_key = (cards_daily_limit, due_order,
+                       model if due_order == "retrievability" else None)
+        if self._reviews_stale or reviews_key != self._reviews_key:
+            limit = max(cards_daily_limit - self._reviews_done, 0)
+            if due_order == "retrievability":
+                self.due_reviews = self.least_retrievable_ids(today, limit, model)
+            else:
+                self.due_reviews = self.due_card_ids(today, limit)
+            self._reviews_key = reviews_key
+            self._reviews_stale = False
+            changed = True
+
+        if self._new_stale or new_cards_per_day != self._new_per_day:
+            target = max(new_cards_per_day - self._new_done, 0)
+            if self._new_stale:
+                self.due_new = self._pick_new(target)
+            elif target < len(self.due_new):
+                del self.due_new[target:]
+            else:
+                self.due_new += self._pick_new(target - len(self.due_new), set(self.due_new))
+            self._new_per_day = new_cards_per_day
+            self._new_stale = False
+            changed = True
+
+        return changed
+
+    def set_new_order(self, order):
+        """Reorder the new card queue. Costs one pass over the new cards."""
+        if order == self.new_queue.order:
+            return
+        queue = NewCardQueue(order)
+        for card_id in self.new_queue.first(len(self.new_queue)):
+            queue.add(card_id, self.cards[card_id].get("priority", 0))
+        self.new_queue = queue
+        self._new_stale = True
+
+    def _pick_new(self, count, exclude=()):
+        return self.new_queue.first(count, exclude)
+
+    def add_card(self, front, back, priority=None):
+        """Add a new card and return its card_id."""
+        card_id = str(self._next_id)
+        self._next_id += 1
+        card = {"front": front, "back": back, "is_new": True}
+        if priority is not None:
+            card["priority"] = priority
+        self.cards[card_id] = card
+        self.new_queue.add(card_id, priority or 0)
+        if self._duplicates is not None or self.key_listener is not None:
+            self._key_added(card_key(front, back), card_id)
+        if self._search_index is not None:
+            self._search_index.add(card_id, front, back)
+        self.dirty = True
+        # Today's new queue may now be short of new_cards_per_day. Forgetting the
+        # value makes the next schedule() top it up without reordering it.
+        self._new_per_day = None
+        return card_id
+
+    def add_cards(self, cards, keys=None):
+        """
+        Add new cards in one batch, cards being (front, back) pairs.
+
+        Args:
+            keys: their card_key's, if already computed
+
+        Returns: the new card_id's, in order
+        """
+        fronts, backs = zip(*cards) if cards else ((), ())
+        card_ids = [str(i) for i in range(self._next_id, self._next_id + len(fronts))]
+        self._next_id += len(card_ids)
+        self.cards.extend_new(card_ids, fronts, backs)
+        self.new_queue.extend(card_ids)
+        if self._duplicates is not None or self.key_listener is not None:
+            if keys is None:
+                keys = [card_key(front, back) for front, back in zip(fronts, backs)]
+            for key, card_id in zip(keys, card_ids):
+                self._key_added(key, card_id)
+        if self._search_index is not None:
+            self._search_index.add_many(zip(card_ids, fronts, backs))
+        self.dirty = True
+        self._new_per_day = None  # as in add_card
+        return card_ids
+
+    @property
+    def duplicates(self) -> DuplicateIndex:
+        """The deck's cards by card_key, kept up to date once built."""
+        if self._duplicates is None:
+            self._duplicates = DuplicateIndex()
+            for card_id in self.cards:
+                self._duplicates.add(self.card_key(card_id), card_id)
+        return self._duplicates
+
+    @property
+    def search_index(self) -> SearchIndex:
+        """The deck's cards by the words of their text, kept up to date once built."""
+        if self._search_index is None:
+            self._search_index = SearchIndex()
+            self._search_index.add_many((card_id, self.cards[card_id]["front"], self.cards[card_id]["back"])
+                                        for card_id in self.cards)
+        return self._search_index
+
+    def search(self, query):
+        """card_id's of the cards with every word of query (as a prefix), in deck order."""
+        rows = self.cards.rows
+        return sorted(self.search_index.search(query), key=rows.__getitem__)
+
+    def card_key(self, card_id):
+        card = self.cards[card_id]
+        return card_key(card["front"], card["back"])
+
+    def _key_added(self, key, card_id):
+        if self._duplicates is not None:
+            self._duplicates.add(key, card_id)
+        if self.key_listener is not None:
+            self.key_listener(key, True)
+
+    def _key_removed(self, key, card_id):
+        if self._duplicates is not None:
+            self._duplicates.remove(key, card_id)
+        if self.key_listener is not None:
+            self.key_listener(key, False)
+
+    def remove_card(self, card_id):
+        """Delete a card, from the deck and from today's queues."""
+        card = self.cards[card_id]
+        key = card_key(card["front"], card["back"])
+        if self._search_index is not None:
+            self._search_index.remove(card_id, card["front"], card["back"])
+        if card.get("due_date") is not None:
+            self._unindex_due(card_id, card["due_date"])
+        self.new_queue.remove(card_id)
+        del self.cards[card_id]
+        for queue in (self.due_reviews, self.due_new):
+            if card_id in queue:
+                queue.remove(card_id)
+        self._key_removed(key, card_id)
+        self.dirty = True
+
+    def set_text(self, card_id, front, back):
+        """Change a card's front and back, keeping its schedule."""
+        card = self.cards[card_id]
+        self._key_removed(card_key(card["front"], card["back"]), card_id)
+        if self._search_index is not None:
+            self._search_index.remove(card_id, card["front"], card["back"])
+            self._search_index.add(card_id, front, back)
+        card["front"] = front
+        card["back"] = back
+        self._key_added(card_key(front, back), card_id)
+        self.dirty = True
+
+    def balanced_due_day(self, today_day: int, interval: int):
+        """
+        The least busy day (a day number) within the fuzz range of interval.
+
+        The due date index doubles as the histogram of cards due per day, and it
+        is kept up to date by every review, so this only looks at the days in
+        the window. Ties go to the day closest to interval.
+        """
+        shortest, longest = fuzz_range(interval)
+        return min(range(today_day + shortest, today_day + longest + 1),
+                   key=lambda day: (len(self._due_buckets.get(day, ())),
+                                    abs(day - today_day - interval)))
+
+    def review(self, card_id, grade, model: FSRSModel, today: date, recalled=None,
+               load_balance=False):
+        """
+        Update FSRS-related attributes of a card and pop it out of due.
+
+        Args:
+            recalled: Whether the card was remembered when first shown in the session.
+                      A card answered Again is only passed later with a higher grade,
+                      so the grade alone does not say. Defaults to grade > 1.
+            load_balance: Move the due date to the least busy nearby day to avoid
+                          spikes of cards learned on the same day.
+        """
         # TODO: Check if card_id exists.
 
         card = self.cards[card_id]
+        today_day = to_day(today)
+        if recalled is None:
+            recalled = grade > 1
 
         if card.get("last_review_date") is None:
-            next_s, next_d, next_interv = fsrs_init(grade, 
-                                              settings["fsrs_desired_R"],
-                                              settings["fsrs"])
+            elapsed_days = None
+            next_s, next_d, next_interv = model.init(grade)
         else:
+            elapsed_days = today_day - card["last_review_date"]
             next_s, next_d, next_interv = \
-                fsrs((date.today() - card["last_review_date"]).days,
-                        grade,
-                        card["stability"],
-                        card["difficulty"],
-                        settings["fsrs_desired_R"],
-                        settings["fsrs"])
+                model.review(elapsed_days,
+                             grade,
+                             card["stability"],
+                             card["difficulty"])
+
+        # One entry per review with the card's state before it, for clnki.optimizer.
+        self.review_log.append([card_id, today.isoformat(), elapsed_days, grade, recalled,
+                                card.get("stability"), card.get("difficulty")])
     
+        if card.get("due_date") is not None:
+            self._unindex_due(card_id, card["due_date"])
+
         card["stability"] = next_s
         card["difficulty"] = next_d
         # TODO: Isn't next_interv int already?
-        card["due_date"] = date.today() + timedelta(days=math.ceil(next_interv))
+        if load_balance:
+            card["due_date"] = self.balanced_due_day(today_day, math.ceil(next_interv))
+        else:
+            card["due_date"] = today_day + math.ceil(next_interv)
+        self._index_due(card_id, card["due_date"])
         # TODO: This should be constantly updated, not just at Home.
-        card["last_review_date"] = date.today()
+        card["last_review_date"] = today_day
         card["is_new"] = False
+        self.new_queue.remove(card_id)
+        self.dirty = True
 
-        self.due_cards.remove(card_id)
-        self.num_due -= 1
-
-def from_json_date_handling(decks_dict):
-    for _, cards in decks_dict.items():
-        for card_id in cards:
-            if (due_date := cards[card_id].get("due_date")):
-                cards[card_id]["due_date"] = datetime.strptime(
-                    due_date, "%Y-%m-%d").date()
-            
-            if (due_date := cards[card_id].get("last_review_date")):
-                cards[card_id]["last_review_date"] = datetime.strptime(
-                    due_date, "%Y-%m-%d").date()
-
-def to_json_date_handling(decks_dict):
-    for _, cards in decks_dict.items():
-        for card_id in cards:
-            if (due_date := cards[card_id].get("due_date")):
-                cards[card_id]["due_date"] = due_date.isoformat()
-            
-            if (last_review_date := cards[card_id].get("last_review_date")):
-                cards[card_id]["last_review_date"] = last_review_date.isoformat()
-
-
+        if card_id in self.due_new:
+            self.due_new.remove(card_id)
+            self._new_done += 1
+        elif card_id in self.due_reviews:
+            self.due_reviews.remove(card_id)
+            self._reviews_done += 1
@@ -1,10 +1,11 @@
 from clnki.base import Page, App, Navigate
-from clnki.schedule import schedule_daily
 from clnki.deck import Deck
+from clnki.duplicates import card_key
+from clnki.exporter import export, format_for
+from clnki.importer import import_file
 import argparse
+import csv
 import shlex
-import json
-from datetime import date, timedelta
 import time
 import random
 
@@ -13,15 +14,27 @@ class DeckPage(Page):
     __parser = argparse.ArgumentParser(prog="Deck", exit_on_error=False)
     __parser.add_argument("-r", "--review", action="store_true")
     __parser.add_argument("-b", "--browse", action="store_true")
+    __parser.add_argument("-x", "--export", type=str)
+    __parser.add_argument("-F", "--find", type=str, nargs="+")
+
+    # Matches of a search listed on the page, the rest are only counted.
+    SEARCH_LIMIT = 20
 
     def __init__(self, app: App):
         super().__init__(app)
     
-    def on_mount(self, deck_name):
+    def on_mount(self, deck_name, query=None):
         if self.app.decks.get(deck_name):
             self.deck = deck_name
+            current_deck = self.app.open_deck(deck_name)
         else:
             raise Navigate(self.app.pages["new_deck"], deck_name=deck_name)
+
+        self.query = query
+        if query:
+            start = time.perf_counter()
+            self.matches = current_deck.search(query)
+            self.search_ms = (time.perf_counter() - start) * 1000
     
     def render(self):
         current_deck = self.app.decks.get(self.deck)
@@ -31,9 +44,25 @@ Dued today: {current_deck.num_due}
 """ 
         deck_options_msg = """Options:
       -r, --review: Review dued cards.
-      -b, --browse: Browse cards arranged by card_id (order at creation).
+      -b, --browse: Browse cards page by page, arranged by card_id (order at creation).
+      -x deck.tsv, --export deck.tsv: Export the cards as Anki-style TSV, or as JSONL
+                                      for a .jsonl file. Gzipped if the name ends with .gz.
+      -F capital fra, --find capital fra: List the cards with words starting with
+                                          "capital" and "fra" in their front or back.
   """
-        print(deck_msg + deck_options_msg)
+        print(deck_msg + self.search_msg() + deck_options_msg)
+
+    def search_msg(self):
+        if not self.query:
+            return ""
+        cards = self.app.decks.get(self.deck).cards
+        lines = [f"Search \"{self.query}\": {len(self.matches)} cards ({self.search_ms:.1f} ms)"]
+        for card_id in self.matches[:self.SEARCH_LIMIT]:
+            front = cards[card_id]["front"].split("\n", 1)[0]
+            lines.append(f"  Card {card_id}: {front[:60]}")
+        if len(self.matches) > self.SEARCH_LIMIT:
+            lines.append(f"  ... and {len(self.matches) - self.SEARCH_LIMIT} more")
+        return "\n".join(lines) + "\n\n"
 
     def next_page(self):
         user_input = input("\n> ")
@@ -44,6 +73,22 @@ Dued today: {current_deck.num_due}
   
         if args.browse:
             return self.app.pages.get("browse_deck"), {"deck_name": self.deck}
+
+        if args.find:
+            return self.app.pages.get("deck"), {"deck_name": self.deck,
+                                                "query": " ".join(args.find)}
+
+        if args.export:
+            current_deck = self.app.decks.get(self.deck)
+            try:
+                count = export([(self.deck, current_deck.cards)], args.export,
+                               format_for(args.export), with_deck=False)
+            except OSError as e:
+                print(f"Export failed: {e}")
+            else:
+                print(f"Exported {count} cards to {args.export}.")
+            time.sleep(2)
+            return self.app.pages.get("deck"), {"deck_name": self.deck}
   
         print("Invalid input.")
         time.sleep(2)
@@ -64,26 +109,71 @@ Dued today: {current_deck.num_due}
         
 
 class BrowseDeckPage(Page):
+
+    __parser = argparse.ArgumentParser(prog="Browse", exit_on_error=False)
+    __parser.add_argument("-n", "--next", action="store_true")
+    __parser.add_argument("-p", "--previous", action="store_true")
+    __parser.add_argument("-j", "--jump", type=int)
+
+    # Cards shown per page; only these are read from the deck.
+    PAGE_SIZE = 10
+
     def __init__(self, app: App):
         super().__init__(app)
     
-    def on_mount(self, deck_name):
+    def on_mount(self, deck_name, page=1):
         self.deck = deck_name
+        current_deck = self.app.open_deck(deck_name)
+        self.num_pages = max(1, -(-len(current_deck.cards) // self.PAGE_SIZE))
+        self.page = min(max(page, 1), self.num_pages)
     
     def render(self):
-        current_deck = self.app.decks.get(self.deck)
-        for card_id in current_deck.cards:
+        cards = self.app.decks.get(self.deck).cards
+        start = (self.page - 1) * self.PAGE_SIZE
+        card_ids = cards.page(start, start + self.PAGE_SIZE)
+        for card_id in card_ids:
+            card = cards[card_id]
             print(f"Card {card_id}" + "\n" + "Front:")
-            print(current_deck.cards[card_id]["front"])
-            print("Back:" + "\n" + current_deck.cards[card_id]["back"] + "\n")
+            print(card["front"])
+            print("Back:" + "\n" + card["back"] + "\n")
+        shown = f"cards {start + 1}-{start + len(card_ids)}" if card_ids else "no cards"
+        print(f"Page {self.page}/{self.num_pages}, {shown} of {len(cards)}")
+        print("""Options:
+      -n, --next: Next page.
+      -p, --previous: Previous page.
+      -j 5, --jump 5: Go to page 5.
+      Anything else returns to the deck.""")
 
     def next_page(self):
-        print("Press anything to return: ")
         user_input = input("\n> ")
-        self.argparser(user_input.strip())
-        
+        args = self.argparser(user_input.strip())
+
+        page = None
+        if args is not None:
+            if args.next:
+                page = self.page + 1
+            elif args.previous:
+                page = self.page - 1
+            elif args.jump is not None:
+                page = args.jump
+        if page is not None:
+            return self.app.pages["browse_deck"], {"deck_name": self.deck, "page": page}
+
         return self.app.pages["deck"], {"deck_name": self.deck}
 
+    @Page.global_parser
+    def argparser(self, raw_input: str):
+        if raw_input is None:
+            raw_input = ""
+        input_as_shell = shlex.split(raw_input)
+
+        try: 
+            args = self.__parser.parse_known_args(input_as_shell)[0]
+        except argparse.ArgumentError:
+            args = None
+
+        return args
+
 
 class CardReviewPage(Page):
     def __init__(self, app: App):
@@ -92,6 +182,7 @@ class CardReviewPage(Page):
     # TODO: Accept card_id as well so that terminal can be cleared.
     def on_mount(self, deck_name: str):
         self.deck = deck_name
+        self.app.open_deck(deck_name)
         self.init_session()  # TODO: Remove this.
     
     def render(self):
@@ -111,6 +202,7 @@ class CardReviewPage(Page):
     def init_session(self):
         current_deck = self.app.decks.get(self.deck)
         self.session = {}
+        self.lapsed = set()  # cards answered Again at least once in this session
         for card_id in current_deck.due_cards:
             self.session[card_id] = current_deck.cards[card_id]["is_new"]
 
@@ -156,6 +248,7 @@ class CardReviewPage(Page):
             # Card is considered "new" (True) inside session, requiring at least Easy to pass,
             # if the user presses Again for it.
             self.session[card_id] = True 
+            self.lapsed.add(card_id)
         
         # TODO: This simplistic pass condition should be replaced with something later.
         # Anki has "learning"/"relearning" steps.
@@ -164,7 +257,12 @@ class CardReviewPage(Page):
         pass_if_old = (not self.session[card_id]) and (session_grade > 1)
 
         if pass_if_new or pass_if_old:
-            current_deck.review(card_id, session_grade, self.app.settings)
+            # In memory and the journal's buffer only, the autosave thread does the disk.
+            with self.app.lock:
+                current_deck.review(card_id, session_grade, self.app.model, self.app.today,
+                                    recalled=card_id not in self.lapsed,
+                                    load_balance=self.app.settings.get("load_balance", True))
+                self.app.journal_cards(self.deck, [card_id])
 
             self.session.pop(card_id) 
 
@@ -174,6 +272,7 @@ class NewDeckPage(Page):
     __parser = argparse.ArgumentParser(prog="Add_deck", exit_on_error=False)
     __parser.add_argument("-e", "--exit", action="store_true")
     __parser.add_argument("-f", "--finish", action="store_true")
+    __parser.add_argument("-i", "--import", dest="import_path", type=str)
 
     def __init__(self, app: App):
         super().__init__(app)
@@ -186,14 +285,14 @@ class NewDeckPage(Page):
         print("Please add all the cards in this session. Decks currently cannot be edited.")
         print("""Options:
       -e, --exit: Abort
-      -f, --finish: Finish deck creation, discarding the current card.""")
+      -f, --finish: Finish deck creation, discarding the current card.
+      -i notes.txt, --import notes.txt: Add the cards of an Anki text export and finish.""")
 
     def next_page(self):
-        new_deck = {}
-        card_id = 1
+        new_deck = Deck({}, self.app.settings.get("new_card_order", "insertion"))
         while True:
             # Inputting the front
-            print(f"Card {card_id}" + "\n" + "Front:")
+            print(f"Card {len(new_deck.cards) + 1}" + "\n" + "Front:")
             user_input = input("\n> ")
             args = self.argparser(user_input.strip())
             if args is not None:
@@ -202,15 +301,34 @@ class NewDeckPage(Page):
                     return self.app.pages["home"], {}
             
                 if args.finish:
-                    self.app.decks[self.deck] = Deck(new_deck)
-                    print(f"Deck \"{self.deck}\" created with {card_id - 1} cards.")
-                    schedule_daily(self.app.decks, 
-                           date.today(), 
-                           self.app.settings["cards_daily_limit"],
-                           self.app.settings["new_cards_per_day"])
+                    with self.app.lock:
+                        self.app.add_deck(self.deck, new_deck)
+                        self.app.journal_cards(self.deck, new_deck.cards)
+                    print(f"Deck \"{self.deck}\" created with {len(new_deck.cards)} cards.")
+                    # Only the new deck needs scheduling.
+                    self.app.schedule({self.deck: self.app.decks[self.deck]})
                     return self.app.pages["home"], {}
-            
-            new_card = {"front": user_input}
+
+                if args.import_path:
+                    try:
+                        # Rows with the text of a card of this or another deck are left out.
+                        # The first collection_duplicates() of a session loads every deck not
+                        # loaded yet and hashes all their cards, which takes seconds on a big
+                        # snapshot or SQLite collection. Every later check is a lookup.
+                        added = import_file(args.import_path, new_deck, duplicates="skip",
+                                            collection=self.app.collection_duplicates())
+                    except (OSError, ValueError, csv.Error) as e:
+                        print(f"Import stopped: {e}. The deck has {len(new_deck.cards)} cards so far.")
+                        continue
+                    self.app.add_deck(self.deck, new_deck)
+                    # Too many cards for the journal, the autosave saves the deck soon.
+                    self.app.autosaver.notify(added)
+                    print(f"Deck \"{self.deck}\" created with {len(new_deck.cards)} cards, "
+                          f"{added} of them imported.")
+                    self.app.schedule({self.deck: self.app.decks[self.deck]})
+                    return self.app.pages["home"], {}
+
+            front = user_input
 
             # Inputting the back
             print("Back:")
@@ -222,18 +340,24 @@ class NewDeckPage(Page):
                     return self.app.pages["home"], {}
             
                 if args.finish:
-                    self.app.decks[self.deck] = Deck(new_deck)
-                    print(f"Deck \"{self.deck}\" created with {card_id - 1} cards.")
-                    schedule_daily(self.app.decks, 
-                           date.today(), 
-                           self.app.settings["cards_daily_limit"],
-                           self.app.settings["new_cards_per_day"])
+                    with self.app.lock:
+                        self.app.add_deck(self.deck, new_deck)
+                        self.app.journal_cards(self.deck, new_deck.cards)
+                    print(f"Deck \"{self.deck}\" created with {len(new_deck.cards)} cards.")
+                    # Only the new deck needs scheduling.
+                    self.app.schedule({self.deck: self.app.decks[self.deck]})
                     return self.app.pages["home"], {}
             
-            new_card["back"] = user_input
-            new_card["is_new"] = True
-            new_deck[str(card_id)] = new_card  # keys in json must be strings
-            card_id += 1
+            key = card_key(front, user_input)
+            if key in new_deck.duplicates:
+                print("Not added, this deck has a card with the same front and back.")
+                continue
+            # The first card of a session pays for loading all decks, see -i above.
+            found = self.app.collection_duplicates().find(key)
+            if found:
+                print(f"Not added, deck \"{found[0][0]}\" has a card with the same front and back.")
+                continue
+            new_deck.add_card(front, user_input)
     
     @Page.global_parser
     def argparser(self, raw_input: str):
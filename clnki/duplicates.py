@@ -0,0 +1,110 @@
+"""
+Finding cards with the same front and back, in a deck or across decks.
+
+Cards are compared by card_key: a 16-byte hash of their front and back,
+normalized (case folded, runs of whitespace as one space). DuplicateIndex maps
+keys to the cards that have them; every Deck keeps one for its cards (built
+on first use, see Deck.duplicates) and updates it as cards are added and
+removed. CollectionDuplicates does the same across decks, on top of theirs.
+Either way, checking a card costs one hash and one dict lookup instead of a
+comparison with every card.
+"""
+from hashlib import blake2b
+import functools
+
+
+def normalize(text: str) -> str:
+    return " ".join(text.split()).casefold()
+
+
+def card_key(front: str, back: str) -> bytes:
+    """The key of a card with this front and back, equal for duplicates."""
+    text = normalize(front) + "\0" + normalize(back)
+    return blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+class DuplicateIndex:
+    """key -> the refs (card_id's, ...) added with it, in order."""
+
+    def __init__(self):
+        # One ref as it is and more in a list, since most keys have only one.
+        self._refs = {}
+
+    def add(self, key: bytes, ref):
+        refs = self._refs.get(key)
+        if refs is None:
+            self._refs[key] = ref
+        elif isinstance(refs, list):
+            refs.append(ref)
+        else:
+            self._refs[key] = [refs, ref]
+
+    def remove(self, key: bytes, ref):
+        refs = self._refs[key]
+        if not isinstance(refs, list):
+            del self._refs[key]
+            return
+        refs.remove(ref)
+        if len(refs) == 1:
+            self._refs[key] = refs[0]
+
+    def get(self, key: bytes) -> list:
+        refs = self._refs.get(key)
+        if refs is None:
+            return []
+        return list(refs) if isinstance(refs, list) else [refs]
+
+    def __contains__(self, key):
+        return key in self._refs
+
+    def __len__(self):
+        """Number of distinct keys."""
+        return len(self._refs)
+
+    def items(self):
+        """(key, refs) for every key."""
+        return ((key, refs if isinstance(refs, list) else [refs])
+                for key, refs in self._refs.items())
+
+
+class CollectionDuplicates:
+    """
+    key -> the decks that have a card with it, for decks {deck_name: Deck}.
+
+    The decks report their changes to it (Deck.key_listener) while attached.
+    Attaching a deck builds its index, so it loads a deck that was not loaded.
+    """
+
+    def __init__(self, decks=None):
+        self.decks = {}
+        self._index = DuplicateIndex()  # key -> deck_name, once per card
+        for deck_name, deck in (decks or {}).items():
+            self.attach(deck_name, deck)
+
+    def attach(self, deck_name, deck):
+        self.decks[deck_name] = deck
+        for key, card_ids in deck.duplicates.items():
+            for _ in card_ids:
+                self._index.add(key, deck_name)
+        deck.key_listener = functools.partial(self._changed, deck_name)
+
+    def detach(self, deck_name):
+        deck = self.decks.pop(deck_name)
+        deck.key_listener = None
+        for key, card_ids in deck.duplicates.items():
+            for _ in card_ids:
+                self._index.remove(key, deck_name)
+
+    def _changed(self, deck_name, key, added):
+        if added:
+            self._index.add(key, deck_name)
+        else:
+            self._index.remove(key, deck_name)
+
+    def __contains__(self, key):
+        return key in self._index
+
+    def find(self, key: bytes) -> list[tuple[str, str]]:
+        """(deck_name, card_id) of the cards with key."""
+        return [(deck_name, card_id) for deck_name in dict.fromkeys(self._index.get(key))
+                for card_id in self.decks[deck_name].duplicates.get(key)]
@@ -0,0 +1,141 @@
+"""
+Export one deck or the whole collection as Anki-style TSV or as JSONL.
+
+Lines are made by generators, one card at a time, and written through a
+buffered (optionally gzip) file, so an export never holds more than a buffer
+of its output. A collection is exported deck by deck: decks that were not
+loaded are loaded one at a time and let go once written.
+
+TSV is what clnki.importer (and Anki) read: headers, then front, back (and the
+deck, for a collection) per line, quoted where needed. Scheduling is not part
+of it. JSONL has one object per card with every field, dates in ISO format:
+    {"deck": ..., "card_id": ..., "front": ..., "back": ..., "is_new": ..., ...}
+
+Export a collection on disk from the repository root (changes still in the
+journal of a running clnki are not in it until it saves them):
+    python -m clnki.exporter collection.tsv.gz
+    python -m clnki.exporter my_deck.jsonl --deck "my deck"
+    python -m clnki.exporter collection.tsv --snapshot  (or --db clnki/data/clnki.db)
+"""
+from clnki.cardstore import CardStore, DATE_FIELDS, encode_card, from_day
+from clnki.storage import add_storage_arguments, open_storage
+from typing import IO
+import argparse
+import gzip
+import json
+import os
+
+FORMATS = ("tsv", "jsonl")
+
+BUFFER_SIZE = 1 << 20
+
+_NEEDS_QUOTES = ("\t", "\n", "\r", '"')
+
+
+def _card_dicts(cards):
+    if isinstance(cards, CardStore):
+        return cards.iter_dicts()
+    return ((card_id, encode_card(card)) for card_id, card in cards.items())
+
+
+def tsv_field(text: str) -> str:
+    """text as a TSV field, quoted (with "" for ") if it holds a tab, line break or quote."""
+    if any(char in text for char in _NEEDS_QUOTES) or text.startswith("#"):
+        return '"' + text.replace('"', '""') + '"'
+    return text
+
+
+def iter_tsv(decks, with_deck: bool):
+    """
+    The lines of a TSV export of decks, (deck_name, cards) pairs.
+
+    Args:
+        with_deck: add the deck name as a third column
+    """
+    yield "#separator:tab\n#html:false\n"
+    if with_deck:
+        yield "#columns:Front\tBack\tDeck\n#deck column:3\n"
+    else:
+        yield "#columns:Front\tBack\n"
+    for deck_name, cards in decks:
+        deck_field = "\t" + tsv_field(deck_name) if with_deck else ""
+        for _, card in _card_dicts(cards):
+            yield f"{tsv_field(card['front'])}\t{tsv_field(card['back'])}{deck_field}\n"
+
+
+def iter_jsonl(decks):
+    """The lines of a JSONL export of decks, (deck_name, cards) pairs."""
+    for deck_name, cards in decks:
+        for card_id, card in _card_dicts(cards):
+            for field in DATE_FIELDS:
+                if field in card:
+                    card[field] = from_day(card[field]).isoformat()
+            yield json.dumps({"deck": deck_name, "card_id": card_id, **card},
+                             ensure_ascii=False) + "\n"
+
+
+def format_for(path: str | os.PathLike) -> str:
+    """The export format a path's extension asks for (.jsonl, .jsonl.gz), tsv otherwise."""
+    return "jsonl" if ".jsonl" in os.path.basename(path) else "tsv"
+
+
+def open_export(path: str | os.PathLike, compress: bool | None = None) -> IO[str]:
+    """Open path to write an export to, through gzip if compress (by default, if it ends with .gz)."""
+    if compress is None:
+        compress = os.fspath(path).endswith(".gz")
+    if compress:
+        return gzip.open(path, 'wt', encoding='utf-8', newline='', compresslevel=6)
+    return open(path, 'w', encoding='utf-8', newline='', buffering=BUFFER_SIZE)
+
+
+def export(decks, path: str | os.PathLike, fmt: str = "tsv", compress: bool | None = None,
+           with_deck: bool = True) -> int:
+    """
+    Write decks, an iterable of (deck_name, cards), to path.
+
+    Args:
+        fmt: one of FORMATS
+        compress: gzip the file, by default if path ends with .gz
+        with_deck: for tsv, whether to add the deck column
+
+    Returns: the number of cards written
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format {fmt!r}.")
+    count = 0
+
+    def counted(decks):
+        nonlocal count
+        for deck_name, cards in decks:
+            count += len(cards)
+            yield deck_name, cards
+
+    lines = iter_tsv(counted(decks), with_deck) if fmt == "tsv" else iter_jsonl(counted(decks))
+    with open_export(path, compress) as f:
+        f.writelines(lines)
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="clnki.exporter",
+                                     description="Export decks as Anki-style TSV or JSONL.")
+    parser.add_argument("path", help="Gzipped if it ends with .gz.")
+    parser.add_argument("--deck", action="append", help="Only this deck (can be repeated).")
+    parser.add_argument("--format", choices=FORMATS,
+                        help="By default from the extension of path, else tsv.")
+    parser.add_argument("--data-dir", default=os.path.join("clnki", "data"))
+    add_storage_arguments(parser)
+    args = parser.parse_args()
+
+    fmt = args.format or format_for(args.path)
+    storage = open_storage(args, args.data_dir)
+    try:
+        count = export(storage.iter_decks(args.deck), args.path, fmt,
+                       with_deck=args.deck is None or len(args.deck) > 1)
+    finally:
+        storage.close()
+    print(f"Exported {count} cards to {args.path}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,6 @@
 import math
+import functools
+import numpy as np
 
 def forgetting_curve(elapsed_days, s, w):
   decay = -1 * w[20]
@@ -18,7 +20,7 @@ def init_difficulty(grade, w):
   return clamp_difficulty(w[4] - math.exp(w[5] * (grade - 1)) + 1)
 
 def clamp_difficulty(d):
-  return min(max(round(d, 2), 10), 1)
+  return max(min(round(d, 2), 10), 1)
 
 def mean_reversion(init, current, w):
   return w[7] * init + (1 - w[7]) * current
@@ -29,7 +31,7 @@ def linear_damping(delta_d, d):
 def next_difficulty(d, grade, w):
   delta_d = -1 * w[6] * (grade - 3)
   next_d = d + linear_damping(delta_d, d)
-  return clamp_difficulty(mean_reversion(init_difficulty(3, w), next_d))
+  return clamp_difficulty(mean_reversion(init_difficulty(3, w), next_d, w))
 
 def next_recall_stability(d, s, r, grade, w):
   hard_penalty = w[15] if (grade == 2) else 1
@@ -40,7 +42,7 @@ def next_recall_stability(d, s, r, grade, w):
           hard_penalty * easy_bonus
   return round(s * s_inc, 2)
 
-def next_forget_stability(d, s, r, w): 
+def next_forget_stability(d, s, r, w):
   s_new = w[11] * math.pow(d, -w[12]) * (math.pow(s + 1, w[13])-1) \
           * math.exp(w[14] * (1 - r))
   return round(min(s_new, s), 2)
@@ -71,9 +73,9 @@ def fsrs(elapsed_days, grade, s, d, desired_r, w):
     next_s = next_forget_stability(d, s, r, w)
   else:
     next_s = next_recall_stability(d, s, r, grade, w)
-    
+
   next_d = next_difficulty(d, grade, w)
-  next_interv = next_interval(s, desired_r, w)
+  next_interv = next_interval(next_s, desired_r, w)
   return next_s, next_d, next_interv
 
 def fsrs_init(grade, desired_r, w):
@@ -81,3 +83,219 @@ def fsrs_init(grade, desired_r, w):
   d = init_difficulty(grade, w)
   next_interv = next_interval(s, desired_r, w)
   return s, d, next_interv
+
+
+# Batch versions of the above. Every argument that is per card may be a NumPy
+# array (or anything np.asarray accepts); the results are float64 arrays.
+# They follow the scalar functions step by step, rounding included, so a batch
+# call gives the same numbers as calling fsrs() on each card in a loop.
+
+def _round2(x):
+  # np.round(x, 2) scales by 100 before rounding, which can land on the other
+  # side of .5 from Python's round(x, 2) when x * 100 is close to a tie. Away
+  # from ties both give the double nearest to k / 100, so only the values near
+  # one are rounded again with round() itself, which is exact.
+  x = np.asarray(x, dtype=np.float64)
+  rounded = np.round(x, 2)
+  scaled = x * 100
+  near_tie = np.abs(scaled - np.floor(scaled) - 0.5) <= 1e-7 * np.maximum(np.abs(scaled), 1)
+  if near_tie.any():
+    if rounded.ndim == 0:
+      return np.float64(round(float(x), 2))
+    rounded[near_tie] = [round(value, 2) for value in x[near_tie].tolist()]
+  return rounded
+
+def forgetting_curve_batch(elapsed_days, s, w):
+  decay = -1 * w[20]
+  factor = 0.9 ** (1 / decay) - 1
+  elapsed_days = np.asarray(elapsed_days, dtype=np.float64)
+  s = np.asarray(s, dtype=np.float64)
+  return np.power(1 + factor * elapsed_days / s, decay)
+
+def next_interval_batch(s, desired_r, w):
+  decay = -1 * w[20]
+  factor = 0.9 ** (1 / decay) - 1
+  s = np.asarray(s, dtype=np.float64)
+  new_interval = s / factor * (math.pow(desired_r, 1 / decay) - 1)
+  return np.maximum(_round2(new_interval), 1)
+
+def clamp_difficulty_batch(d):
+  return np.clip(_round2(d), 1, 10)
+
+def next_difficulty_batch(d, grades, w):
+  delta_d = -1 * w[6] * (grades - 3)
+  next_d = d + linear_damping(delta_d, d)
+  return clamp_difficulty_batch(mean_reversion(init_difficulty(3, w), next_d, w))
+
+def next_recall_stability_batch(d, s, r, grades, w):
+  hard_penalty = np.where(grades == 2, w[15], 1)
+  easy_bonus = np.where(grades == 4, w[16], 1)
+
+  s_inc = 1 + math.exp(w[8]) * (11 - d) * \
+          np.power(s, -w[9]) * (np.exp(w[10] * (1 - r)) - 1) * \
+          hard_penalty * easy_bonus
+  return _round2(s * s_inc)
+
+def next_forget_stability_batch(d, s, r, w):
+  s_new = w[11] * np.power(d, -w[12]) * (np.power(s + 1, w[13]) - 1) \
+          * np.exp(w[14] * (1 - r))
+  return _round2(np.minimum(s_new, s))
+
+def fsrs_batch(elapsed_days, grades, s, d, desired_r, w):
+  """
+  fsrs() over many cards at once.
+
+  Args:
+    elapsed_days: Days since each card's last review
+    grades: 1, 2, 3, 4 for Again, Hard, Easy, Very Easy
+    s: Cards' stability
+    d: Cards' difficulty
+    desired_r: Target retrievability, shared by all cards
+    w: FSRS parameters, shared by all cards
+
+  Returns: arrays (next_s, next_d, next_interv)
+  """
+  grades = np.asarray(grades)
+  s = np.asarray(s, dtype=np.float64)
+  d = np.asarray(d, dtype=np.float64)
+
+  r = forgetting_curve_batch(elapsed_days, s, w)
+  next_s = np.where(grades < 2,
+                    next_forget_stability_batch(d, s, r, w),
+                    next_recall_stability_batch(d, s, r, grades, w))
+  next_d = next_difficulty_batch(d, grades, w)
+  next_interv = next_interval_batch(next_s, desired_r, w)
+  return next_s, next_d, next_interv
+
+def fsrs_init_batch(grades, desired_r, w):
+  grades = np.asarray(grades, dtype=np.int64)
+  init_s = np.array([init_stability(g, w) for g in (1, 2, 3, 4)])
+  init_d = np.array([init_difficulty(g, w) for g in (1, 2, 3, 4)])
+  s = init_s[grades - 1]
+  d = init_d[grades - 1]
+  next_interv = next_interval_batch(s, desired_r, w)
+  return s, d, next_interv
+
+
+# (lower, upper) bounds for each of the 21 parameters, the same ranges the
+# reference FSRS optimizer clamps to. Outside of these the formulas above
+# can divide by zero or blow up.
+FSRS_PARAMETER_BOUNDS = [
+  (0.001, 100), (0.001, 100), (0.001, 100), (0.001, 100),  # initial S
+  (1, 10), (0.001, 4),  # initial D
+  (0.001, 4), (0.001, 0.75),  # D update, mean reversion
+  (0, 4.5), (0, 0.8), (0.001, 3.5),  # S after recall
+  (0.001, 5), (0.001, 0.25), (0.001, 0.9), (0, 4),  # S after forgetting
+  (0, 1), (1, 6),  # hard penalty, easy bonus
+  (0, 2), (0, 2), (0, 0.8),  # short-term S
+  (0.1, 0.8),  # decay
+]
+
+
+class FSRSModel:
+  """
+  FSRS with its parameters fixed.
+
+  The functions above take w on every call and rederive decay, factor, the
+  initial S and D etc. each time. A model validates w once, computes all of
+  those up front and is then shared by everything that schedules cards.
+  Models are immutable, so build a new one (FSRSModel.from_settings) when
+  settings change.
+
+  Attributes:
+    w: The 21 FSRS parameters as a tuple
+    desired_r: Target retrievability when a card becomes due
+  """
+
+  __slots__ = ("w", "desired_r", "decay", "factor", "interval_factor",
+               "init_s", "init_d", "target_d", "exp_w8")
+
+  def __init__(self, w, desired_r):
+    w = tuple(float(x) for x in w)
+    check_parameters(w)
+    if not 0 < desired_r < 1:
+      raise ValueError("fsrs-desired-R must be between 0 and 1.")
+
+    decay = -1 * w[20]
+    factor = 0.9 ** (1 / decay) - 1
+    init = object.__setattr__
+    init(self, "w", w)
+    init(self, "desired_r", desired_r)
+    init(self, "decay", decay)
+    init(self, "factor", factor)
+    init(self, "interval_factor", math.pow(desired_r, 1 / decay) - 1)
+    # Indexed by grade, so index 0 is unused.
+    init(self, "init_s", (None,) + tuple(init_stability(g, w) for g in (1, 2, 3, 4)))
+    init(self, "init_d", (None,) + tuple(init_difficulty(g, w) for g in (1, 2, 3, 4)))
+    init(self, "target_d", init_difficulty(3, w))
+    init(self, "exp_w8", math.exp(w[8]))
+
+  def __setattr__(self, name, value):
+    raise AttributeError("FSRSModel is immutable.")
+
+  def __delattr__(self, name):
+    raise AttributeError("FSRSModel is immutable.")
+
+  def __repr__(self):
+    return f"FSRSModel(w={list(self.w)}, desired_r={self.desired_r})"
+
+  @classmethod
+  def from_settings(cls, settings):
+    """Return the model for settings, reusing the last one if nothing changed."""
+    return _model_from_parameters(tuple(settings["fsrs"]), settings["fsrs_desired_R"])
+
+  def forgetting_curve(self, elapsed_days, s):
+    return math.pow(1 + self.factor * elapsed_days / s, self.decay)
+
+  def next_interval(self, s):
+    new_interval = s / self.factor * self.interval_factor
+    return max(round(new_interval, 2), 1)
+
+  def next_difficulty(self, d, grade):
+    w = self.w
+    delta_d = -1 * w[6] * (grade - 3)
+    next_d = d + linear_damping(delta_d, d)
+    return clamp_difficulty(w[7] * self.target_d + (1 - w[7]) * next_d)
+
+  def next_recall_stability(self, d, s, r, grade):
+    w = self.w
+    hard_penalty = w[15] if (grade == 2) else 1
+    easy_bonus = w[16] if (grade == 4) else 1
+
+    s_inc = 1 + self.exp_w8 * (11 - d) * \
+            math.pow(s, -w[9]) * (math.exp(w[10] * (1 - r)) - 1) * \
+            hard_penalty * easy_bonus
+    return round(s * s_inc, 2)
+
+  def init(self, grade):
+    """fsrs_init() for this model."""
+    s = self.init_s[grade]
+    return s, self.init_d[grade], self.next_interval(s)
+
+  def review(self, elapsed_days, grade, s, d):
+    """fsrs() for this model."""
+    r = self.forgetting_curve(elapsed_days, s)
+    if grade < 2:
+      next_s = next_forget_stability(d, s, r, self.w)
+    else:
+      next_s = self.next_recall_stability(d, s, r, grade)
+
+    next_d = self.next_difficulty(d, grade)
+    return next_s, next_d, self.next_interval(next_s)
+
+  def forgetting_curve_batch(self, elapsed_days, s):
+    return forgetting_curve_batch(elapsed_days, s, self.w)
+
+
+def check_parameters(w):
+  """Raise ValueError unless w is 21 finite numbers inside FSRS_PARAMETER_BOUNDS."""
+  if len(w) != len(FSRS_PARAMETER_BOUNDS):
+    raise ValueError(f"FSRS needs {len(FSRS_PARAMETER_BOUNDS)} parameters, got {len(w)}.")
+
+  for i, (value, (lower, upper)) in enumerate(zip(w, FSRS_PARAMETER_BOUNDS)):
+    if not (math.isfinite(value) and lower <= value <= upper):
+      raise ValueError(f"FSRS parameter w[{i}] = {value} is outside [{lower}, {upper}].")
+
+@functools.lru_cache(maxsize=8)
+def _model_from_parameters(w, desired_r):
+  return FSRSModel(w, desired_r)
@@ -0,0 +1,220 @@
+"""
+Import cards from text files in Anki's export format.
+
+Such a file starts with header lines like
+
+    #separator:tab
+    #html:true
+    #columns:Front	Back	Tags
+
+followed by one note per line. A field may be quoted with "...", and then hold
+the separator, line breaks and "" for a quote. The first two columns (or the
+ones #columns names Front and Back) become a card's front and back, the rest
+is ignored. Columns that Anki's #guid column:N, #notetype column:N, #deck
+column:N and #tags column:N headers claim are not counted among the first two. With #html:true, line breaks (<br>) are kept and other tags are
+dropped, since cards are shown as plain text.
+
+The file is read line by line by the csv module and cards are added to the
+deck BATCH_SIZE at a time, so memory does not grow with the file, only the
+deck does. Rows that duplicate a card (same card_key, see clnki.duplicates)
+can be skipped or merged into it, at the cost of one hash lookup per row.
+
+Import a file into a deck of a collection from the repository root:
+    python -m clnki.importer notes.txt --deck "my deck"
+    python -m clnki.importer notes.txt --deck "my deck" --snapshot  (or --db clnki/data/clnki.db)
+"""
+from clnki.deck import Deck
+from clnki.duplicates import CollectionDuplicates, card_key
+from clnki.storage import add_storage_arguments, open_storage
+from typing import IO
+import argparse
+import csv
+import html
+import itertools
+import os
+import re
+
+BATCH_SIZE = 10_000
+
+# What import_rows does with duplicates, see there.
+DUPLICATE_MODES = ("add", "skip", "merge")
+
+# Values of #separator, besides a single character.
+SEPARATORS = {"tab": "\t", "comma": ",", "semicolon": ";", "pipe": "|", "space": " ",
+              "colon": ":"}
+
+# Headers of Anki giving the (1-based) column of something that is not a field of the note.
+META_COLUMNS = ("guid column", "notetype column", "deck column", "tags column")
+
+_BR = re.compile(r"<br\s*/?>", re.IGNORECASE)
+_TAG = re.compile(r"<[^>]*>")
+
+# Long fields are the file's business, not an error.
+FIELD_SIZE_LIMIT = 1 << 30
+
+
+def read_headers(f: IO[str]):
+    """
+    Read the header lines at the start of f.
+
+    Returns: ({header: value}, the first line after the headers or "")
+    """
+    headers = {}
+    for line in f:
+        if not line.startswith("#") or ":" not in line:
+            return headers, line
+        key, _, value = line[1:].rstrip("\r\n").partition(":")
+        headers[key.strip().lower()] = value
+    return headers, ""
+
+
+def html_to_text(field: str) -> str:
+    if "<" in field:
+        field = _TAG.sub("", _BR.sub("\n", field))
+    return html.unescape(field) if "&" in field else field
+
+
+def iter_rows(f: IO[str]):
+    """
+    (front, back) for every note in an Anki text file. f should be opened
+    with newline="" so that line breaks inside quoted fields are kept as they are.
+    """
+    headers, first_line = read_headers(f)
+    separator = headers.get("separator", "tab")
+    separator = SEPARATORS.get(separator.lower(), separator)
+    if len(separator) != 1:
+        raise ValueError(f"Unknown separator {headers['separator']!r}.")
+    columns = [name.strip().lower() for name in headers.get("columns", "").split(separator)]
+    meta = {int(headers[header]) - 1 for header in META_COLUMNS
+            if headers.get(header, "").strip().isdigit()}
+    free = [i for i in range(len(meta) + 3) if i not in meta]
+    front_col = columns.index("front") if "front" in columns else free[0]
+    back_col = columns.index("back") if "back" in columns else next(i for i in free if i != front_col)
+    is_html = headers.get("html", "false").strip().lower() == "true"
+
+    reader = csv.reader(itertools.chain([first_line], f), delimiter=separator)
+    # The limit is the csv module's, for the whole process, so it is put back after.
+    old_limit = csv.field_size_limit(FIELD_SIZE_LIMIT)
+    try:
+        for fields in reader:
+            if not fields or len(fields) <= front_col:
+                continue  # empty line
+            front = fields[front_col]
+            back = fields[back_col] if back_col < len(fields) else ""
+            if is_html:
+                front, back = html_to_text(front), html_to_text(back)
+            yield front, back
+    finally:
+        csv.field_size_limit(old_limit)
+
+
+def _drop_duplicates(batch, deck: Deck, duplicates: str, collection):
+    """
+    The rows of batch that are no duplicate of a card of deck (or of the
+    collection, or of an earlier row), with their card_key's. With "merge", a
+    duplicate's text replaces the text of the card (or row) it duplicates.
+    """
+    rows = {}  # key -> row, for the rows kept
+    for front, back in batch:
+        key = card_key(front, back)
+        if key in rows:
+            if duplicates == "merge":
+                rows[key] = (front, back)
+            continue
+        if key in deck.duplicates:
+            if duplicates == "merge":
+                for card_id in deck.duplicates.get(key):
+                    deck.set_text(card_id, front, back)
+            continue
+        if collection is not None and key in collection:
+            if duplicates == "merge":
+                for deck_name, card_id in collection.find(key):
+                    collection.decks[deck_name].set_text(card_id, front, back)
+            continue
+        rows[key] = (front, back)
+    return list(rows.values()), list(rows)
+
+
+def import_rows(rows, deck: Deck, batch_size: int = BATCH_SIZE, duplicates: str = "add",
+                collection: CollectionDuplicates | None = None) -> int:
+    """
+    Add (front, back) rows to deck as new cards, batch_size at a time.
+
+    Args:
+        duplicates: one of DUPLICATE_MODES, what to do with a row that has the
+                    card_key of a card already in deck (or collection), or of
+                    an earlier row. "add" adds it anyway, "skip" leaves it out,
+                    "merge" leaves it out and puts its text on the existing card.
+        collection: to look for duplicates in other decks as well
+
+    Returns: the number of cards added
+    """
+    if duplicates not in DUPLICATE_MODES:
+        raise ValueError(f"Unknown duplicates mode {duplicates!r}.")
+    added = 0
+    rows = iter(rows)
+    while batch := list(itertools.islice(rows, batch_size)):
+        keys = None
+        if duplicates != "add":
+            batch, keys = _drop_duplicates(batch, deck, duplicates, collection)
+        deck.add_cards(batch, keys)
+        added += len(batch)
+    return added
+
+
+def import_file(path: str | os.PathLike, deck: Deck, batch_size: int = BATCH_SIZE,
+                duplicates: str = "add", collection: CollectionDuplicates | None = None) -> int:
+    """
+    Add the notes of an Anki text file to deck, see iter_rows and import_rows.
+
+    Returns: the number of cards added
+    """
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        return import_rows(iter_rows(f), deck, batch_size, duplicates, collection)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="clnki.importer",
+                                     description="Import an Anki text file into a deck.")
+    parser.add_argument("path")
+    parser.add_argument("--deck", required=True, help="Created if it does not exist.")
+    parser.add_argument("--data-dir", default=os.path.join("clnki", "data"))
+    add_storage_arguments(parser)
+    parser.add_argument("--duplicates", choices=DUPLICATE_MODES, default="skip",
+                        help="What to do with rows that duplicate a card.")
+    parser.add_argument("--across-decks", action="store_true",
+                        help="Look for duplicates in the other decks too, not only in --deck.")
+    args = parser.parse_args()
+
+    storage = open_storage(args, args.data_dir)
+    try:
+        added, total = _import_into(storage, args)
+    finally:
+        storage.close()
+    print(f"Imported {added} cards into {args.deck!r}, which has {total} cards now.")
+
+
+def _import_into(storage, args):
+    """Import args.path as main asked. Returns: (cards added, cards in the deck now)"""
+    if args.across_decks:
+        decks = {deck_name: Deck(cards) for deck_name, cards in storage.load_decks().items()}
+        deck_names = list(decks)
+    else:
+        # Only the deck imported into is looked at, so only that one is loaded.
+        deck_names = storage.deck_names()
+        decks = {deck_name: Deck(cards) for deck_name, cards in storage.iter_decks([args.deck])}
+    if args.deck not in decks:
+        decks[args.deck] = Deck({})
+    if args.deck not in deck_names:
+        deck_names.append(args.deck)
+    collection = CollectionDuplicates(decks) if args.across_decks else None
+    added = import_file(args.path, decks[args.deck], duplicates=args.duplicates,
+                        collection=collection)
+    # "merge" may have changed cards of other decks.
+    storage.update_decks({deck_name: deck.cards for deck_name, deck in decks.items()
+                          if deck.dirty or deck_name == args.deck}, deck_names)
+    return added, len(decks[args.deck].cards)
+
+
+if __name__ == "__main__":
+    main()
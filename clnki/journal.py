@@ -0,0 +1,151 @@
+"""
+Append-only journal of card changes made since the last snapshot of the decks.
+
+Every Deck.review (and every new deck) appends one compact json line
+[deck_name, card_id, card] with the card's whole state after the change, so
+replaying a line twice does no harm. Lines are fsync'd in batches, or by the
+caller (see clnki.autosave). On startup the journal is replayed over the
+snapshot the storage loaded, and every save of a new snapshot drops the lines
+it covers (see Clnki.save_changes).
+"""
+from clnki.cardstore import CardStore, encode_card, decode_card
+from os import PathLike
+import json
+import os
+import time
+
+
+class Journal:
+    def __init__(self, path: str | PathLike, sync_every: int | None = 16,
+                 sync_interval: float = 2.0):
+        """
+        Args:
+            path: the journal file, created on the first append
+            sync_every: fsync after this many appended lines. None leaves it to
+                        the caller, with flush() and sync().
+            sync_interval: or when an append comes this many seconds after the last fsync
+        """
+        self.path = os.fspath(path)
+        # Lines being compacted into a snapshot, see rotate().
+        self.old_path = self.path + ".old"
+        # Lines moved aside by rotate() and not yet added to old_path by finish_rotate().
+        self.next_path = self.path + ".next"
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+        self._file = None
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def on_disk(self) -> bool:
+        return any(os.path.exists(path) for path in (self.old_path, self.next_path, self.path))
+
+    def append(self, deck_name: str, card_id: str, card: dict):
+        if self._file is None:
+            self._file = open(self.path, 'a', encoding='utf-8')
+        self._file.write(json.dumps([deck_name, card_id, encode_card(card)],
+                                    separators=(",", ":")) + "\n")
+        self._pending += 1
+        if self.sync_every is not None and (
+                self._pending >= self.sync_every
+                or time.monotonic() - self._last_sync >= self.sync_interval):
+            self.sync()
+
+    def flush(self) -> int | None:
+        """
+        Hand the appended lines to the OS, without waiting for the disk. They
+        are durable once the returned file descriptor is fsync'd, which can be
+        done while lines are appended (but not after close or rotate).
+
+        Returns: the descriptor, or None if there is nothing to fsync
+        """
+        if self._file is None or not self._pending:
+            return None
+        self._file.flush()
+        self._pending = 0
+        self._last_sync = time.monotonic()
+        return self._file.fileno()
+
+    def sync(self):
+        """Make the appended lines durable."""
+        if self._file is not None and self._pending:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def close(self):
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+
+    def rotate(self):
+        """
+        Move the journal aside so new lines go to a fresh file while a snapshot
+        is written. Only a rename, so it can be done under the lock appends
+        are made under: the lines moved aside are made durable by
+        finish_rotate(), to be called after without the lock.
+        """
+        if self._file is not None:
+            self._file.close()  # flushes to the OS
+            self._file = None
+        self._pending = 0
+        if not os.path.exists(self.path):
+            return
+        if os.path.exists(self.next_path):
+            self.finish_rotate()  # left by a crash
+        os.replace(self.path, self.next_path)
+
+    def finish_rotate(self) -> str:
+        """
+        fsync the lines moved aside by rotate() and put them after the ones in
+        old_path, which a crash or a failed save may have left. The caller
+        removes the returned file once the snapshot is saved.
+        """
+        if not os.path.exists(self.next_path):
+            return self.old_path
+        if os.path.exists(self.old_path):
+            with open(self.next_path, 'rb') as src, open(self.old_path, 'ab') as dst:
+                dst.write(b"\n" + src.read())
+                dst.flush()
+                os.fsync(dst.fileno())
+            os.remove(self.next_path)
+        else:
+            with open(self.next_path, 'ab') as f:
+                os.fsync(f.fileno())
+            os.replace(self.next_path, self.old_path)
+        return self.old_path
+
+    def replay(self, decks: dict[str, dict], load_deck=None) -> set[str]:
+        """
+        Apply the journal to decks, {deck_name: {card_id: card}} as Storage.load_decks returns.
+
+        Args:
+            load_deck: called with the name of a deck not in decks to get its cards,
+                       e.g. Storage.load_deck when decks holds only some of them.
+                       By default such a deck starts empty.
+
+        Returns: the names of the decks it changed
+        """
+        changed = set()
+        for path in (self.old_path, self.next_path, self.path):
+            if not os.path.exists(path):
+                continue
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        deck_name, card_id, card = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # cut short by a crash
+                    if deck_name not in decks:
+                        decks[deck_name] = CardStore() if load_deck is None else load_deck(deck_name)
+                    decks[deck_name][card_id] = decode_card(card)
+                    changed.add(deck_name)
+        return changed
+
+    def discard(self):
+        """Remove the journal files, once a snapshot holds all of their changes."""
+        self.close()
+        for path in (self.old_path, self.next_path, self.path):
+            if os.path.exists(path):
+                os.remove(path)
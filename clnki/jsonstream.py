@@ -0,0 +1,156 @@
+"""
+Read and write decks.json and deck shards card by card instead of with json.load
+and json.dump.
+
+json.load reads the whole file into one string and builds every dict before
+returning, so loading needs the file plus the decoded collection in memory at
+once. Here the file is read in chunks and each card is decoded on its own by
+the scanner behind json.JSONDecoder.raw_decode, so only the current chunk and
+the cards decoded so far are kept. Card keys ("front", "back", ...) are
+interned, so all cards share one string per key as they do after json.load.
+Writing is the same the other way around, one card per line.
+
+Cards come out as they are in the file (dates as ISO strings), for
+clnki.cardstore.decode_card.
+"""
+from clnki.cardstore import CardStore, encode_card
+from typing import IO
+import json
+import json.scanner
+import re
+import sys
+
+CHUNK_SIZE = 1 << 16  # characters
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+class ChunkDecoder:
+    """Walks the json text of a file object, reading more of it when needed."""
+
+    def __init__(self, f: IO[str], chunk_size: int = CHUNK_SIZE):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self._scan = json.scanner.make_scanner(json.JSONDecoder())
+
+    def _read_chunk(self) -> bool:
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """The next character that is not whitespace."""
+        while True:
+            if self.pos < len(self.buf) and self.buf[self.pos] not in " \t\n\r":
+                return self.buf[self.pos]
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._read_chunk():
+                raise json.JSONDecodeError("Unexpected end of data", self.buf, self.pos)
+
+    def expect(self, char: str):
+        if self.peek() != char:
+            raise json.JSONDecodeError(f"Expecting {char!r}", self.buf, self.pos)
+        self.pos += 1
+
+    def value(self):
+        """
+        Decode the next string or object.
+
+        Numbers are not supported: a number cut by the end of a chunk would
+        still decode, to the wrong value.
+        """
+        self.peek()
+        while True:
+            try:
+                obj, self.pos = self._scan(self.buf, self.pos)
+            except (json.JSONDecodeError, StopIteration):
+                # Cut short by the end of the chunk, or really malformed.
+                if not self._read_chunk():
+                    raise json.JSONDecodeError("Invalid value", self.buf, self.pos) from None
+                continue
+            if isinstance(obj, dict):
+                obj = {sys.intern(key): val for key, val in obj.items()}
+            return obj
+
+    def members(self):
+        """
+        The keys of the next object. Each member's value must be read (with
+        value() or members()) before asking for the next key.
+        """
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            if not isinstance(key, str):
+                raise json.JSONDecodeError("Expecting a string key", self.buf, self.pos)
+            self.expect(":")
+            yield key
+            if self.peek() == ",":
+                self.pos += 1
+            else:
+                self.expect("}")
+                return
+
+
+def _members(decoder: ChunkDecoder):
+    for key in decoder.members():
+        yield key, decoder.value()
+
+
+def read_decks(f: IO[str], chunk_size: int = CHUNK_SIZE):
+    """
+    (deck_name, cards) for every deck in decks.json, {deck_name: {card_id: card}},
+    cards being an iterator of (card_id, card) that reads the deck from f. The
+    cards not taken from it are read past before the next deck.
+    """
+    decoder = ChunkDecoder(f, chunk_size)
+    for deck_name in decoder.members():
+        cards = _members(decoder)
+        yield deck_name, cards
+        for _ in cards:
+            pass
+
+
+def read_deck(f: IO[str], chunk_size: int = CHUNK_SIZE):
+    """(card_id, card) for every card in a deck shard, {card_id: card}."""
+    return _members(ChunkDecoder(f, chunk_size))
+
+
+def _card_dicts(cards):
+    if isinstance(cards, CardStore):
+        return cards.iter_dicts()
+    return ((card_id, encode_card(card)) for card_id, card in cards.items())
+
+
+def _write_cards(f: IO[str], cards, indent: str):
+    f.write("{")
+    separator = "\n"
+    for card_id, card in _card_dicts(cards):
+        f.write(f"{separator}{indent}    {json.dumps(card_id)}: {json.dumps(card)}")
+        separator = ",\n"
+    f.write("}" if separator == "\n" else f"\n{indent}}}")
+
+
+def dump_deck(cards, f: IO[str]):
+    """Write a deck shard, {card_id: card}, one card per line."""
+    _write_cards(f, cards, "")
+
+
+def dump_decks(decks, f: IO[str]):
+    """Write decks.json, {deck_name: {card_id: card}}, one card per line."""
+    f.write("{")
+    separator = "\n"
+    for deck_name, cards in decks.items():
+        f.write(f"{separator}    {json.dumps(deck_name)}: ")
+        _write_cards(f, cards, "    ")
+        separator = ",\n"
+    f.write("}" if separator == "\n" else "\n}")
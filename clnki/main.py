@@ -1,11 +1,17 @@
 from clnki.base import App, Page, ExitApp, Navigate
 from clnki.pages import HomePage, SettingsPage, RemoveDeckPage
 from clnki.deck_pages import DeckPage, CardReviewPage, NewDeckPage, BrowseDeckPage
-from clnki.deck import to_json_date_handling
-from os import PathLike
+from clnki.fsrs import FSRSModel
+from clnki.schedule import schedule_daily
+from clnki.storage import Storage, CollectionCache, add_storage_arguments, open_storage
+from clnki.journal import Journal
+from clnki.autosave import Autosaver
+from clnki.duplicates import CollectionDuplicates
+import copy
+import os
 import argparse
 import shlex
-import json
+import threading
 
 default_fsrs = [0.212, 1.2931, 2.3065, 8.2956, 6.4133,  
                 0.8334, 3.0194, 0.001, 1.8722, 0.1666, 
@@ -16,7 +22,10 @@ default_fsrs = [0.212, 1.2931, 2.3065, 8.2956, 6.4133,
 default_setting_vals = {"fsrs": default_fsrs,
                     "fsrs_desired_R": 0.9,
                     "new_cards_per_day": 4,
-                    "cards_daily_limit": 25
+                    "cards_daily_limit": 25,
+                    "due_order": "due_date",
+                    "new_card_order": "insertion",
+                    "load_balance": True
                     }
 
 
@@ -27,11 +36,10 @@ class Clnki(App):
     __parser.add_argument("-q", "--quit", action="store_true")
     __parser.add_argument("-s", "--settings", action="store_true")
 
-    def __init__(self, decks_path: str | PathLike, settings_path: str | PathLike):
+    def __init__(self, storage: Storage):
         """
         Args:
-            decks_path: path to json holding all decks
-            settings_path: path to json holding settings
+            storage: where decks, settings and the review log are loaded from and saved to
         """
         super().__init__()
         pages_dict = {
@@ -46,23 +54,196 @@ class Clnki(App):
         self.pages.update(pages_dict)
         self.page = self.pages["home"]
 
-        self.decks_path = decks_path
-        self.settings_path = settings_path
+        self.storage = storage
+        # Syncing is left to the autosave thread, so that reviewing never waits for the disk.
+        self.journal = Journal(storage.journal_path, sync_every=None)
+        self.collection = CollectionCache(storage, self.journal)
+        # Held while the decks (and the journal) change, and while the autosave
+        # thread copies them. Writing to the storage happens without it.
+        self.lock = threading.RLock()
+        # Held while saving, so that the save is not taken for a change on disk.
+        self._saving = threading.Lock()
+        self.autosaver = Autosaver(self.save_changes, self.sync_journal)
         self.forwarded_days = 0
 
         self.decks = {}
+        # Cards by card_key across all decks, built when first needed, see collection_duplicates.
+        self._duplicates = None
         self.settings = default_setting_vals
+        self._saved_settings = None  # to tell whether settings need saving on quit
+        self.model = FSRSModel.from_settings(self.settings)
     
+    def schedule(self, decks=None):
+        """
+        Update today's review queues of decks (all decks by default).
+
+        Only queues affected by a change since the last call are recomputed.
+        """
+        return schedule_daily(self.decks if decks is None else decks,
+                              self.today,
+                              self.settings["cards_daily_limit"],
+                              self.settings["new_cards_per_day"],
+                              model=self.model,
+                              due_order=self.settings.get("due_order", "due_date"),
+                              new_order=self.settings.get("new_card_order", "insertion"))
+
+    def open_deck(self, deck_name):
+        """Load the cards of a deck if it was only summarized, and schedule it for today."""
+        deck = self.decks[deck_name]
+        if not deck.loaded:
+            with self.lock:
+                deck.load()
+            self.schedule({deck_name: deck})
+        return deck
+
+    def load_collection(self):
+        """
+        Load settings and decks, unless the ones in memory are up to date.
+
+        Returns: whether they were loaded
+        """
+        if not self._saving.acquire(blocking=False):
+            return False  # the files changing on disk are our own save
+        try:
+            if not self.collection.load():
+                return False
+        finally:
+            self._saving.release()
+
+        if self.collection.settings is not None:
+            self.settings = self.collection.settings
+            self._saved_settings = copy.deepcopy(self.settings)
+        self.model = FSRSModel.from_settings(self.settings)
+        with self.lock:
+            self.decks = self.collection.decks
+            self._duplicates = None  # of the decks loaded before
+        if self.journal.on_disk():
+            # Left over from a session that did not quit cleanly.
+            self.save_changes()
+        self.autosaver.start()
+        return True
+
+    def collection_duplicates(self) -> CollectionDuplicates:
+        """
+        The duplicate index of the whole collection, built on first use and
+        then kept up to date. Building it loads every deck that was only
+        summarized and computes the card_key of every card, as long as a full
+        load of the collection, which undoes lazy loading for the session. So
+        it is only asked for when cards are added.
+        """
+        with self.lock:
+            if self._duplicates is None:
+                self._duplicates = CollectionDuplicates(self.decks)
+            return self._duplicates
+
+    def add_deck(self, deck_name, deck):
+        with self.lock:
+            self.decks[deck_name] = deck
+            if self._duplicates is not None:
+                self._duplicates.attach(deck_name, deck)
+
+    def remove_deck(self, deck_name):
+        with self.lock:
+            self.decks.pop(deck_name)
+            if self._duplicates is not None:
+                self._duplicates.detach(deck_name)
+        self.autosaver.notify()
+
+    def journal_cards(self, deck_name, card_ids):
+        """Write the current state of the given cards to the journal, for the autosave to save."""
+        with self.lock:
+            cards = self.decks[deck_name].cards
+            for card_id in card_ids:
+                self.journal.append(deck_name, card_id, cards[card_id])
+        self.autosaver.notify(len(card_ids))
+
+    def sync_journal(self):
+        """Make the journaled changes durable. The fsync is done without holding the lock."""
+        with self.lock:
+            fd = self.journal.flush()
+        if fd is not None:
+            os.fsync(fd)
+
+    def save_changes(self):
+        """
+        Save the reviews and the decks changed since the last save, and drop
+        the journal lines they cover.
+
+        Copies of the changed decks are taken and the journal is moved aside
+        under self.lock, then everything that waits for the disk is done
+        without it, so reviews go on while the storage writes. If writing
+        fails, the decks are marked dirty again, the reviews not written go
+        back to their decks and the journal is kept, for the next save.
+        """
+        with self._saving:
+            with self.lock:
+                taken = self._take_review_log()
+                dirty = [deck_name for deck_name, deck in self.decks.items() if deck.dirty]
+                snapshot = self._deck_snapshot()
+                deck_names = list(self.decks)
+                self.journal.rotate()
+            try:
+                # The next save adds to it while it is there.
+                old_journal = self.journal.finish_rotate()
+                entries = [[deck_name] + entry for deck_name, deck_entries in taken.items()
+                           for entry in deck_entries]
+                if entries:
+                    self.storage.append_reviews(entries)
+                taken = {}
+                self.storage.update_decks(snapshot, deck_names)
+            except BaseException:
+                with self.lock:
+                    self._restore(taken, dirty)
+                raise
+            self.collection.saved()
+            if os.path.exists(old_journal):
+                os.remove(old_journal)
+
+    def _deck_snapshot(self):
+        """Copies of the cards of the dirty decks, to save. Clears the dirty flags."""
+        snapshot = {}
+        for deck_name, deck in self.decks.items():
+            if deck.dirty:
+                snapshot[deck_name] = deck.cards.copy()
+            deck.dirty = False
+        return snapshot
+
+    def _take_review_log(self):
+        """{deck_name: the review log entries made since the last call}, taken out of the decks."""
+        taken = {}
+        for deck_name, deck in self.decks.items():
+            if deck.review_log:
+                taken[deck_name] = deck.review_log
+                deck.review_log = []
+        return taken
+
+    def _restore(self, taken, dirty):
+        """Undo _take_review_log and _deck_snapshot after a failed save."""
+        for deck_name, entries in taken.items():
+            if deck_name in self.decks:
+                deck = self.decks[deck_name]
+                deck.review_log[:0] = entries  # before the ones made during the save
+        for deck_name in dirty:
+            if deck_name in self.decks:
+                self.decks[deck_name].dirty = True
+
     def on_quit(self):
-        # 1. Save decks
-        decks_dict = {deck_name: deck.cards for deck_name, deck in self.decks.items()}
-        to_json_date_handling(decks_dict)
-        with open(self.decks_path, 'w', encoding='utf-8') as f:
-            json.dump(decks_dict, f, indent=4)
-        
+        # 0. Let a save in progress finish, and stop saving in the background.
+        self.autosaver.stop()
+        if self.autosaver.error is not None:
+            print(f"Saving in the background failed ({self.autosaver.error!r}), saving again.")
+
+        # 1. Save reviews and decks, only the changed ones if the storage allows
+        self.save_changes()
+
         # 2. Save settings
-        with open(self.settings_path, 'w', encoding='utf-8') as f:
-            json.dump(self.settings, f, indent=4)
+        if self.settings != self._saved_settings:
+            self.storage.save_settings(self.settings)
+            self.collection.saved()
+
+        # 3. Everything in the journal is saved now.
+        self.journal.discard()
+        self.storage.close()
     
 
     def global_parser(self, raw_input: str):
@@ -87,5 +268,10 @@ class Clnki(App):
 
 
 if __name__ == "__main__":
-    clnki = Clnki("clnki\data\decks.json", "clnki\data\settings.json")
+    parser = argparse.ArgumentParser(prog="clnki")
+    add_storage_arguments(parser)
+    cli_args = parser.parse_args()
+
+    storage = open_storage(cli_args, os.path.join("clnki", "data"))
+    clnki = Clnki(storage)
     clnki.run()
\ No newline at end of file
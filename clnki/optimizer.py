@@ -0,0 +1,241 @@
+"""
+Fit the FSRS parameters to a review log.
+
+Each card's reviews are replayed with the candidate parameters: starting from
+the first review, stability and difficulty are updated review after review
+with the same formulas as clnki.fsrs (without rounding), and every later
+review says whether the card was remembered after that many days. The
+optimizer predicts that recall with the forgetting curve and minimizes the log
+loss with Adam over mini-batches of cards. Gradients come from central
+differences, computed for all parameters and the whole mini-batch in one
+NumPy expression per review step.
+
+A card whose first review is not in the log (reviewed before there was one)
+starts from the stability and difficulty logged with its earliest review,
+which came from the parameters of the time; from there on it is replayed too.
+The short-term stability parameters (w[17] to w[19]) are not used by the
+scheduler yet, so they are kept as given.
+
+Run from the repository root:
+    python -m clnki.optimizer --revlog clnki/data/revlog.jsonl --settings clnki/data/settings.json
+or, for a SQLite collection:
+    python -m clnki.optimizer --db clnki/data/clnki.db
+"""
+from clnki.fsrs import FSRS_PARAMETER_BOUNDS, FSRSModel
+from clnki.storage import JsonStorage, SqliteStorage
+import numpy as np
+import argparse
+import copy
+import os
+import time
+
+TRAINABLE = np.array([0, 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16, 20])
+
+# Keeps the replayed stability away from 0, where the scheduler's rounding would stop it too.
+MIN_STABILITY = 0.01
+
+
+def review_histories(entries):
+    """
+    Group the reviews by card, in the order they happened.
+
+    Args:
+        entries: [deck_name, card_id, review_date, elapsed_days, grade, recalled,
+                  stability, difficulty] in the order the reviews happened
+
+    Returns: a dict of arrays with one row per card, reviews padded to the
+             longest history: "grade", "elapsed" (days since the review before,
+             0 for a first review), "recalled" of shape (cards, reviews), and
+             "length", "first" (whether the history starts with the card's
+             first review), "s" and "d" (the state logged before the earliest
+             review) of shape (cards,)
+    """
+    histories = {}
+    for deck_name, card_id, _, elapsed_days, grade, recalled, s, d in entries:
+        history = histories.get((deck_name, card_id))
+        if history is None or elapsed_days is None:
+            # A first review starts the card over, even if it was reviewed before.
+            is_first = elapsed_days is None
+            history = histories[deck_name, card_id] = (
+                is_first, 1 if is_first else s, 1 if is_first else d, [])
+        history[3].append((grade, elapsed_days or 0, recalled))
+
+    n = len(histories)
+    longest = max((len(history[3]) for history in histories.values()), default=0)
+    reviews = np.zeros((n, longest, 3), dtype=np.float64)
+    for i, history in enumerate(histories.values()):
+        reviews[i, :len(history[3])] = history[3]
+    return {"grade": reviews[:, :, 0].astype(np.int64),
+            "elapsed": reviews[:, :, 1],
+            "recalled": reviews[:, :, 2],
+            "length": np.array([len(history[3]) for history in histories.values()], dtype=np.int64),
+            "first": np.array([history[0] for history in histories.values()], dtype=bool),
+            "s": np.array([history[1] for history in histories.values()], dtype=np.float64),
+            "d": np.array([history[2] for history in histories.values()], dtype=np.float64)}
+
+
+def num_predictions(histories) -> int:
+    """Reviews whose recall is predicted: all but the first review of each card."""
+    return int(np.sum(histories["length"] - histories["first"]))
+
+
+def predict(W, histories):
+    """
+    Replay every card's reviews with each parameter vector of W.
+
+    W holds one parameter vector per row. Same formulas as clnki.fsrs, without rounding.
+
+    Returns: (probability of recall at each review, mask of the reviews that
+             have one), of shape (len(W), cards, reviews) and (cards, reviews)
+    """
+    W = np.atleast_2d(W)
+
+    def col(i):
+        return W[:, i:i + 1]
+
+    decay = -col(20)
+    factor = 0.9 ** (1 / decay) - 1
+    grades, elapsed = histories["grade"], histories["elapsed"]
+    n, longest = grades.shape
+    steps = np.arange(longest)
+    mask = (steps < histories["length"][:, np.newaxis]) & \
+           ~((steps == 0) & histories["first"][:, np.newaxis])
+
+    def init_difficulty(grade):
+        return np.clip(col(4) - np.exp(col(5) * (grade - 1)) + 1, 1, 10)
+
+    s = np.broadcast_to(histories["s"], (len(W), n)).copy()
+    d = np.broadcast_to(histories["d"], (len(W), n)).copy()
+    p = np.ones((len(W), n, longest))
+    for step in steps:
+        grade = grades[:, step]
+        r = np.power(1 + factor * elapsed[:, step] / s, decay)
+        p[:, :, step] = r
+
+        hard_penalty = np.where(grade == 2, col(15), 1)
+        easy_bonus = np.where(grade == 4, col(16), 1)
+        s_recall = s * (1 + np.exp(col(8)) * (11 - d) * np.power(s, -col(9))
+                        * (np.exp(col(10) * (1 - r)) - 1) * hard_penalty * easy_bonus)
+        s_forget = np.minimum(col(11) * np.power(d, -col(12)) * (np.power(s + 1, col(13)) - 1)
+                              * np.exp(col(14) * (1 - r)), s)
+        next_s = np.where(grade < 2, s_forget, s_recall)
+        next_d = d + -col(6) * (grade - 3) * (10 - d) / 9
+        next_d = np.clip(col(7) * init_difficulty(3) + (1 - col(7)) * next_d, 1, 10)
+
+        if step == 0:
+            first = histories["first"]
+            next_s = np.where(first, np.maximum(W[:, grade - 1], 0.1), next_s)
+            next_d = np.where(first, init_difficulty(grade), next_d)
+        # Padding after a card's last review leaves its state as it is.
+        active = step < histories["length"]
+        s = np.where(active, np.maximum(next_s, MIN_STABILITY), s)
+        d = np.where(active, next_d, d)
+    return p, mask
+
+
+def log_loss(W, histories):
+    p, mask = predict(W, histories)
+    p = np.clip(p, 1e-7, 1 - 1e-7)
+    y = histories["recalled"]
+    losses = np.where(mask, y * np.log(p) + (1 - y) * np.log(1 - p), 0)
+    return -losses.sum(axis=(-2, -1)) / max(mask.sum(), 1)
+
+
+def gradient(w, histories, eps=1e-5):
+    """d log_loss / d w[TRAINABLE], all central differences in one batch."""
+    k = len(TRAINABLE)
+    W = np.repeat(w[np.newaxis, :], 2 * k, axis=0)
+    W[np.arange(k), TRAINABLE] += eps
+    W[np.arange(k, 2 * k), TRAINABLE] -= eps
+    losses = log_loss(W, histories)
+    return (losses[:k] - losses[k:]) / (2 * eps)
+
+
+def optimize(histories, w, epochs=5, batch_size=512, lr=0.02, seed=0):
+    """
+    Fit w to the review histories with Adam.
+
+    Args:
+        histories: from review_histories()
+        w: the 21 parameters to start from
+        epochs: passes over all cards
+        batch_size: cards per gradient step
+
+    Returns: the fitted 21 parameters as a list
+    """
+    if num_predictions(histories) == 0:
+        raise ValueError("The review log has no card reviewed twice, nothing to fit.")
+    n = len(histories["length"])
+
+    w = np.array(w, dtype=np.float64)
+    lower, upper = np.array(FSRS_PARAMETER_BOUNDS).T
+    rng = np.random.default_rng(seed)
+    beta1, beta2 = 0.9, 0.999
+    m = np.zeros(len(TRAINABLE))
+    v = np.zeros(len(TRAINABLE))
+    step = 0
+
+    for _ in range(epochs):
+        order = rng.permutation(n)
+        for start in range(0, n, batch_size):
+            batch_ids = order[start:start + batch_size]
+            batch = {field: values[batch_ids] for field, values in histories.items()}
+            longest = batch["length"].max()
+            for field in ("grade", "elapsed", "recalled"):
+                batch[field] = batch[field][:, :longest]
+
+            grad = gradient(w, batch)
+            step += 1
+            m = beta1 * m + (1 - beta1) * grad
+            v = beta2 * v + (1 - beta2) * grad ** 2
+            m_hat = m / (1 - beta1 ** step)
+            v_hat = v / (1 - beta2 ** step)
+            w[TRAINABLE] -= lr * m_hat / (np.sqrt(v_hat) + 1e-8)
+            np.clip(w, lower, upper, out=w)
+
+    return [round(x, 4) for x in w.tolist()]
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="clnki.optimizer",
+                                     description="Fit the FSRS parameters to a review log "
+                                                 "and save them in the settings.")
+    parser.add_argument("--revlog", default="clnki/data/revlog.jsonl")
+    parser.add_argument("--settings", default="clnki/data/settings.json")
+    parser.add_argument("--db", help="Read and save a SQLite collection instead of json files.")
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=512, help="Cards per step.")
+    parser.add_argument("--lr", type=float, default=0.02)
+    args = parser.parse_args()
+
+    if args.db:
+        storage = SqliteStorage(args.db)
+    else:
+        storage = JsonStorage(os.path.join(os.path.dirname(args.settings), "decks.json"),
+                              args.settings, args.revlog)
+    settings = storage.load_settings()
+    if settings is None:
+        # Nothing saved yet: start from the defaults the app uses.
+        from clnki.main import default_setting_vals
+        settings = copy.deepcopy(default_setting_vals)
+
+    start = time.perf_counter()
+    histories = review_histories(storage.iter_reviews())
+    print(f"Loaded {len(histories['length'])} cards with {num_predictions(histories)} "
+          f"reviews to predict in {time.perf_counter() - start:.1f}s.")
+
+    start = time.perf_counter()
+    fitted = optimize(histories, settings["fsrs"], args.epochs, args.batch_size, args.lr)
+    print(f"Fitted in {time.perf_counter() - start:.1f}s. "
+          f"Log loss {log_loss(np.array(settings['fsrs']), histories)[0]:.4f} "
+          f"-> {log_loss(np.array(fitted), histories)[0]:.4f}")
+
+    FSRSModel(fitted, settings["fsrs_desired_R"])  # raises if fitting went out of bounds
+    settings["fsrs"] = fitted
+    storage.save_settings(settings)
+    storage.close()
+    print(f"Saved the fitted parameters to {args.db or args.settings}.")
+
+
+if __name__ == "__main__":
+    main()
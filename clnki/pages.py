@@ -1,9 +1,9 @@
 from clnki.base import Page, App, Navigate
-from clnki.schedule import schedule_daily
-from clnki.deck import Deck, from_json_date_handling, to_json_date_handling
+from clnki.schedule import DUE_ORDERS
+from clnki.deck import NEW_CARD_ORDERS
+from clnki.fsrs import FSRSModel
 import argparse
 import shlex
-import json
 from tabulate import tabulate
 from datetime import date, timedelta
 import time
@@ -26,27 +26,15 @@ class HomePage(Page):
         super().__init__(app)
 
     def on_mount(self):
-        with open(self.app.settings_path, 'r', encoding='utf-8') as f:
-            # TODO: Have a default in case the file is empty.
-            self.app.settings = json.load(f)
-        
-        with open(self.app.decks_path, 'r', encoding='utf-8') as f:
-            decks_json = json.load(f)
-        
-        from_json_date_handling(decks_json)
-        for deck_name, cards in decks_json.items():
-            self.app.decks[deck_name] = Deck(cards)
-        
-        today = date.today() + timedelta(days=self.app.forwarded_days)
-        if (getattr(self.app, "today", None) is None) or (self.app.today != today):
-            self.app.today = today
-            schedule_daily(self.app.decks, 
-                           today, 
-                           self.app.settings["cards_daily_limit"],
-                           self.app.settings["new_cards_per_day"])
+        # Only read the files again if they changed on disk since they were loaded.
+        self.app.load_collection()
+
+        self.app.today = date.today() + timedelta(days=self.app.forwarded_days)
+        # Decks already scheduled for today with these settings are left as they are.
+        self.app.schedule()
 
     def render(self):
-        deck_list = [[deck_name, len(deck.cards), deck.num_due] 
+        deck_list = [[deck_name, deck.total, deck.num_due] 
                      for deck_name, deck in self.app.decks.items()]
 
         deck_table = tabulate(deck_list, headers=["Deck", "Total", "Due"])
@@ -102,10 +90,13 @@ Options:
 class SettingsPage(Page):
 
     __parser = argparse.ArgumentParser(prog="Settings", exit_on_error=False)
-    __parser.add_argument("--fsrs", type=float, nargs=17)
+    __parser.add_argument("--fsrs", type=float, nargs=21)
     __parser.add_argument("--fsrs-desired-R", type=float)
     __parser.add_argument("--new-cards-per-day", type=int)
     __parser.add_argument("--cards-daily-limit", type=int)
+    __parser.add_argument("--due-order", choices=DUE_ORDERS)
+    __parser.add_argument("--new-card-order", choices=NEW_CARD_ORDERS)
+    __parser.add_argument("--load-balance", choices=("on", "off"))
     __parser.add_argument("--default", action="store_true")
 
     default_fsrs = [0.212, 1.2931, 2.3065, 8.2956, 6.4133,  
@@ -117,7 +108,10 @@ class SettingsPage(Page):
     default_setting_vals = {"fsrs": default_fsrs,
                         "fsrs_desired_R": 0.9,
                         "new_cards_per_day": 4,
-                        "cards_daily_limit": 25
+                        "cards_daily_limit": 25,
+                        "due_order": "due_date",
+                        "new_card_order": "insertion",
+                        "load_balance": True
                         }
 
 
@@ -130,7 +124,10 @@ Current settings:
   fsrs: {self.app.settings.get("fsrs")}
   fsrs-desired-R: {self.app.settings.get("fsrs_desired_R")}
   new-cards-per-day: {self.app.settings.get("new_cards_per_day")}
-  cards-daily-limit: {self.app.settings.get("cards_daily_limit")}"""
+  cards-daily-limit: {self.app.settings.get("cards_daily_limit")}
+  due-order: {self.app.settings.get("due_order", "due_date")}
+  new-card-order: {self.app.settings.get("new_card_order", "insertion")}
+  load-balance: {"on" if self.app.settings.get("load_balance", True) else "off"}"""
         
         # Should this be tabulated for readability?
         setting_options_msg = """
@@ -141,6 +138,11 @@ Options:
                           one day exceeds this value.
     --new-cards-per-day 5: The number of new cards to be scheduled for review per day.
     --cards-daily-limit 25: The maximum number of cards to be reviewed per day.
+    --due-order due_date: Which due cards to review first when more than the daily limit are due.
+                          due_date: most overdue first. retrievability: lowest recall probability first.
+    --new-card-order insertion: The order new cards are learned in: insertion (order of creation),
+                                random, or priority (cards' "priority" field, lowest first).
+    --load-balance on: Spread reviews by moving each due date to the least busy day nearby.
     --default: Revert all settings to default."""
 
         print(setting_values_msg + "\n" + setting_options_msg)
@@ -149,15 +151,22 @@ Options:
         user_input = input("\n> ")
         args = self.argparser(user_input.strip())
 
+        if args is None:
+            print("Invalid input. No setting has been updated.")
+            time.sleep(2)
+            return self.app.pages["home"], {}
+
         is_state_changed = False
 
         if args.fsrs:
             fsrs_vals = args.fsrs
-            if True:  # TODO: FSRS parameter validity check
+            try:
+                FSRSModel(fsrs_vals, self.app.settings["fsrs_desired_R"])
+            except ValueError as e:
+                print(f"Invalid input. FSRS parameter conditions not satisfied: {e}")
+            else:
                 self.app.settings["fsrs"] = fsrs_vals
                 is_state_changed = True
-            else:
-                print("Invalid input. FSRS parameter conditions not satisfied.")
 
         if args.fsrs_desired_R:
             fsrs_desired_R = args.fsrs_desired_R
@@ -186,15 +195,25 @@ Options:
             else:
                 print("Invalid input. cards-daily-limit must be positive")
 
+        if args.due_order:
+            self.app.settings["due_order"] = args.due_order
+            is_state_changed = True
+
+        if args.new_card_order:
+            self.app.settings["new_card_order"] = args.new_card_order
+            is_state_changed = True
+
+        if args.load_balance:
+            self.app.settings["load_balance"] = args.load_balance == "on"
+            is_state_changed = True
+
         if args.default:
-            setting_vals = self.default_setting_vals.copy() 
+            self.app.settings = self.default_setting_vals.copy() 
             is_state_changed = True
   
         if is_state_changed:
-            schedule_daily(self.app.decks, 
-                           date.today(), 
-                           self.app.settings["cards_daily_limit"],
-                           self.app.settings["new_cards_per_day"])
+            self.app.model = FSRSModel.from_settings(self.app.settings)
+            self.app.schedule()
             print("Settings updated. The review schedule may have changed.")
         else:
             print("No setting has been updated.")
@@ -204,7 +223,7 @@ Options:
         return self.app.pages["home"], {}
     
     @Page.global_parser
-    def argparser(self):
+    def argparser(self, raw_input: str):
         if raw_input is None:
             raw_input = ""
         input_as_shell = shlex.split(raw_input)
@@ -231,14 +250,14 @@ class RemoveDeckPage(Page):
     
     def render(self):
         print(f"Are you sure you want to delete deck {self.deck} \
-with all its {len(self.app.decks[self.deck]['cards'])} cards? (Y/N)")
+with all its {self.app.decks[self.deck].total} cards? (Y/N)")
 
     def next_page(self):
         user_input = input("\n> ")
         self.argparser(user_input.strip())
 
         if user_input == "Y":
-            self.app.decks.pop(self.deck)
+            self.app.remove_deck(self.deck)
             print(f"Deck {self.deck} is removed.")
         elif user_input == "N":
             print("Removal cancelled.")
@@ -1,30 +1,28 @@
 from clnki.deck import Deck
+from clnki.fsrs import FSRSModel
 from datetime import date
 
-def schedule_daily(decks: list[Deck], today: date, cards_daily_limit: int, new_cards_per_day: int):
-    # 1. Select due cards first
-    for deck in decks.values():
-        due_cards = []
-        for card_id in deck.cards:
-            if len(due_cards) == cards_daily_limit:
-                break
-      
-        # Ignore new cards for now
-        if deck.cards[card_id].get("due_date") is None:
-            continue
-      
-        if deck.cards[card_id].get("due_date") <= today:
-            due_cards.append(card_id)
+# Which due cards go first when more are due than cards_daily_limit allows.
+DUE_ORDERS = ("due_date", "retrievability")
 
-    # Add new cards
-    for deck in decks.values():
-        new_card_count = 0
-        new_cards = []
-        for card_id in deck.cards:
-            if deck.cards[card_id]["is_new"]:
-                new_cards.append(card_id)
-                new_card_count += 1
-            if new_card_count == new_cards_per_day:
-                break
+def schedule_daily(decks: dict[str, Deck], today: date, cards_daily_limit: int, new_cards_per_day: int,
+                   model: FSRSModel | None = None, due_order: str = "due_date",
+                   new_order: str = "insertion"):
+    """
+    Bring every deck's queues for today up to date.
 
-    deck.update_due(due_cards + new_cards)
\ No newline at end of file
+    Each deck only recomputes the queues whose inputs changed since its last
+    schedule (see Deck.schedule), so calling this again with the same arguments
+    is cheap.
+
+    Args:
+        model: needed for due_order "retrievability"
+        due_order: "due_date" takes the most overdue cards first,
+                   "retrievability" the cards with the lowest R today
+        new_order: one of NEW_CARD_ORDERS, see NewCardQueue
+
+    Returns: names of the decks whose queues were recomputed
+    """
+    return [deck_name for deck_name, deck in decks.items()
+            if deck.schedule(today, cards_daily_limit, new_cards_per_day, model, due_order,
+                             new_order)]
@@ -0,0 +1,84 @@
+"""
+Full-text search over the cards of a deck.
+
+SearchIndex is an inverted index: token -> card_id's whose front or back has
+it, plus the tokens in sorted order, so that a prefix is a range of them
+found by bisection. Every Deck builds one on its first search (see
+Deck.search_index) and keeps it up to date as cards are added, removed or
+edited, so a search costs the size of its answer, not a scan of the deck.
+"""
+import bisect
+import heapq
+import re
+
+_TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> set[str]:
+    """The distinct words of text, case folded."""
+    return set(_TOKEN.findall(text.casefold()))
+
+
+class SearchIndex:
+    def __init__(self):
+        self._postings = {}  # token -> {card_id: None}, a dict as an ordered set
+        self._tokens = []  # the keys of _postings, sorted
+
+    def add(self, card_id, front: str, back: str):
+        for token in tokenize(front) | tokenize(back):
+            posting = self._postings.get(token)
+            if posting is None:
+                posting = self._postings[token] = {}
+                bisect.insort(self._tokens, token)
+            posting[card_id] = None
+
+    def add_many(self, cards):
+        """
+        add each (card_id, front, back) of cards. The new tokens are sorted
+        into _tokens all at once, as inserting them one by one is quadratic.
+        """
+        new_tokens = []
+        for card_id, front, back in cards:
+            for token in tokenize(front) | tokenize(back):
+                posting = self._postings.get(token)
+                if posting is None:
+                    posting = self._postings[token] = {}
+                    new_tokens.append(token)
+                posting[card_id] = None
+        if new_tokens:
+            new_tokens.sort()
+            self._tokens = list(heapq.merge(self._tokens, new_tokens))
+
+    def remove(self, card_id, front: str, back: str):
+        """Forget a card, given the text it was added with."""
+        for token in tokenize(front) | tokenize(back):
+            posting = self._postings[token]
+            del posting[card_id]
+            if not posting:
+                del self._postings[token]
+                del self._tokens[bisect.bisect_left(self._tokens, token)]
+
+    def prefix_matches(self, prefix: str) -> set:
+        """card_id's with a word starting with prefix (case folded)."""
+        start = bisect.bisect_left(self._tokens, prefix)
+        # Every token starting with prefix sorts before prefix + the last code point.
+        end = bisect.bisect_left(self._tokens, prefix + "\U0010ffff", start)
+        matches = set()
+        for token in self._tokens[start:end]:
+            matches.update(self._postings[token])
+        return matches
+
+    def search(self, query: str) -> set:
+        """
+        card_id's matching every word of query, each word as a prefix:
+        "cap fra" finds a card with "capital" and "France".
+        """
+        words = sorted(tokenize(query), key=len, reverse=True)  # most selective first
+        if not words:
+            return set()
+        matches = self.prefix_matches(words[0])
+        for word in words[1:]:
+            if not matches:
+                break
+            matches &= self.prefix_matches(word)
+        return matches
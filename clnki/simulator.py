@@ -0,0 +1,201 @@
+"""
+Simulate daily workload and retention for a set of scheduling settings.
+
+A simulated deck of new cards goes through the app's own scheduling, one day
+at a time: schedule_daily fills the deck's queues for the day with the
+settings' limits, due_order and new_card_order, every card in them is recalled
+with the probability given by the forgetting curve, and Deck.review schedules
+it again, load balancing included if the settings ask for it. As in
+CardReviewPage, a card answered Again is shown once more in the session and
+passed with Easy. Each Monte Carlo run is independent, so runs are spread over
+a process pool.
+
+Run from the repository root:
+    python -m clnki.simulator --settings clnki/data/settings.json --sweep
+"""
+from clnki.cardstore import to_day
+from clnki.deck import Deck
+from clnki.fsrs import FSRSModel
+from clnki.schedule import schedule_daily
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from tabulate import tabulate
+import numpy as np
+import argparse
+import json
+import math
+
+# How often a recalled card is answered Hard, Easy or Very Easy.
+RECALL_GRADE_PROBS = {2: 0.15, 3: 0.75, 4: 0.10}
+# How often a new card is answered Again the first time it is shown.
+NEW_AGAIN_PROB = 0.2
+# The grade a card answered Again is finally passed with in the session.
+LAPSE_PASS_GRADE = 3
+
+# The first simulated day. Only differences between days matter.
+START = date(2000, 1, 1)
+
+
+def simulate(settings, n_cards=2000, days=365, seed=0):
+    """
+    One Monte Carlo run.
+
+    Returns: a dict of per-day arrays
+        reviews: cards shown that day, repetitions of lapsed cards included
+        recalled: due (not new) cards remembered that day
+        due_reviewed: due (not new) cards shown that day
+        and remembered, the expected number of learned cards recalled on the last day
+    """
+    model = FSRSModel.from_settings(settings)
+    limit = settings["cards_daily_limit"]
+    new_per_day = settings["new_cards_per_day"]
+    due_order = settings.get("due_order", "due_date")
+    new_order = settings.get("new_card_order", "insertion")
+    load_balance = settings.get("load_balance", True)
+    rng = np.random.default_rng(seed)
+    grades, grade_probs = zip(*RECALL_GRADE_PROBS.items())
+
+    deck = Deck(new_order=new_order)
+    deck.add_cards([(f"card {i}", "") for i in range(n_cards)])
+    cards = deck.cards
+
+    reviews = np.zeros(days, dtype=np.int64)
+    recalled = np.zeros(days, dtype=np.int64)
+    due_reviewed = np.zeros(days, dtype=np.int64)
+
+    for day in range(days):
+        today = START + timedelta(days=day)
+        today_day = to_day(today)
+        schedule_daily({"simulated": deck}, today, limit, new_per_day, model=model,
+                       due_order=due_order, new_order=new_order)
+        # Copies, since reviewing takes the cards out of the queues.
+        due_ids, new_ids = list(deck.due_reviews), list(deck.due_new)
+
+        draws = rng.random(len(due_ids))
+        recall_grades = rng.choice(grades, len(due_ids), p=grade_probs).tolist()
+        for card_id, draw, grade in zip(due_ids, draws.tolist(), recall_grades):
+            card = cards[card_id]
+            r = model.forgetting_curve(today_day - card["last_review_date"], card["stability"])
+            remembered = draw < r
+            deck.review(card_id, grade if remembered else LAPSE_PASS_GRADE, model, today,
+                        recalled=remembered, load_balance=load_balance)
+            recalled[day] += remembered
+            reviews[day] += 1 if remembered else 2
+        due_reviewed[day] = len(due_ids)
+
+        # New cards have nothing to recall, the first answer is Again or a pass.
+        first_grades = rng.choice((1,) + grades, len(new_ids), p=(NEW_AGAIN_PROB,) + tuple(
+            (1 - NEW_AGAIN_PROB) * p for p in grade_probs)).tolist()
+        for card_id, grade in zip(new_ids, first_grades):
+            deck.review(card_id, LAPSE_PASS_GRADE if grade == 1 else grade, model, today,
+                        recalled=grade > 1, load_balance=load_balance)
+            reviews[day] += 2 if grade == 1 else 1
+        deck.review_log.clear()  # not needed, and it would only grow
+
+    learned = np.frombuffer(cards.is_new, dtype=np.int8) == 0
+    last_review = np.frombuffer(cards.last_review, dtype=np.int32)[learned]
+    stability = np.frombuffer(cards.stability, dtype=np.float64)[learned]
+    remembered = model.forgetting_curve_batch(to_day(START) + days - last_review, stability).sum()
+    return {"reviews": reviews, "recalled": recalled, "due_reviewed": due_reviewed,
+            "remembered": remembered}
+
+
+def _simulate_job(job):
+    return simulate(*job)
+
+
+def monte_carlo(settings_list, runs=8, n_cards=2000, days=365, max_workers=None):
+    """
+    Average `runs` simulations for every settings dict in settings_list.
+
+    All runs of all settings go to one process pool. Run i of every settings dict
+    uses seed i, so differences between settings are not just sampling noise.
+
+    Returns: one summary dict per settings dict (see summarize)
+    """
+    jobs = [(settings, n_cards, days, seed) for settings in settings_list for seed in range(runs)]
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(_simulate_job, jobs))
+
+    return [summarize(results[i * runs:(i + 1) * runs]) for i in range(len(settings_list))]
+
+
+def summarize(results):
+    reviews = np.mean([res["reviews"] for res in results], axis=0)
+    recalled = np.sum([res["recalled"] for res in results], axis=0)
+    due_reviewed = np.sum([res["due_reviewed"] for res in results], axis=0)
+    remembered = np.mean([res["remembered"] for res in results])
+    return {
+        "reviews_per_day": reviews,
+        "retention_per_day": np.divide(recalled, due_reviewed, out=np.full(len(recalled), np.nan),
+                                       where=due_reviewed > 0),
+        "retention": recalled.sum() / max(due_reviewed.sum(), 1),
+        "remembered": remembered,
+        "reviews_per_remembered": reviews.sum() / remembered if remembered else math.inf,
+    }
+
+
+def best_desired_r(settings, candidates, **kwargs):
+    """
+    The desired R among candidates with the fewest reviews per remembered card.
+
+    Returns: (best desired R, list of summaries in the order of candidates)
+    """
+    settings_list = [dict(settings, fsrs_desired_R=r) for r in candidates]
+    summaries = monte_carlo(settings_list, **kwargs)
+    best = min(range(len(candidates)), key=lambda i: summaries[i]["reviews_per_remembered"])
+    return candidates[best], summaries
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="clnki.simulator",
+                                     description="Simulate review load and retention.")
+    parser.add_argument("--settings", default="clnki/data/settings.json")
+    parser.add_argument("--fsrs-desired-R", type=float)
+    parser.add_argument("--new-cards-per-day", type=int)
+    parser.add_argument("--cards-daily-limit", type=int)
+    parser.add_argument("--cards", type=int, default=2000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--runs", type=int, default=8)
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--sweep", action="store_true",
+                        help="Also search for the desired R with the least work per remembered card.")
+    args = parser.parse_args()
+
+    with open(args.settings, 'r', encoding='utf-8') as f:
+        settings = json.load(f)
+    for key in ("fsrs_desired_R", "new_cards_per_day", "cards_daily_limit"):
+        if getattr(args, key) is not None:
+            settings[key] = getattr(args, key)
+
+    kwargs = {"runs": args.runs, "n_cards": args.cards, "days": args.days,
+              "max_workers": args.workers}
+    summary = monte_carlo([settings], **kwargs)[0]
+
+    rows = []
+    for start in range(0, args.days, 30):
+        end = min(start + 30, args.days)
+        rows.append([f"{start + 1}-{end}",
+                     f"{summary['reviews_per_day'][start:end].mean():.1f}",
+                     f"{np.nanmean(summary['retention_per_day'][start:end]):.3f}"
+                     if np.any(~np.isnan(summary['retention_per_day'][start:end])) else "-"])
+    print(f"desired R {settings['fsrs_desired_R']}, {settings['new_cards_per_day']} new cards/day, "
+          f"limit {settings['cards_daily_limit']}, {args.cards} cards, {args.runs} runs")
+    print(tabulate(rows, headers=["Days", "Reviews/day", "Retention"]))
+    print(f"Overall retention {summary['retention']:.3f}, "
+          f"{summary['reviews_per_remembered']:.2f} reviews per remembered card.")
+
+    if args.sweep:
+        candidates = [round(r, 2) for r in np.arange(0.70, 0.971, 0.01)]
+        best, summaries = best_desired_r(settings, candidates, **kwargs)
+        rows = [[r, f"{summ['reviews_per_day'].mean():.1f}", f"{summ['retention']:.3f}",
+                 f"{summ['reviews_per_remembered']:.2f}"]
+                for r, summ in zip(candidates, summaries)]
+        print()
+        print(tabulate(rows, headers=["Desired R", "Reviews/day", "Retention",
+                                      "Reviews/remembered"]))
+        print(f"Least work per remembered card at desired R = {best}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+"""
+Binary snapshot of the decks, opened with mmap instead of parsed.
+
+Layout of the file, little-endian:
+
+    HEADER              magic, format version, offset and length of the directory
+    per deck, each section padded to 8 bytes:
+        records         one RECORD per card: the scheduling fields, as in CardStore's columns
+        text offsets    3 * count + 1 uint64, where card i's id, front and back are
+                        blob[offsets[3i]:offsets[3i+1]], [3i+1:3i+2] and [3i+2:3i+3]
+        blob            the utf-8 text
+    directory           json, {"decks": [{"name", "count", "records", "offsets", "blob",
+                                              "summary"}]}, summary as in clnki.cardstore.summarize
+
+Opening a snapshot reads the header and the directory. load_deck copies a
+deck's records into CardStore columns and decodes its card ids, but front and
+back stay bytes in the mapped file (MappedTexts) until a card is shown, so
+counting cards and due cards decodes no text. The summaries in the directory
+tell the same without reading the records at all.
+"""
+from clnki.cardstore import CardStore, NO_DAY
+from array import array
+from os import PathLike
+import json
+import mmap
+import numpy as np
+import os
+import struct
+import sys
+
+MAGIC = b"CLNKSNAP"
+VERSION = 1
+
+HEADER = struct.Struct("<8sIQQ")  # magic, version, directory offset, directory length
+
+RECORD = np.dtype([("is_new", "<i1"), ("stability", "<f8"), ("difficulty", "<f8"),
+                   ("due", "<i4"), ("last_review", "<i4"), ("priority", "<i8")])
+
+_COLUMNS = {"is_new": "b", "stability": "d", "difficulty": "d", "due": "i",
+            "last_review": "i", "priority": "q"}
+
+_TEXT_ID, _TEXT_FRONT, _TEXT_BACK = range(3)
+
+
+class MappedTexts:
+    """
+    The fronts or backs of a deck, as a list that decodes an item when it is read.
+
+    Items stay in the mapped file until they are set; set and appended items
+    are kept in memory.
+    """
+
+    __slots__ = ("_buf", "_offsets", "_field", "_count", "_changed", "_appended")
+
+    def __init__(self, buf, offsets, field: int, count: int):
+        """
+        Args:
+            buf: the deck's blob, a memoryview of the mapped file
+            offsets: the deck's text offsets, relative to buf
+            field: _TEXT_FRONT or _TEXT_BACK
+            count: cards in the snapshot
+        """
+        self._buf = buf
+        self._offsets = offsets
+        self._field = field
+        self._count = count
+        self._changed = {}  # row -> str, for rows of the snapshot set since
+        self._appended = []
+
+    def raw(self, row: int) -> bytes | None:
+        """The utf-8 bytes of an item still as in the snapshot, else None."""
+        if row >= self._count or row in self._changed:
+            return None
+        k = 3 * row + self._field
+        return self._buf[self._offsets[k]:self._offsets[k + 1]]
+
+    def __getitem__(self, row: int) -> str:
+        if row >= self._count:
+            return self._appended[row - self._count]
+        if row in self._changed:
+            return self._changed[row]
+        return str(self.raw(row), "utf-8")
+
+    def __setitem__(self, row: int, value: str):
+        if row >= self._count:
+            self._appended[row - self._count] = value
+        else:
+            self._changed[row] = value
+
+    def append(self, value: str):
+        self._appended.append(value)
+
+    def extend(self, values):
+        self._appended.extend(values)
+
+    def __len__(self):
+        return self._count + len(self._appended)
+
+    def __iter__(self):
+        return (self[row] for row in range(len(self)))
+
+    def copy(self):
+        texts = MappedTexts(self._buf, self._offsets, self._field, self._count)
+        texts._changed = self._changed.copy()
+        texts._appended = self._appended.copy()
+        return texts
+
+
+def _pad(f):
+    f.write(b"\0" * (-f.tell() % 8))
+
+
+def _text_bytes(texts, row):
+    raw = texts.raw(row) if isinstance(texts, MappedTexts) else None
+    return raw if raw is not None else texts[row].encode("utf-8")
+
+
+def _unchanged_runs(cards):
+    """
+    (start, stop) of the runs of rows whose id, front and back are all still
+    as in the snapshot cards was loaded from, so their text can be copied in one piece.
+    """
+    front, back = cards.front, cards.back
+    if not (isinstance(front, MappedTexts) and isinstance(back, MappedTexts)
+            and front._buf is back._buf):
+        return []
+    # Rows are never reused, so the rows of the snapshot still have their ids.
+    changed = sorted(front._changed.keys() | back._changed.keys())
+    runs = []
+    start = 0
+    for row in changed + [front._count]:
+        if row > start:
+            runs.append((start, row))
+        start = row + 1
+    return runs
+
+
+def _write_texts(f, cards):
+    """Write the text offsets and the blob of cards, returns their positions."""
+    offsets = []  # arrays of offsets, each for some rows
+    chunks = []
+    position = 0
+    done = 0  # rows written
+    runs = _unchanged_runs(cards) + [(len(cards.ids), len(cards.ids))]
+    for start, stop in runs:
+        # The rows before the run one by one, then the run in one piece.
+        single = []
+        for row in range(done, start):
+            for text in (cards.ids[row].encode("utf-8"), _text_bytes(cards.front, row),
+                         _text_bytes(cards.back, row)):
+                single.append(position)
+                chunks.append(text)
+                position += len(text)
+        offsets.append(np.array(single, dtype=np.uint64))
+        if stop > start:
+            mapped = np.frombuffer(cards.front._offsets, dtype=np.uint64)
+            low, high = int(mapped[3 * start]), int(mapped[3 * stop])
+            offsets.append(mapped[3 * start:3 * stop] - np.uint64(low) + np.uint64(position))
+            chunks.append(cards.front._buf[low:high])
+            position += high - low
+        done = stop
+    offsets.append(np.array([position], dtype=np.uint64))
+
+    _pad(f)
+    offsets_at = f.tell()
+    f.write(np.concatenate(offsets).astype("<u8").tobytes())
+    blob_at = f.tell()
+    f.writelines(chunks)
+    return offsets_at, blob_at
+
+
+def _write_deck(f, cards) -> dict:
+    if not isinstance(cards, CardStore):
+        cards = CardStore(cards)
+    elif len(cards.rows) < len(cards.ids):
+        cards = cards.copy()  # without the deleted rows
+    count = len(cards.ids)
+    entry = {"count": count}
+
+    _pad(f)
+    entry["records"] = f.tell()
+    records = np.empty(count, dtype=RECORD)
+    for column, typecode in _COLUMNS.items():
+        records[column] = np.frombuffer(getattr(cards, column), dtype=typecode)
+    f.write(records.tobytes())
+    days, counts = np.unique(records["due"][records["due"] != NO_DAY], return_counts=True)
+    entry["summary"] = {"total": count, "new": int(np.count_nonzero(records["is_new"])),
+                        "due": [[day, n] for day, n in zip(days.tolist(), counts.tolist())]}
+
+    entry["offsets"], entry["blob"] = _write_texts(f, cards)
+    return entry
+
+
+def write_snapshot(f, decks: dict, base: "Snapshot | None" = None):
+    """
+    Write decks, {deck_name: cards}, to f, a binary file open for writing at its start.
+
+    Text still mapped from an older snapshot is copied over as bytes, without decoding it.
+
+    Args:
+        base: a snapshot to copy the decks whose cards are None from, as they are there
+    """
+    f.write(HEADER.pack(MAGIC, VERSION, 0, 0))
+    directory = []
+    for deck_name, cards in decks.items():
+        entry = _write_deck(f, cards) if cards is not None else base.copy_deck(f, deck_name)
+        directory.append({"name": deck_name, **entry})
+    data = json.dumps({"decks": directory}).encode("utf-8")
+    directory_offset = f.tell()
+    f.write(data)
+    f.seek(0)
+    f.write(HEADER.pack(MAGIC, VERSION, directory_offset, len(data)))
+
+
+class Snapshot:
+    """A snapshot file mapped into memory, read deck by deck."""
+
+    def __init__(self, path: str | PathLike):
+        self.path = os.fspath(path)
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buf = memoryview(self._mmap)
+        magic, version, directory_offset, directory_length = HEADER.unpack_from(self._buf)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{os.fspath(path)} is not a clnki snapshot of version {VERSION}.")
+        directory = json.loads(bytes(self._buf[directory_offset:directory_offset + directory_length]))
+        self._decks = {entry["name"]: entry for entry in directory["decks"]}
+
+    def close(self):
+        """
+        Unmap the file. Raises BufferError while cards loaded from it still
+        read their text from it; then call again once they are gone.
+        """
+        self._buf.release()
+        self._mmap.close()
+
+    def deck_names(self) -> list[str]:
+        return list(self._decks)
+
+    def _records(self, deck_name):
+        entry = self._decks[deck_name]
+        return np.frombuffer(self._buf, dtype=RECORD, count=entry["count"], offset=entry["records"])
+
+    def _offsets(self, deck_name):
+        """The deck's text offsets, read as plain ints (not numpy scalars) when indexed."""
+        entry = self._decks[deck_name]
+        data = self._buf[entry["offsets"]:entry["offsets"] + 8 * (3 * entry["count"] + 1)]
+        if sys.byteorder == "little":
+            return data.cast("Q")  # no copy
+        offsets = array("Q")
+        offsets.frombytes(data)
+        offsets.byteswap()
+        return offsets
+
+    def copy_deck(self, f, deck_name: str) -> dict:
+        """Write a deck's sections to f as they are, without reading them. Returns its directory entry."""
+        entry = self._decks[deck_name]
+        count = entry["count"]
+        blob_length = self._offsets(deck_name)[-1]
+        copied = {"count": count, "summary": entry["summary"]}
+        for section, length in (("records", count * RECORD.itemsize),
+                                ("offsets", 8 * (3 * count + 1)),
+                                ("blob", blob_length)):
+            if section != "blob":  # the blob follows the offsets unpadded, as _write_deck does
+                _pad(f)
+            copied[section] = f.tell()
+            f.write(self._buf[entry[section]:entry[section] + length])
+        return copied
+
+    def summaries(self) -> dict[str, dict]:
+        """{deck_name: summary}, as clnki.cardstore.summarize, from the directory."""
+        return {deck_name: entry["summary"] for deck_name, entry in self._decks.items()}
+
+    def load_deck(self, deck_name: str) -> CardStore:
+        """The cards of a deck, with front and back left undecoded in the mapping."""
+        entry = self._decks[deck_name]
+        count = entry["count"]
+        records = self._records(deck_name)
+        offsets = self._offsets(deck_name)
+        blob = self._buf[entry["blob"]:entry["blob"] + offsets[-1]]
+
+        cards = CardStore()
+        for column, typecode in _COLUMNS.items():
+            setattr(cards, column, array(typecode, records[column].astype(typecode).tobytes()))
+        cards.ids = [str(blob[offsets[k]:offsets[k + 1]], "utf-8") for k in range(0, 3 * count, 3)]
+        cards.rows = dict(zip(cards.ids, range(count)))
+        cards.front = MappedTexts(blob, offsets, _TEXT_FRONT, count)
+        cards.back = MappedTexts(blob, offsets, _TEXT_BACK, count)
+        return cards
+
+    def load_decks(self) -> dict[str, CardStore]:
+        return {deck_name: self.load_deck(deck_name) for deck_name in self._decks}
@@ -0,0 +1,846 @@
+"""
+Where the collection is kept: decks, settings and the review log.
+
+JsonStorage is the original layout (decks.json, settings.json, revlog.jsonl).
+ShardedJsonStorage keeps one json file per deck plus a manifest, so saving a
+changed deck does not rewrite the others.
+SnapshotStorage keeps the decks in a binary file that is mapped into memory
+instead of parsed, for collections too big to parse at every startup. Each
+save writes a whole new file, with the unchanged decks copied as bytes, so a
+save costs a write of the size of the collection however little changed.
+SqliteStorage keeps the same data in one SQLite database, with cards indexed by
+(deck, due_date) and is_new, and every save done in a single transaction.
+
+CollectionCache keeps the loaded collection in memory and asks the storage to
+load it again only when its files changed on disk (mtime or size). Changes not
+in a snapshot yet are replayed from the journal (clnki.journal) on load.
+
+Import an existing JSON collection into SQLite from the repository root:
+    python -m clnki.storage --decks clnki_data/decks.json --settings clnki_data/settings.json --db clnki_data/clnki.db
+"""
+from clnki.cardstore import CardStore, decode_card, summarize, to_day
+from clnki.deck import Deck
+from clnki.journal import Journal
+from clnki.jsonstream import dump_deck, dump_decks, read_deck, read_decks
+from clnki.snapshot import Snapshot, write_snapshot
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from os import PathLike
+import argparse
+import functools
+import json
+import os
+import re
+import sqlite3
+import threading
+
+# Card fields besides front and back, in the order of the cards table.
+CARD_FIELDS = ("is_new", "stability", "difficulty", "due_date", "last_review_date", "priority")
+
+# Generation n of SnapshotStorage's snapshot, collection.snap for the first.
+_SNAPSHOT_NAME = re.compile(r"collection(?:\.(\d+))?\.snap")
+
+# Below this many bytes of shards, starting worker processes costs more than
+# parsing the shards one after another.
+PARALLEL_LOAD_MIN_BYTES = 4 << 20
+
+
+class Storage(ABC):
+    """Interface for loading and saving the collection."""
+
+    # Where the journal of changes not saved by save_decks yet is kept.
+    journal_path: str
+
+    @abstractmethod
+    def load_settings(self) -> dict | None:
+        """The saved settings, or None if there are none yet."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def save_settings(self, settings: dict) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def load_decks(self) -> dict[str, CardStore]:
+        """{deck_name: {card_id: card}}, with dates as day numbers."""
+        raise NotImplementedError
+
+    def load_summaries(self) -> dict[str, dict] | None:
+        """
+        {deck_name: clnki.cardstore.summarize of the deck} for every deck, kept
+        next to the decks so that they can be listed without loading them.
+        None if the storage has none, or none up to date: then call load_decks.
+        """
+        return None
+
+    def deck_names(self) -> list[str]:
+        """The names of the saved decks, loading the decks only if there are no summaries."""
+        summaries = self.load_summaries()
+        if summaries is not None:
+            return list(summaries)
+        return [deck_name for deck_name, _ in self.iter_decks()]
+
+    def load_deck(self, deck_name: str) -> CardStore:
+        """The cards of one deck, empty if there is no such deck. For storages with summaries."""
+        raise NotImplementedError
+
+    def iter_decks(self, deck_names=None):
+        """
+        (deck_name, cards) for the decks (the given ones, or all), loading one
+        deck at a time so that only one is in memory at once.
+        """
+        summaries = self.load_summaries()
+        if summaries is None:
+            # Storages that can do better override this.
+            decks = self.load_decks()
+            for deck_name in deck_names or list(decks):
+                yield deck_name, decks.get(deck_name, CardStore())
+            return
+        for deck_name in deck_names or list(summaries):
+            yield deck_name, self.load_deck(deck_name)
+
+    @abstractmethod
+    def save_decks(self, decks: dict[str, CardStore]) -> None:
+        """Replace the saved decks with decks, {deck_name: {card_id: card}}."""
+        raise NotImplementedError
+
+    def update_decks(self, changed: dict[str, CardStore], deck_names) -> None:
+        """
+        Save only the decks in changed, {deck_name: {card_id: card}}.
+
+        deck_names are all the decks there are now, the saved decks not among
+        them are removed. Storages that can write some decks without the
+        others override this; by default the unchanged decks are read back
+        and everything is saved with save_decks.
+        """
+        unchanged = [deck_name for deck_name in deck_names if deck_name not in changed]
+        saved = dict(self.iter_decks(unchanged)) if unchanged else {}
+        self.save_decks({deck_name: changed[deck_name] if deck_name in changed
+                         else saved.get(deck_name, CardStore()) for deck_name in deck_names})
+
+    @abstractmethod
+    def append_reviews(self, entries) -> None:
+        """
+        Add entries to the review log.
+
+        Each entry is [deck_name] + an entry of Deck.review_log.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def iter_reviews(self):
+        """The review log entries in the order they were added."""
+        raise NotImplementedError
+
+    def stamp(self):
+        """
+        Something that changes whenever the saved collection changes on disk,
+        or None if that cannot be told (then the collection is always reloaded).
+        """
+        return None
+
+    def close(self) -> None:
+        pass
+
+
+@contextmanager
+def atomic_write(path: str | PathLike, mode: str = 'w'):
+    """Write to a temporary file and rename it over path, so path is never half written."""
+    tmp_path = os.fspath(path) + ".tmp"
+    with open(tmp_path, mode, encoding=None if 'b' in mode else 'utf-8') as f:
+        yield f
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def write_json_atomic(path: str | PathLike, obj):
+    with atomic_write(path) as f:
+        json.dump(obj, f, indent=4)
+
+
+def file_stamp(path: str | PathLike):
+    """(mtime, size) of the file at path, or None if there is no such file."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _card_store(cards) -> CardStore:
+    """A CardStore of the (card_id, card) pairs read by clnki.jsonstream."""
+    store = CardStore()
+    for card_id, card in cards:
+        store[card_id] = decode_card(card)
+    return store
+
+
+class JsonStorage(Storage):
+    def __init__(self, decks_path: str | PathLike, settings_path: str | PathLike,
+                 revlog_path: str | PathLike | None = None):
+        """
+        Args:
+            decks_path: path to json holding all decks
+            settings_path: path to json holding settings
+            revlog_path: path to the review log (one json line per review),
+                         revlog.jsonl next to decks_path by default
+        """
+        self.decks_path = decks_path
+        self.settings_path = settings_path
+        if revlog_path is None:
+            revlog_path = os.path.join(os.path.dirname(decks_path), "revlog.jsonl")
+        self.revlog_path = revlog_path
+        self.journal_path = os.path.join(os.path.dirname(decks_path), "journal.jsonl")
+
+    def stamp(self):
+        # The review log is only appended to and never read back by the app.
+        return file_stamp(self.decks_path), file_stamp(self.settings_path)
+
+    def load_settings(self):
+        if not os.path.exists(self.settings_path):
+            return None
+        with open(self.settings_path, 'r', encoding='utf-8') as f:
+            # TODO: Have a default in case the file is empty.
+            return json.load(f)
+
+    def save_settings(self, settings):
+        write_json_atomic(self.settings_path, settings)
+
+    def load_decks(self):
+        # Card by card, so the file never has to be in memory as a whole.
+        with open(self.decks_path, 'r', encoding='utf-8') as f:
+            return {deck_name: _card_store(cards) for deck_name, cards in read_decks(f)}
+
+    def iter_decks(self, deck_names=None):
+        # decks.json is read card by card either way, so a deck is handed out
+        # as soon as it is read, and the ones not asked for are read past.
+        if not os.path.exists(self.decks_path):
+            return
+        wanted = None if deck_names is None else set(deck_names)
+        with open(self.decks_path, 'r', encoding='utf-8') as f:
+            for deck_name, cards in read_decks(f):
+                if wanted is None or deck_name in wanted:
+                    yield deck_name, _card_store(cards)
+
+    def save_decks(self, decks):
+        with atomic_write(self.decks_path) as f:
+            dump_decks(decks, f)
+
+    def append_reviews(self, entries):
+        with open(self.revlog_path, 'a', encoding='utf-8') as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + "\n")
+
+    def iter_reviews(self):
+        if not os.path.exists(self.revlog_path):
+            return
+        with open(self.revlog_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def load_shard(path: str | PathLike) -> dict:
+    """{card_id: card} of one deck shard, with dates as datetime.date."""
+    with open(path, 'r', encoding='utf-8') as f:
+        return _card_store(read_deck(f))
+
+
+class ShardedJsonStorage(JsonStorage):
+    """
+    One json file per deck in data_dir/decks, listed in data_dir/manifest.json.
+
+    A collection with only the old data_dir/decks.json is read from there, and
+    moves to shards with the first save. decks.json is left as it was.
+
+    Big collections are parsed by a pool of processes, one shard per task,
+    since json parsing holds the GIL and threads would take turns.
+    """
+
+    def __init__(self, data_dir: str | PathLike, settings_path: str | PathLike | None = None,
+                 revlog_path: str | PathLike | None = None, max_workers: int | None = None):
+        """
+        Args:
+            data_dir: directory of the collection
+            settings_path: data_dir/settings.json by default
+            revlog_path: data_dir/revlog.jsonl by default
+            max_workers: processes to load shards with, os.cpu_count() by default.
+                         1 loads them in this process.
+        """
+        super().__init__(os.path.join(data_dir, "decks.json"),
+                         settings_path or os.path.join(data_dir, "settings.json"),
+                         revlog_path)
+        self.manifest_path = os.path.join(data_dir, "manifest.json")
+        self.shard_dir = os.path.join(data_dir, "decks")
+        # Deck summaries, with the stamp of the shards they were taken from.
+        self.summary_path = os.path.join(data_dir, "summary.json")
+        self._shards = None  # deck_name -> file name in shard_dir, as in the manifest
+        self.max_workers = max_workers
+
+    def stamp(self):
+        # Shards are only ever replaced by renaming into shard_dir, which also
+        # changes the directory's mtime, so this covers them without a stat each.
+        return file_stamp(self.manifest_path), file_stamp(self.shard_dir), super().stamp()
+
+    def _load_manifest(self):
+        if self._shards is None:
+            if os.path.exists(self.manifest_path):
+                with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                    self._shards = json.load(f)["decks"]
+            else:
+                self._shards = {}
+        return self._shards
+
+    def _shards_stamp(self):
+        # As it reads back from json.
+        return [list(file_stamp(path) or ()) for path in (self.manifest_path, self.shard_dir)]
+
+    def _saved_summaries(self):
+        """The summaries in summary_path, or None if there are none for the shards there are now."""
+        if not os.path.exists(self.summary_path) or not os.path.exists(self.manifest_path):
+            return None
+        with open(self.summary_path, 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+        if saved["stamp"] != self._shards_stamp():
+            return None  # the shards were saved by something else since
+        return saved["decks"]
+
+    def load_summaries(self):
+        self._shards = None
+        summaries = self._saved_summaries()
+        if summaries is None or set(summaries) != set(self._load_manifest()):
+            return None
+        return summaries
+
+    def deck_names(self):
+        # From the manifest, even when the summaries are out of date.
+        self._shards = None
+        if not os.path.exists(self.manifest_path):
+            return [deck_name for deck_name, _ in super().iter_decks()]  # decks.json
+        return list(self._load_manifest())
+
+    def load_deck(self, deck_name):
+        shards = self._load_manifest()
+        if deck_name not in shards:
+            return CardStore()
+        return load_shard(os.path.join(self.shard_dir, shards[deck_name]))
+
+    def iter_decks(self, deck_names=None):
+        self._shards = None
+        if not os.path.exists(self.manifest_path):
+            yield from super().iter_decks(deck_names)  # decks.json
+            return
+        for deck_name in deck_names or list(self._load_manifest()):
+            yield deck_name, self.load_deck(deck_name)
+
+    def _shard_name(self, deck_name):
+        """A file name for a new deck, readable and not used by another deck."""
+        stem = re.sub(r"[^\w-]", "_", deck_name)[:60] or "deck"
+        used = set(self._shards.values())
+        name, n = f"{stem}.json", 1
+        while name in used:
+            n += 1
+            name = f"{stem}-{n}.json"
+        return name
+
+    def load_decks(self):
+        self._shards = None
+        if not os.path.exists(self.manifest_path):
+            return super().load_decks() if os.path.exists(self.decks_path) else {}
+
+        shards = self._load_manifest()
+        paths = [os.path.join(self.shard_dir, shard) for shard in shards.values()]
+        workers = min(self.max_workers or os.cpu_count() or 1, len(paths))
+        if workers > 1 and sum(map(os.path.getsize, paths)) >= PARALLEL_LOAD_MIN_BYTES:
+            # Big shards first, so that no worker is left with one at the end.
+            order = sorted(range(len(paths)), key=lambda i: -os.path.getsize(paths[i]))
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                loaded = dict(zip(order, executor.map(load_shard, [paths[i] for i in order])))
+            cards_by_shard = [loaded[i] for i in range(len(paths))]
+        else:
+            cards_by_shard = map(load_shard, paths)
+        return dict(zip(shards, cards_by_shard))
+
+    def save_decks(self, decks):
+        self._load_manifest()
+        self.update_decks(decks, list(decks))
+
+    def update_decks(self, changed, deck_names):
+        saved_summaries = self._saved_summaries() or {}
+        if not os.path.exists(self.manifest_path) and os.path.exists(self.decks_path):
+            # First save since decks.json: the unchanged decks need shards too.
+            legacy = super().load_decks()
+            changed = {**{deck_name: legacy[deck_name] for deck_name in deck_names
+                          if deck_name in legacy}, **changed}
+        shards = self._load_manifest()
+        manifest_changed = set(shards) != set(deck_names)
+        os.makedirs(self.shard_dir, exist_ok=True)
+        # A deck never changed since it was made (an empty new deck) needs a shard as well.
+        changed = {**{deck_name: CardStore() for deck_name in deck_names
+                      if deck_name not in shards and deck_name not in changed}, **changed}
+
+        for deck_name, cards in changed.items():
+            if deck_name not in shards:
+                shards[deck_name] = self._shard_name(deck_name)
+            with atomic_write(os.path.join(self.shard_dir, shards[deck_name])) as f:
+                dump_deck(cards, f)
+
+        removed = [shards.pop(deck_name) for deck_name in set(shards) - set(deck_names)]
+        # New shards are in place before the manifest lists them, and removed
+        # ones are only deleted after it stopped listing them.
+        if manifest_changed or not os.path.exists(self.manifest_path):
+            write_json_atomic(self.manifest_path, {"decks": shards})
+        for shard in removed:
+            os.remove(os.path.join(self.shard_dir, shard))
+
+        summaries = {}
+        for deck_name in deck_names:
+            if deck_name in changed:
+                summaries[deck_name] = summarize(changed[deck_name])
+            elif deck_name in saved_summaries:
+                summaries[deck_name] = saved_summaries[deck_name]
+            else:
+                summaries[deck_name] = summarize(self.load_deck(deck_name))
+        with atomic_write(self.summary_path) as f:
+            json.dump({"stamp": self._shards_stamp(), "decks": summaries}, f)
+
+
+class SnapshotStorage(JsonStorage):
+    """
+    The decks in a binary snapshot in data_dir (see clnki.snapshot), with
+    settings and the review log as json next to it.
+
+    Loading maps the file and decodes no card text, so it does not grow with the
+    amount of text. Without a snapshot yet, the decks are read from the json
+    shards or decks.json of data_dir, and the first save writes one.
+
+    A mapped file cannot be replaced on every system (Windows refuses), and
+    loaded decks keep reading their text from it. So every save writes the
+    next generation, collection.snap, collection.1.snap, collection.2.snap...,
+    and the newest one is the snapshot. Decks that did not change (loaded or
+    not) are copied from the one before as bytes, as is the text of unchanged
+    cards of the others. An older one is unmapped and deleted once no card reads from it.
+    """
+
+    def __init__(self, data_dir: str | PathLike, settings_path: str | PathLike | None = None,
+                 revlog_path: str | PathLike | None = None):
+        """
+        Args:
+            data_dir: directory of the collection
+            settings_path: data_dir/settings.json by default
+            revlog_path: data_dir/revlog.jsonl by default
+        """
+        super().__init__(os.path.join(data_dir, "decks.json"),
+                         settings_path or os.path.join(data_dir, "settings.json"),
+                         revlog_path)
+        self.data_dir = data_dir
+        self._json_storage = ShardedJsonStorage(data_dir, self.settings_path, self.revlog_path)
+        self.snapshot = None  # the Snapshot loaded last
+        self._retired = []  # older Snapshots, closed once no card reads from them
+        # Decks are loaded on the UI thread and saved from the autosave thread.
+        self._lock = threading.Lock()
+
+    def _generations(self) -> list[str]:
+        """Paths of the snapshot files in data_dir, oldest first."""
+        if not os.path.isdir(self.data_dir):
+            return []
+        found = sorted((int(match[1] or 0), name) for name in os.listdir(self.data_dir)
+                       if (match := _SNAPSHOT_NAME.fullmatch(name)))
+        return [os.path.join(self.data_dir, name) for _, name in found]
+
+    def _current(self) -> Snapshot | None:
+        """The newest snapshot, mapped (again only if it is not the one mapped already)."""
+        generations = self._generations()
+        if not generations:
+            return None
+        if self.snapshot is None or self.snapshot.path != generations[-1]:
+            if self.snapshot is not None:
+                self._retired.append(self.snapshot)
+            # A generation is never written to again once it has its name.
+            self.snapshot = Snapshot(generations[-1])
+            self._collect(generations[:-1])
+        return self.snapshot
+
+    def _collect(self, old_paths):
+        """Unmap the retired snapshots no card reads from anymore, and delete old generations."""
+        still_read = set()
+        for snapshot in self._retired:
+            try:
+                snapshot.close()
+            except BufferError:
+                still_read.add(snapshot.path)
+        self._retired = [snapshot for snapshot in self._retired if snapshot.path in still_read]
+        for path in old_paths:
+            if path not in still_read:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass  # mapped by another clnki, the next save tries again
+
+    def stamp(self):
+        generations = self._generations()
+        current = generations[-1] if generations else None
+        return current, current and file_stamp(current), file_stamp(self.settings_path)
+
+    def load_decks(self):
+        with self._lock:
+            snapshot = self._current()
+            if snapshot is None:
+                return self._json_storage.load_decks()
+            return snapshot.load_decks()
+
+    def load_summaries(self):
+        with self._lock:
+            snapshot = self._current()
+            return None if snapshot is None else snapshot.summaries()
+
+    def deck_names(self):
+        with self._lock:
+            snapshot = self._current()
+        return self._json_storage.deck_names() if snapshot is None else snapshot.deck_names()
+
+    def load_deck(self, deck_name):
+        with self._lock:
+            snapshot = self.snapshot or self._current()
+            if snapshot is None or deck_name not in snapshot.deck_names():
+                return CardStore()
+            return snapshot.load_deck(deck_name)
+
+    def iter_decks(self, deck_names=None):
+        if not self._generations():
+            yield from self._json_storage.iter_decks(deck_names)
+            return
+        yield from Storage.iter_decks(self, deck_names)  # by summaries, not decks.json
+
+    def save_decks(self, decks):
+        self.update_decks(decks, list(decks))
+
+    def update_decks(self, changed, deck_names):
+        # The decks not in changed are copied from the current snapshot as
+        # bytes, so they need not be loaded. The lock keeps it mapped meanwhile.
+        with self._lock:
+            base = self._current()
+            if base is not None and not changed and base.deck_names() == list(deck_names):
+                return  # nothing to write, the snapshot is up to date
+            if base is None:
+                # First save, from json: every deck is written from its cards.
+                saved = self._json_storage.load_decks()
+                decks = {deck_name: changed[deck_name] if deck_name in changed
+                         else saved.get(deck_name, CardStore()) for deck_name in deck_names}
+            else:
+                decks = {deck_name: changed[deck_name] if deck_name in changed
+                         else None if deck_name in base.deck_names() else CardStore()
+                         for deck_name in deck_names}
+
+            number = int(_SNAPSHOT_NAME.fullmatch(os.path.basename(base.path))[1] or 0) + 1 \
+                if base is not None else 0
+            name = "collection.snap" if number == 0 else f"collection.{number}.snap"
+            # A new name, so the rename never replaces a mapped file.
+            with atomic_write(os.path.join(self.data_dir, name), 'wb') as f:
+                write_snapshot(f, decks, base)
+            self._current()
+
+    def close(self):
+        with self._lock:
+            if self.snapshot is not None:
+                self._retired.append(self.snapshot)
+                self.snapshot = None
+            self._collect(())
+
+
+class SqliteStorage(Storage):
+    """Dates are stored as day numbers (clnki.cardstore.to_day), as in memory."""
+
+    CARDS_TABLE = """
+    CREATE TABLE IF NOT EXISTS cards (
+        deck TEXT NOT NULL REFERENCES decks(name) ON DELETE CASCADE,
+        card_id TEXT NOT NULL,
+        front TEXT NOT NULL,
+        back TEXT NOT NULL,
+        is_new INTEGER NOT NULL,
+        stability REAL,
+        difficulty REAL,
+        due_date INTEGER,
+        last_review_date INTEGER,
+        priority INTEGER,
+        PRIMARY KEY (deck, card_id)
+    );
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS decks (
+        name TEXT PRIMARY KEY
+    );
+    """ + CARDS_TABLE + """
+    CREATE INDEX IF NOT EXISTS cards_deck_due ON cards (deck, due_date);
+    CREATE INDEX IF NOT EXISTS cards_is_new ON cards (is_new);
+    CREATE TABLE IF NOT EXISTS revlog (
+        id INTEGER PRIMARY KEY,
+        deck TEXT NOT NULL,
+        card_id TEXT NOT NULL,
+        review_date TEXT NOT NULL,
+        elapsed_days INTEGER,
+        grade INTEGER NOT NULL,
+        recalled INTEGER NOT NULL,
+        stability REAL,
+        difficulty REAL
+    );
+    CREATE TABLE IF NOT EXISTS settings (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL
+    );
+    """
+
+    # julianday() of the day number 0, clnki.cardstore.EPOCH.
+    EPOCH_JULIAN_DAY = 2440587.5
+
+    def __init__(self, db_path: str | PathLike):
+        """
+        Args:
+            db_path: path to the SQLite database, created if it does not exist
+        """
+        self.db_path = db_path
+        self.journal_path = os.fspath(db_path) + ".journal.jsonl"
+        # Snapshots are written from a background thread (clnki.autosave), one at a time.
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        self._migrate_iso_dates()
+        self.conn.executescript(self.SCHEMA)
+
+    def _migrate_iso_dates(self):
+        """Turn the ISO date columns of a database saved before day numbers into day numbers."""
+        columns = {name: col_type for _, name, col_type, *_ in
+                   self.conn.execute("PRAGMA table_info(cards)")}
+        if columns.get("due_date") != "TEXT":
+            return
+        with self.conn:
+            self.conn.execute("BEGIN")  # so that the table changes are part of it too
+            self.conn.execute("ALTER TABLE cards RENAME TO cards_iso")
+            self.conn.execute("DROP INDEX IF EXISTS cards_deck_due")
+            self.conn.execute("DROP INDEX IF EXISTS cards_is_new")
+            self.conn.execute(self.CARDS_TABLE)
+            self.conn.execute(
+                "INSERT INTO cards SELECT deck, card_id, front, back, is_new, stability,"
+                " difficulty, CAST(julianday(due_date) - ? AS INTEGER),"
+                " CAST(julianday(last_review_date) - ? AS INTEGER), priority FROM cards_iso",
+                (self.EPOCH_JULIAN_DAY, self.EPOCH_JULIAN_DAY))
+            self.conn.execute("DROP TABLE cards_iso")
+
+    def stamp(self):
+        return file_stamp(self.db_path)
+
+    def close(self):
+        self.conn.close()
+
+    def load_settings(self):
+        rows = self.conn.execute("SELECT key, value FROM settings").fetchall()
+        if not rows:
+            return None
+        return {key: json.loads(value) for key, value in rows}
+
+    def save_settings(self, settings):
+        with self.conn:
+            self.conn.execute("DELETE FROM settings")
+            self.conn.executemany("INSERT INTO settings (key, value) VALUES (?, ?)",
+                                  [(key, json.dumps(value)) for key, value in settings.items()])
+
+    def load_decks(self):
+        decks = {name: CardStore() for (name,) in self.conn.execute("SELECT name FROM decks")}
+        self._fill(decks, self.conn.execute(
+            "SELECT deck, card_id, front, back, " + ", ".join(CARD_FIELDS) + " FROM cards"))
+        return decks
+
+    def load_summaries(self):
+        # Counted from the (deck, due_date) index, so they are always up to date.
+        summaries = {name: {"total": 0, "new": 0, "due": []}
+                     for (name,) in self.conn.execute("SELECT name FROM decks")}
+        for deck_name, total, new in self.conn.execute(
+                "SELECT deck, COUNT(*), SUM(is_new) FROM cards GROUP BY deck"):
+            summaries[deck_name]["total"] = total
+            summaries[deck_name]["new"] = new
+        for deck_name, day, count in self.conn.execute(
+                "SELECT deck, due_date, COUNT(*) FROM cards WHERE due_date IS NOT NULL"
+                " GROUP BY deck, due_date ORDER BY deck, due_date"):
+            summaries[deck_name]["due"].append([day, count])
+        return summaries
+
+    def deck_names(self):
+        return [name for (name,) in self.conn.execute("SELECT name FROM decks")]
+
+    def iter_decks(self, deck_names=None):
+        if deck_names is None:
+            deck_names = self.deck_names()
+        for deck_name in deck_names:
+            yield deck_name, self.load_deck(deck_name)
+
+    def load_deck(self, deck_name):
+        decks = {deck_name: CardStore()}
+        self._fill(decks, self.conn.execute(
+            "SELECT deck, card_id, front, back, " + ", ".join(CARD_FIELDS) +
+            " FROM cards WHERE deck = ?", (deck_name,)))
+        return decks[deck_name]
+
+    @staticmethod
+    def _fill(decks, rows):
+        for deck_name, card_id, front, back, *fields in rows:
+            card = {"front": front, "back": back}
+            for field, value in zip(CARD_FIELDS, fields):
+                if value is not None:
+                    card[field] = value
+            card["is_new"] = bool(card["is_new"])
+            decks[deck_name][card_id] = card
+
+    @staticmethod
+    def _card_rows(decks):
+        for deck_name, cards in decks.items():
+            for card_id, card in cards.items():
+                yield (deck_name, card_id, card["front"], card["back"], int(card["is_new"]),
+                       card.get("stability"), card.get("difficulty"),
+                       to_day(card.get("due_date")), to_day(card.get("last_review_date")),
+                       card.get("priority"))
+
+    def save_decks(self, decks):
+        with self.conn:
+            self.conn.execute("DELETE FROM decks")  # cascades to cards
+            self.conn.executemany("INSERT INTO decks (name) VALUES (?)",
+                                  [(deck_name,) for deck_name in decks])
+            self.conn.executemany(
+                "INSERT INTO cards (deck, card_id, front, back, " + ", ".join(CARD_FIELDS) + ")"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", self._card_rows(decks))
+
+    def update_decks(self, changed, deck_names):
+        deck_names = list(deck_names)
+        with self.conn:
+            saved = {name for (name,) in self.conn.execute("SELECT name FROM decks")}
+            self.conn.executemany("DELETE FROM decks WHERE name = ?",
+                                  [(name,) for name in saved - set(deck_names)])
+            self.conn.executemany("DELETE FROM cards WHERE deck = ?",
+                                  [(name,) for name in changed])
+            self.conn.executemany("INSERT OR IGNORE INTO decks (name) VALUES (?)",
+                                  [(name,) for name in deck_names])
+            self.conn.executemany(
+                "INSERT INTO cards (deck, card_id, front, back, " + ", ".join(CARD_FIELDS) + ")"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", self._card_rows(changed))
+
+    def append_reviews(self, entries):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO revlog (deck, card_id, review_date, elapsed_days, grade, recalled,"
+                " stability, difficulty) VALUES (?, ?, ?, ?, ?, ?, ?, ?)", entries)
+
+    def iter_reviews(self):
+        rows = self.conn.execute(
+            "SELECT deck, card_id, review_date, elapsed_days, grade, recalled, stability,"
+            " difficulty FROM revlog ORDER BY id")
+        for row in rows:
+            entry = list(row)
+            entry[5] = bool(entry[5])
+            yield entry
+
+
+class CollectionCache:
+    """
+    The loaded settings and decks, reloaded only when the storage changed on disk.
+
+    With a storage that keeps deck summaries (Storage.load_summaries), decks
+    are made from their summaries and load their cards when first opened.
+
+    After a save, call saved() so that the cache's own writes do not count as a change.
+    """
+
+    def __init__(self, storage: Storage, journal: Journal | None = None):
+        """
+        Args:
+            journal: replayed over the saved decks on every load
+        """
+        self.storage = storage
+        self.journal = journal
+        self.settings = None
+        self.decks = {}
+        self._stamp = None
+
+    def load(self) -> bool:
+        """
+        Load the collection if it is not loaded yet or changed on disk since.
+
+        Returns: whether settings and decks were (re)loaded
+        """
+        stamp = self.storage.stamp()
+        if stamp is not None and stamp == self._stamp:
+            return False
+        self.settings = self.storage.load_settings()
+        summaries = self.storage.load_summaries()
+        if summaries is None:
+            decks = self.storage.load_decks()
+            replayed = self.journal.replay(decks) if self.journal is not None else ()
+        else:
+            # Only the decks with journal lines are loaded now, the others when first opened.
+            decks = {}
+            replayed = (self.journal.replay(decks, self.storage.load_deck)
+                        if self.journal is not None else ())
+        self.decks = {deck_name: Deck(summary=summary,
+                                      loader=functools.partial(self.storage.load_deck, deck_name))
+                      for deck_name, summary in (summaries or {}).items()}
+        self.decks.update((deck_name, Deck(cards)) for deck_name, cards in decks.items())
+        for deck_name in replayed:
+            self.decks[deck_name].dirty = True  # not in the saved decks yet
+        self._stamp = stamp
+        return True
+
+    def saved(self):
+        """Take the current state on disk as the one in memory."""
+        self._stamp = self.storage.stamp()
+
+
+def import_json(json_storage: JsonStorage, sqlite_storage: SqliteStorage):
+    """Copy decks, settings and the review log of a JSON collection into SQLite."""
+    decks = json_storage.load_decks()
+    Journal(json_storage.journal_path).replay(decks)
+    sqlite_storage.save_decks(decks)
+    settings = json_storage.load_settings()
+    if settings is not None:
+        sqlite_storage.save_settings(settings)
+    sqlite_storage.append_reviews(json_storage.iter_reviews())
+    return decks
+
+
+def add_storage_arguments(parser: argparse.ArgumentParser):
+    """The options that choose the storage of a collection, for open_storage."""
+    parser.add_argument("--db", help="Use this SQLite database instead of the json files.")
+    parser.add_argument("--snapshot", action="store_true",
+                        help="Keep the decks in a binary snapshot, collection*.snap in the data "
+                             "directory, which opens without parsing. Made from the json files "
+                             "on the first save.")
+
+
+def open_storage(args: argparse.Namespace, data_dir: str | PathLike) -> Storage:
+    """The storage chosen by the options of add_storage_arguments, json shards in data_dir by default."""
+    if args.db:
+        return SqliteStorage(args.db)
+    if args.snapshot:
+        return SnapshotStorage(data_dir)
+    return ShardedJsonStorage(data_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="clnki.storage",
+                                     description="Import a JSON collection into SQLite.")
+    parser.add_argument("--decks", default="clnki/data/decks.json")
+    parser.add_argument("--settings", default="clnki/data/settings.json")
+    parser.add_argument("--revlog")
+    parser.add_argument("--db", default="clnki/data/clnki.db")
+    args = parser.parse_args()
+
+    sqlite_storage = SqliteStorage(args.db)
+    try:
+        decks = import_json(JsonStorage(args.decks, args.settings, args.revlog), sqlite_storage)
+    finally:
+        sqlite_storage.close()
+    print(f"Imported {len(decks)} decks with {sum(len(cards) for cards in decks.values())} "
+          f"cards into {args.db}.")
+
+
+if __name__ == "__main__":
+    main()
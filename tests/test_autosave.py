@@ -0,0 +1,119 @@
+from clnki.autosave import Autosaver
+from clnki.cardstore import CardStore
+from clnki.main import Clnki
+from clnki.storage import ShardedJsonStorage
+from datetime import date
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+
+def fail(*args):
+    raise sqlite3.OperationalError("disk I/O error")
+
+
+class SaveFailureTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        ShardedJsonStorage(self.tmp.name).save_decks(
+            {"geo": CardStore({"1": {"front": "f", "back": "b", "is_new": True}})})
+        self.storage = ShardedJsonStorage(self.tmp.name)
+        self.app = Clnki(self.storage)
+        self.app.autosaver.every = self.app.autosaver.idle = 10 ** 9
+        self.app.load_collection()
+        self.app.today = date(2024, 1, 10)
+        self.deck = self.app.open_deck("geo")
+        with self.app.lock:
+            self.deck.review("1", 3, self.app.model, self.app.today)
+            self.app.journal_cards("geo", ["1"])
+
+    def tearDown(self):
+        self.app.autosaver.stop()
+        self.tmp.cleanup()
+
+    def saved_card(self):
+        return dict(ShardedJsonStorage(self.tmp.name).load_deck("geo")["1"])
+
+    def assert_kept_for_next_save(self):
+        self.assertTrue(self.deck.dirty)
+        self.assertEqual(len(self.deck.review_log), 1)
+        self.assertTrue(self.app.journal.on_disk())
+        self.assertTrue(self.saved_card()["is_new"])
+
+        self.app.save_changes()
+        self.assertFalse(self.deck.dirty)
+        self.assertEqual(self.deck.review_log, [])
+        self.assertFalse(self.saved_card()["is_new"])
+        self.assertEqual(len(list(self.storage.iter_reviews())), 1)
+
+    def test_deck_write_fails(self):
+        self.storage.update_decks = fail
+        with self.assertRaises(sqlite3.OperationalError):
+            self.app.save_changes()
+        del self.storage.update_decks
+        # The reviews were written before the decks failed, so they are not kept to write twice.
+        self.assertEqual(self.deck.review_log, [])
+        self.assertTrue(self.deck.dirty)
+        self.assertTrue(self.app.journal.on_disk())
+        self.assertTrue(self.saved_card()["is_new"])
+
+        self.app.save_changes()
+        self.assertFalse(self.deck.dirty)
+        self.assertFalse(self.saved_card()["is_new"])
+        self.assertEqual(len(list(self.storage.iter_reviews())), 1)
+
+    def test_review_log_write_fails(self):
+        self.storage.append_reviews = fail
+        with self.assertRaises(sqlite3.OperationalError):
+            self.app.save_changes()
+        del self.storage.append_reviews
+        self.assert_kept_for_next_save()
+
+    def test_journal_survives_failed_save(self):
+        self.storage.update_decks = fail
+        with self.assertRaises(sqlite3.OperationalError):
+            self.app.save_changes()
+        # A crash now: the next start replays the review and saves it.
+        self.app.journal.close()
+        app = Clnki(ShardedJsonStorage(self.tmp.name))
+        app.load_collection()
+        app.autosaver.stop()
+        self.assertFalse(app.decks["geo"].cards["1"]["is_new"])
+        self.assertFalse(self.saved_card()["is_new"])
+        self.assertFalse(app.journal.on_disk())
+
+
+class AutosaverTest(unittest.TestCase):
+    def test_failed_save_is_recorded_and_retried(self):
+        saved = threading.Event()
+        calls = []
+
+        def save():
+            calls.append(None)
+            if len(calls) == 1:
+                fail()
+            saved.set()
+
+        autosaver = Autosaver(save, lambda: None, every=1, idle=10 ** 9, sync_interval=0.01)
+        autosaver.start()
+        autosaver.notify()
+        self.assertTrue(saved.wait(5))
+        autosaver.stop()
+        self.assertIsNone(autosaver.error)
+        self.assertEqual(len(calls), 2)
+
+    def test_error_kept_until_a_save_succeeds(self):
+        autosaver = Autosaver(fail, lambda: None, every=1, idle=10 ** 9, sync_interval=0.01)
+        autosaver.start()
+        autosaver.notify()
+        for _ in range(500):
+            if autosaver.error is not None:
+                break
+            threading.Event().wait(0.01)
+        autosaver.stop()
+        self.assertIsInstance(autosaver.error, sqlite3.OperationalError)
+
+
+if __name__ == "__main__":
+    unittest.main()
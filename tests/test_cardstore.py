@@ -0,0 +1,72 @@
+from clnki.cardstore import CardStore
+from clnki.jsonstream import dump_deck
+from clnki.storage import load_shard
+from collections.abc import Mapping
+import os
+import tempfile
+import unittest
+
+
+def reviewed_card():
+    return {"front": "f", "back": "b", "is_new": False, "stability": 2.5,
+            "difficulty": 5.0, "due_date": 100, "last_review_date": 90}
+
+
+class CardStoreTest(unittest.TestCase):
+    def test_assign_own_view(self):
+        store = CardStore({"1": reviewed_card()})
+        store["1"] = store["1"]
+        self.assertEqual(dict(store["1"]), reviewed_card())
+
+    def test_assign_mapping_reading_the_row(self):
+        store = CardStore({"1": reviewed_card()})
+
+        class Lazy(Mapping):
+            # A mapping that only reads the view when it is read.
+            def __init__(self, view):
+                self.view = view
+
+            def __getitem__(self, field):
+                return self.view[field]
+
+            def __iter__(self):
+                return iter(self.view)
+
+            def __len__(self):
+                return len(self.view)
+
+        store["1"] = Lazy(store["1"])
+        self.assertEqual(dict(store["1"]), reviewed_card())
+
+    def test_assign_view_of_other_row(self):
+        store = CardStore({"1": reviewed_card(), "2": {"front": "x", "back": "y", "is_new": True}})
+        store["2"] = store["1"]
+        self.assertEqual(dict(store["2"]), reviewed_card())
+
+    def test_unknown_fields_are_kept(self):
+        card = {**reviewed_card(), "tags": ["geo", "eu"]}
+        store = CardStore({"1": card})
+        self.assertEqual(store["1"]["tags"], ["geo", "eu"])
+        self.assertEqual(dict(store["1"]), card)
+        self.assertEqual(dict(store.iter_dicts())["1"], card)
+        self.assertEqual(dict(store.copy()["1"]), card)
+
+        store["1"] = reviewed_card()
+        self.assertNotIn("tags", store["1"])
+
+    def test_unknown_fields_round_trip_through_a_shard(self):
+        card = {**reviewed_card(), "tags": "geo"}
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "deck.json")
+            with open(path, 'w', encoding='utf-8') as f:
+                dump_deck(CardStore({"1": card}), f)
+            self.assertEqual(dict(load_shard(path)["1"]), card)
+
+    def test_delete_drops_unknown_fields(self):
+        store = CardStore({"1": {**reviewed_card(), "tags": "geo"}})
+        del store["1"]
+        self.assertEqual(store.extra, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
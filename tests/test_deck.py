@@ -0,0 +1,168 @@
+from clnki.cardstore import to_day
+from clnki.deck import Deck, NewCardQueue, fuzz_range
+from clnki.fsrs import FSRSModel
+from clnki.schedule import schedule_daily
+from datetime import date, timedelta
+import unittest
+
+W = [0.212, 1.2931, 2.3065, 8.2956, 6.4133, 0.8334, 3.0194, 0.001, 1.8722, 0.1666,
+     0.796, 1.4835, 0.0614, 0.2629, 1.6483, 0.6014, 1.8729, 0.5425, 0.0912, 0.0658,
+     0.1542]
+
+TODAY = date(2024, 1, 10)
+
+
+def make_deck(new_order="insertion"):
+    """Reviewed cards r1..r5 due 5..1 days ago (r1 the most overdue), r6 due tomorrow, new n1..n5."""
+    cards = {}
+    for i in range(1, 7):
+        due = to_day(TODAY) - 6 + i if i < 6 else to_day(TODAY) + 1
+        cards[f"r{i}"] = {"front": f"r{i}", "back": "", "is_new": False, "stability": float(i),
+                          "difficulty": 5.0, "due_date": due, "last_review_date": due - i}
+    for i in range(1, 6):
+        cards[f"n{i}"] = {"front": f"n{i}", "back": "", "is_new": True, "priority": 5 - i}
+    return Deck(cards, new_order)
+
+
+class ScheduleTest(unittest.TestCase):
+    def setUp(self):
+        self.model = FSRSModel(W, 0.9)
+        self.deck = make_deck()
+
+    def schedule(self, limit=3, new_per_day=2, **kwargs):
+        return self.deck.schedule(TODAY, limit, new_per_day, self.model, **kwargs)
+
+    def test_most_overdue_first(self):
+        self.assertTrue(self.schedule())
+        self.assertEqual(self.deck.due_reviews, ["r1", "r2", "r3"])
+        self.assertEqual(self.deck.due_new, ["n1", "n2"])
+
+    def test_same_settings_recompute_nothing(self):
+        self.schedule()
+        self.assertFalse(self.schedule())
+        self.assertEqual(schedule_daily({"deck": self.deck}, TODAY, 3, 2, self.model), [])
+
+    def test_limits_changed(self):
+        self.schedule()
+        self.assertTrue(self.schedule(limit=10, new_per_day=4))
+        self.assertEqual(self.deck.due_reviews, ["r1", "r2", "r3", "r4", "r5"])
+        self.assertEqual(self.deck.due_new, ["n1", "n2", "n3", "n4"])
+        self.schedule(limit=1, new_per_day=1)
+        self.assertEqual(self.deck.due_reviews, ["r1"])
+        self.assertEqual(self.deck.due_new, ["n1"])
+
+    def test_limits_count_reviews_done_today(self):
+        self.schedule()
+        self.deck.review("r1", 3, self.model, TODAY)
+        self.deck.review("n1", 3, self.model, TODAY)
+        self.assertEqual(self.deck.due_reviews, ["r2", "r3"])
+        self.assertEqual(self.deck.due_new, ["n2"])
+        self.schedule(limit=4, new_per_day=3)
+        self.assertEqual(self.deck.due_reviews, ["r2", "r3", "r4"])
+        self.assertEqual(self.deck.due_new, ["n2", "n3"])
+
+    def test_new_day(self):
+        self.schedule()
+        self.deck.review("r1", 3, self.model, TODAY)
+        self.assertTrue(self.deck.schedule(TODAY + timedelta(days=1), 10, 0, self.model))
+        self.assertEqual(self.deck.due_reviews, ["r2", "r3", "r4", "r5", "r6"])
+
+    def test_retrievability_order(self):
+        self.schedule(limit=2, due_order="retrievability")
+        today_day = to_day(TODAY)
+        card_ids = ["r1", "r2", "r3", "r4", "r5"]
+        by_r = sorted(card_ids, key=lambda card_id: self.model.forgetting_curve(
+            today_day - self.deck.cards[card_id]["last_review_date"],
+            self.deck.cards[card_id]["stability"]))
+        self.assertEqual(self.deck.due_reviews, by_r[:2])
+
+    def test_new_order_changed(self):
+        self.schedule()
+        self.assertTrue(self.schedule(new_order="priority"))
+        self.assertEqual(self.deck.due_new, ["n5", "n4"])
+
+    def test_added_card_tops_up_new_queue(self):
+        deck = Deck({})
+        deck.schedule(TODAY, 10, 2, self.model)
+        self.assertEqual(deck.due_new, [])
+        card_id = deck.add_card("front", "back")
+        deck.schedule(TODAY, 10, 2, self.model)
+        self.assertEqual(deck.due_new, [card_id])
+
+    def test_summarized_deck(self):
+        deck = Deck(summary={"total": 7, "new": 3, "due": [[to_day(TODAY) - 1, 4], [to_day(TODAY) + 1, 2]]},
+                    loader=lambda: {})
+        self.assertTrue(deck.schedule(TODAY, 3, 2, self.model))
+        self.assertEqual(deck.num_due, 5)
+        self.assertFalse(deck.loaded)
+
+
+class NewCardQueueTest(unittest.TestCase):
+    def test_insertion(self):
+        queue = NewCardQueue()
+        queue.extend(["a", "b", "c", "d"])
+        queue.remove("b")
+        self.assertEqual(queue.first(2), ["a", "c"])
+        self.assertEqual(queue.first(5, exclude={"a"}), ["c", "d"])
+        self.assertEqual(len(queue), 3)
+
+    def test_priority(self):
+        queue = NewCardQueue("priority")
+        for card_id, priority in [("a", 3), ("b", 1), ("c", 3), ("d", 2)]:
+            queue.add(card_id, priority)
+        self.assertEqual(queue.first(4), ["b", "d", "a", "c"])
+        queue.remove("d")
+        self.assertEqual(queue.first(2, exclude={"b"}), ["a", "c"])
+        self.assertNotIn("d", queue)
+
+    def test_random_takes_each_card_once(self):
+        queue = NewCardQueue("random")
+        queue.extend(map(str, range(100)))
+        for card_id in map(str, range(0, 100, 2)):
+            queue.remove(card_id)
+        first = queue.first(100)
+        self.assertEqual(sorted(first, key=int), list(map(str, range(1, 100, 2))))
+        self.assertEqual(queue.first(100), first)  # taking does not consume
+
+    def test_unknown_order(self):
+        with self.assertRaises(ValueError):
+            NewCardQueue("alphabetical")
+
+
+class LoadBalanceTest(unittest.TestCase):
+    def test_fuzz_range(self):
+        self.assertEqual(fuzz_range(1), (1, 1))
+        self.assertEqual(fuzz_range(10), (8, 12))
+        shortest, longest = fuzz_range(100)
+        self.assertLess(shortest, 100)
+        self.assertGreater(longest, 100)
+
+    def test_least_busy_day(self):
+        today_day = to_day(TODAY)
+        cards = {}
+        for offset, count in [(8, 1), (9, 3), (10, 5), (11, 0), (12, 2)]:
+            for i in range(count):
+                cards[f"{offset}-{i}"] = {"front": "", "back": "", "is_new": False, "stability": 10.0,
+                                          "difficulty": 5.0, "due_date": today_day + offset,
+                                          "last_review_date": today_day}
+        deck = Deck(cards)
+        self.assertEqual(deck.balanced_due_day(today_day, 10), today_day + 11)
+
+    def test_ties_go_to_interval(self):
+        deck = Deck({})
+        self.assertEqual(deck.balanced_due_day(0, 10), 10)
+
+    def test_review_spreads_cards(self):
+        model = FSRSModel(W, 0.9)
+        deck = Deck({str(i): {"front": str(i), "back": "", "is_new": False, "stability": 20.0,
+                              "difficulty": 5.0, "due_date": to_day(TODAY),
+                              "last_review_date": to_day(TODAY) - 20} for i in range(20)})
+        for card_id in list(deck.cards):
+            deck.review(card_id, 3, model, TODAY, load_balance=True)
+        due_days = [deck.cards[card_id]["due_date"] for card_id in deck.cards]
+        self.assertGreater(len(set(due_days)), 1)
+        self.assertLessEqual(max(due_days.count(day) for day in due_days), 20 // len(set(due_days)) + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,78 @@
+from clnki.deck import Deck
+from clnki.duplicates import CollectionDuplicates, DuplicateIndex, card_key
+import unittest
+
+
+class CardKeyTest(unittest.TestCase):
+    def test_normalized(self):
+        self.assertEqual(card_key("Capital of  France", "Paris\n"), card_key("capital of france", " PARIS"))
+        self.assertNotEqual(card_key("a", "b"), card_key("b", "a"))
+        self.assertNotEqual(card_key("a b", ""), card_key("a", "b"))
+
+
+class DuplicateIndexTest(unittest.TestCase):
+    def test_add_remove(self):
+        index = DuplicateIndex()
+        index.add(b"k", "1")
+        index.add(b"k", "2")
+        index.add(b"j", "3")
+        self.assertEqual(index.get(b"k"), ["1", "2"])
+        self.assertEqual(len(index), 2)
+        index.remove(b"k", "1")
+        self.assertEqual(index.get(b"k"), ["2"])
+        index.remove(b"k", "2")
+        self.assertNotIn(b"k", index)
+        self.assertEqual(index.get(b"k"), [])
+        self.assertEqual(list(index.items()), [(b"j", ["3"])])
+
+
+class DeckDuplicatesTest(unittest.TestCase):
+    def test_kept_up_to_date(self):
+        deck = Deck({"1": {"front": "Paris", "back": "France", "is_new": True}})
+        paris = card_key("Paris", "France")
+        self.assertEqual(deck.duplicates.get(paris), ["1"])
+        card_id = deck.add_card("paris", "france")
+        (rome_id,) = deck.add_cards([("Rome", "Italy")])
+        self.assertEqual(deck.duplicates.get(paris), ["1", card_id])
+        deck.set_text(card_id, "Berlin", "Germany")
+        self.assertEqual(deck.duplicates.get(paris), ["1"])
+        self.assertEqual(deck.duplicates.get(card_key("Berlin", "Germany")), [card_id])
+        deck.remove_card(rome_id)
+        self.assertNotIn(card_key("Rome", "Italy"), deck.duplicates)
+
+
+class CollectionDuplicatesTest(unittest.TestCase):
+    def setUp(self):
+        self.geo = Deck({"1": {"front": "Paris", "back": "France", "is_new": True}})
+        self.other = Deck({"1": {"front": "Paris", "back": "France", "is_new": True},
+                           "2": {"front": "Rome", "back": "Italy", "is_new": True}})
+        self.collection = CollectionDuplicates({"geo": self.geo, "other": self.other})
+
+    def test_find(self):
+        self.assertEqual(self.collection.find(card_key("Paris", "France")), [("geo", "1"), ("other", "1")])
+        self.assertEqual(self.collection.find(card_key("Rome", "Italy")), [("other", "2")])
+        self.assertEqual(self.collection.find(card_key("Oslo", "Norway")), [])
+
+    def test_follows_deck_changes(self):
+        card_id = self.geo.add_card("Oslo", "Norway")
+        self.assertEqual(self.collection.find(card_key("Oslo", "Norway")), [("geo", card_id)])
+        self.other.remove_card("2")
+        self.assertNotIn(card_key("Rome", "Italy"), self.collection)
+
+    def test_detach(self):
+        self.collection.detach("other")
+        self.assertNotIn(card_key("Rome", "Italy"), self.collection)
+        self.other.add_card("Oslo", "Norway")
+        self.assertNotIn(card_key("Oslo", "Norway"), self.collection)
+        self.assertEqual(self.collection.find(card_key("Paris", "France")), [("geo", "1")])
+
+    def test_attach_summarized_deck_loads_it(self):
+        lazy = Deck(summary={"total": 1, "new": 1, "due": []},
+                    loader=lambda: {"7": {"front": "Oslo", "back": "Norway", "is_new": True}})
+        self.collection.attach("lazy", lazy)
+        self.assertTrue(lazy.loaded)
+        self.assertEqual(self.collection.find(card_key("Oslo", "Norway")), [("lazy", "7")])
+
+
+if __name__ == "__main__":
+    unittest.main()
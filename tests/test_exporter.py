@@ -0,0 +1,56 @@
+from clnki.cardstore import CardStore
+from clnki.exporter import export, format_for
+from clnki.importer import iter_rows
+import gzip
+import json
+import os
+import tempfile
+import unittest
+
+CARDS = {
+    "1": {"front": "plain", "back": "text", "is_new": True},
+    "2": {"front": "#not a header", "back": 'say "hi"', "is_new": True},
+    "3": {"front": "tab\there", "back": "line\nbreak\r\n", "is_new": False, "stability": 2.5,
+          "difficulty": 5.0, "due_date": 19000, "last_review_date": 18990},
+}
+
+
+class ExportTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_tsv_round_trip(self):
+        path = os.path.join(self.tmp.name, "deck.tsv")
+        self.assertEqual(export([("geo", CardStore(CARDS))], path, with_deck=False), 3)
+        with open(path, 'r', encoding='utf-8', newline='') as f:
+            self.assertEqual(list(iter_rows(f)), [(card["front"], card["back"]) for card in CARDS.values()])
+
+    def test_gzip_with_deck(self):
+        path = os.path.join(self.tmp.name, "collection.tsv.gz")
+        self.assertEqual(export([("a", CardStore(CARDS)), ("b", CARDS)], path), 6)
+        with gzip.open(path, 'rt', encoding='utf-8', newline='') as f:
+            self.assertEqual(len(list(iter_rows(f))), 6)
+        with gzip.open(path, 'rt', encoding='utf-8', newline='') as f:
+            self.assertIn("#deck column:3\n", f.read())
+
+    def test_jsonl(self):
+        path = os.path.join(self.tmp.name, "deck.jsonl")
+        self.assertEqual(format_for(path), "jsonl")
+        export([("geo", CardStore(CARDS))], path, "jsonl")
+        with open(path, 'r', encoding='utf-8') as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual([line["card_id"] for line in lines], ["1", "2", "3"])
+        self.assertEqual(lines[2]["front"], "tab\there")
+        self.assertEqual(lines[2]["due_date"], "2022-01-08")
+        self.assertEqual(lines[2]["deck"], "geo")
+
+    def test_unknown_format(self):
+        with self.assertRaises(ValueError):
+            export([], os.path.join(self.tmp.name, "x"), "csv")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,36 @@
+from clnki.fsrs import _round2, fsrs, fsrs_batch
+import numpy as np
+import random
+import unittest
+
+W = [0.212, 1.2931, 2.3065, 8.2956, 6.4133, 0.8334, 3.0194, 0.001, 1.8722, 0.1666,
+     0.796, 1.4835, 0.0614, 0.2629, 1.6483, 0.6014, 1.8729, 0.5425, 0.0912, 0.0658,
+     0.1542]
+
+
+class Round2Test(unittest.TestCase):
+    def test_near_ties_match_round(self):
+        values = [6.135, 0.125, 1.005, 2.675, 99.185, -1.005, 0.0]
+        rng = random.Random(0)
+        values += [rng.randint(0, 1_000_000) / 1000 + 0.005 for _ in range(10_000)]
+        self.assertEqual(_round2(np.array(values)).tolist(), [round(x, 2) for x in values])
+
+    def test_scalar(self):
+        self.assertEqual(float(_round2(6.135)), round(6.135, 2))
+        self.assertEqual(float(_round2(8.296)), 8.3)
+
+    def test_batch_matches_scalar(self):
+        rng = np.random.default_rng(0)
+        n = 10_000
+        elapsed_days = rng.integers(0, 365, n)
+        grades = rng.integers(1, 5, n)
+        s = np.round(rng.uniform(0.1, 365, n), 2)
+        d = np.round(rng.uniform(1, 10, n), 2)
+        scalar = [fsrs(e, g, s_i, d_i, 0.9, W) for e, g, s_i, d_i in
+                  zip(elapsed_days.tolist(), grades.tolist(), s.tolist(), d.tolist())]
+        batch = fsrs_batch(elapsed_days, grades, s, d, 0.9, W)
+        self.assertTrue(np.array_equal(np.array(scalar), np.column_stack(batch)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+from clnki.deck import Deck
+from clnki.duplicates import CollectionDuplicates
+from clnki.importer import import_rows, iter_rows
+import csv
+import io
+import unittest
+
+
+def rows(text):
+    return list(iter_rows(io.StringIO(text, newline="")))
+
+
+def texts(deck):
+    return sorted((deck.cards[card_id]["front"], deck.cards[card_id]["back"]) for card_id in deck.cards)
+
+
+class IterRowsTest(unittest.TestCase):
+    def test_no_headers(self):
+        self.assertEqual(rows("F1\tB1\textra\nF2\n\n"), [("F1", "B1"), ("F2", "")])
+
+    def test_separator(self):
+        self.assertEqual(rows("#separator:comma\nF,B\n"), [("F", "B")])
+        self.assertEqual(rows("#separator:;\nF;B\n"), [("F", "B")])
+        with self.assertRaises(ValueError):
+            rows("#separator:nope\nF\tB\n")
+
+    def test_columns(self):
+        self.assertEqual(rows("#columns:Tags\tBack\tFront\nt\tB\tF\n"), [("F", "B")])
+
+    def test_quoted_fields(self):
+        self.assertEqual(rows('"F\tone\nline two"\t"say ""hi"""\n'), [("F\tone\nline two", 'say "hi"')])
+
+    def test_html(self):
+        self.assertEqual(rows("#html:true\n<b>F</b>&amp;G\tone<br>two\n"), [("F&G", "one\ntwo")])
+        self.assertEqual(rows("<b>F</b>\tB\n"), [("<b>F</b>", "B")])
+
+    def test_anki_meta_columns(self):
+        text = ("#separator:tab\n#html:false\n#guid column:1\n#notetype column:2\n#deck column:3\n"
+                "#tags column:6\nguid\tBasic\tGeo\tF\tB\ttag\n")
+        self.assertEqual(rows(text), [("F", "B")])
+        self.assertEqual(rows("#deck column:2\nF\tGeo\tB\n"), [("F", "B")])
+
+    def test_long_field(self):
+        limit = csv.field_size_limit()
+        self.assertEqual(rows("x" * (limit + 1) + "\tB\n"), [("x" * (limit + 1), "B")])
+        self.assertEqual(csv.field_size_limit(), limit)
+
+
+class ImportRowsTest(unittest.TestCase):
+    def test_batches(self):
+        deck = Deck({})
+        self.assertEqual(import_rows([(f"F{i}", "B") for i in range(25)], deck, batch_size=10), 25)
+        self.assertEqual(len(deck.cards), 25)
+
+    def test_skip(self):
+        deck = Deck({})
+        deck.add_card("Paris", "France")
+        added = import_rows([("paris ", "France"), ("Rome", "Italy"), ("Rome", "Italy")], deck,
+                            duplicates="skip")
+        self.assertEqual(added, 1)
+        self.assertEqual(texts(deck), [("Paris", "France"), ("Rome", "Italy")])
+
+    def test_merge(self):
+        deck = Deck({})
+        deck.add_card("Paris", "France")
+        import_rows([("PARIS", "France")], deck, duplicates="merge")
+        self.assertEqual(texts(deck), [("PARIS", "France")])
+
+    def test_across_decks(self):
+        other = Deck({})
+        other.add_card("Paris", "France")
+        deck = Deck({})
+        collection = CollectionDuplicates({"other": other, "new": deck})
+        self.assertEqual(import_rows([("Paris", "France"), ("Rome", "Italy")], deck,
+                                     duplicates="skip", collection=collection), 1)
+        self.assertEqual(texts(deck), [("Rome", "Italy")])
+
+    def test_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            import_rows([], Deck({}), duplicates="nope")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+from clnki.cardstore import CardStore
+from clnki.journal import Journal
+import os
+import tempfile
+import unittest
+
+
+def card(due):
+    return {"front": "f", "back": "b", "is_new": False, "stability": 2.5,
+            "difficulty": 5.0, "due_date": due, "last_review_date": 90}
+
+
+class JournalTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.journal = Journal(os.path.join(self.tmp.name, "journal.jsonl"), sync_every=None)
+
+    def tearDown(self):
+        self.journal.close()
+        self.tmp.cleanup()
+
+    def replayed(self):
+        decks = {"geo": CardStore({"1": card(100)})}
+        changed = Journal(self.journal.path).replay(decks)
+        return changed, {deck_name: {card_id: cards[card_id]["due_date"] for card_id in cards}
+                         for deck_name, cards in decks.items()}
+
+    def test_replay_last_state_wins(self):
+        self.journal.append("geo", "1", card(101))
+        self.journal.append("geo", "1", card(102))
+        self.journal.append("new", "5", card(103))
+        self.journal.sync()
+        self.assertEqual(self.replayed(), ({"geo", "new"}, {"geo": {"1": 102}, "new": {"5": 103}}))
+
+    def test_replay_skips_line_cut_short(self):
+        self.journal.append("geo", "1", card(101))
+        self.journal.close()
+        with open(self.journal.path, 'a', encoding='utf-8') as f:
+            f.write('["geo", "1", {"fro')
+        self.assertEqual(self.replayed(), ({"geo"}, {"geo": {"1": 101}}))
+
+    def test_replay_missing_deck_from_loader(self):
+        self.journal.append("lazy", "2", card(104))
+        self.journal.sync()
+        decks = {}
+        Journal(self.journal.path).replay(decks, lambda deck_name: CardStore({"1": card(1)}))
+        self.assertEqual(sorted(decks["lazy"]), ["1", "2"])
+
+    def test_rotate_keeps_order(self):
+        self.journal.append("geo", "1", card(101))
+        self.journal.rotate()
+        self.journal.append("geo", "1", card(102))  # made while the snapshot is written
+        old_path = self.journal.finish_rotate()
+        self.journal.sync()
+        self.assertTrue(os.path.exists(old_path))
+        self.assertEqual(self.replayed()[1], {"geo": {"1": 102}})
+
+        # The save is done: only the lines after the rotate are left.
+        os.remove(old_path)
+        self.assertEqual(self.replayed()[1], {"geo": {"1": 102}})
+
+    def test_rotate_after_failed_save(self):
+        self.journal.append("geo", "1", card(101))
+        self.journal.rotate()
+        self.journal.finish_rotate()  # and the save fails, so .old stays
+        self.journal.append("geo", "1", card(102))
+        self.journal.rotate()
+        self.journal.append("geo", "1", card(103))
+        self.journal.finish_rotate()
+        self.journal.sync()
+        self.assertEqual(self.replayed()[1], {"geo": {"1": 103}})
+        self.assertFalse(os.path.exists(self.journal.next_path))
+
+    def test_crash_between_rotate_and_finish(self):
+        self.journal.append("geo", "1", card(101))
+        self.journal.rotate()
+        self.journal.append("geo", "1", card(102))
+        self.journal.close()
+        self.assertTrue(os.path.exists(self.journal.next_path))
+        self.assertEqual(self.replayed()[1], {"geo": {"1": 102}})
+
+        # The next start rotates again over the leftover.
+        journal = Journal(self.journal.path)
+        journal.rotate()
+        journal.finish_rotate()
+        self.assertEqual(self.replayed()[1], {"geo": {"1": 102}})
+
+    def test_discard(self):
+        self.journal.append("geo", "1", card(101))
+        self.journal.rotate()
+        self.journal.append("geo", "1", card(102))
+        self.journal.discard()
+        self.assertFalse(self.journal.on_disk())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,47 @@
+from clnki.deck import Deck
+from clnki.search import SearchIndex, tokenize
+import unittest
+
+
+class SearchIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = SearchIndex()
+        self.index.add_many([("1", "Capital of France", "Paris"),
+                             ("2", "Capital of Italy", "Rome"),
+                             ("3", "Größte Stadt", "Berlin")])
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize("Hello, hello WORLD_1!"), {"hello", "world_1"})
+
+    def test_prefixes(self):
+        self.assertEqual(self.index.search("cap"), {"1", "2"})
+        self.assertEqual(self.index.search("cap fra"), {"1"})
+        self.assertEqual(self.index.search("GRÖSS"), {"3"})
+        self.assertEqual(self.index.search("capital madrid"), set())
+        self.assertEqual(self.index.search("  "), set())
+
+    def test_tokens_stay_sorted(self):
+        self.index.add("4", "Zürich", "alpha")
+        self.index.add_many([("5", "beta", "Capital")])
+        self.index.remove("2", "Capital of Italy", "Rome")
+        self.assertEqual(self.index._tokens, sorted(self.index._postings))
+        self.assertEqual(self.index.search("cap"), {"1", "5"})
+        self.assertEqual(self.index.search("rome"), set())
+
+
+class DeckSearchTest(unittest.TestCase):
+    def test_kept_up_to_date(self):
+        deck = Deck({"1": {"front": "Capital of France", "back": "Paris", "is_new": True}})
+        self.assertEqual(deck.search("paris"), ["1"])
+        card_id = deck.add_card("Capital of Spain", "Madrid")
+        (lisbon_id,) = deck.add_cards([("Capital of Portugal", "Lisbon")])
+        self.assertEqual(deck.search("capital"), ["1", card_id, lisbon_id])
+        deck.set_text("1", "Capital of Germany", "Berlin")
+        self.assertEqual(deck.search("paris"), [])
+        self.assertEqual(deck.search("berl"), ["1"])
+        deck.remove_card(card_id)
+        self.assertEqual(deck.search("madrid"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
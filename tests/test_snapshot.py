@@ -0,0 +1,108 @@
+from clnki.cardstore import CardStore, summarize
+from clnki.snapshot import Snapshot, write_snapshot
+from clnki.storage import SnapshotStorage
+import os
+import tempfile
+import unittest
+
+
+def make_deck():
+    return CardStore({
+        "1": {"front": "capital of France", "back": "Paris", "is_new": False, "stability": 2.5,
+              "difficulty": 5.0, "due_date": 100, "last_review_date": 90},
+        "2": {"front": "ünïcode ✓", "back": "", "is_new": True, "priority": 3},
+        "3": {"front": "line\nbreak", "back": "tab\there", "is_new": True},
+    })
+
+
+class SnapshotTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "collection.snap")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def write(self, decks, base=None, path=None):
+        with open(path or self.path, 'wb') as f:
+            write_snapshot(f, decks, base)
+
+    def test_write_then_load(self):
+        decks = {"geo": make_deck(), "empty": CardStore()}
+        self.write(decks)
+        snapshot = Snapshot(self.path)
+        self.assertEqual(snapshot.deck_names(), ["geo", "empty"])
+        loaded = snapshot.load_decks()
+        self.assertEqual({card_id: dict(card) for card_id, card in loaded["geo"].items()},
+                         {card_id: dict(card) for card_id, card in decks["geo"].items()})
+        self.assertEqual(len(loaded["empty"]), 0)
+        self.assertEqual(snapshot.summaries(),
+                         {"geo": summarize(decks["geo"]), "empty": summarize(CardStore())})
+        del loaded
+        snapshot.close()
+
+    def test_unchanged_deck_copied_from_base(self):
+        self.write({"geo": make_deck(), "other": CardStore({"9": {"front": "a", "back": "b",
+                                                                  "is_new": True}})})
+        base = Snapshot(self.path)
+        path = os.path.join(self.tmp.name, "collection.1.snap")
+        changed = base.load_deck("other")
+        changed["9"] = {"front": "a", "back": "changed", "is_new": True}
+        self.write({"geo": None, "other": changed}, base, path)
+        del changed
+        base.close()
+
+        snapshot = Snapshot(path)
+        self.assertEqual(dict(snapshot.load_deck("geo")["2"]), dict(make_deck()["2"]))
+        self.assertEqual(snapshot.load_deck("other")["9"]["back"], "changed")
+        snapshot.close()
+
+    def test_close_while_read(self):
+        self.write({"geo": make_deck()})
+        snapshot = Snapshot(self.path)
+        deck = snapshot.load_deck("geo")
+        with self.assertRaises(BufferError):
+            snapshot.close()
+        self.assertEqual(deck["1"]["back"], "Paris")
+        del deck
+        snapshot.close()
+
+
+class SnapshotStorageTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.storage = SnapshotStorage(self.tmp.name)
+
+    def tearDown(self):
+        self.storage.close()
+        self.tmp.cleanup()
+
+    def snap_files(self):
+        return sorted(name for name in os.listdir(self.tmp.name) if name.endswith(".snap"))
+
+    def test_saves_write_new_generations(self):
+        self.storage.save_decks({"geo": make_deck()})
+        self.assertEqual(self.snap_files(), ["collection.snap"])
+        deck = self.storage.load_deck("geo")
+        deck["1"] = {**deck["1"], "due_date": 200}
+        self.storage.update_decks({"geo": deck}, ["geo", "new"])
+        del deck
+        self.assertEqual(self.storage.deck_names(), ["geo", "new"])
+        self.assertEqual(self.storage.load_deck("geo")["1"]["due_date"], 200)
+        # The first generation goes once nothing reads from it anymore.
+        self.storage.update_decks({"new": CardStore()}, ["geo", "new"])
+        self.assertEqual(self.snap_files(), ["collection.2.snap"])
+
+    def test_save_without_changes_writes_nothing(self):
+        self.storage.save_decks({"geo": make_deck()})
+        self.storage.update_decks({}, ["geo"])
+        self.assertEqual(self.snap_files(), ["collection.snap"])
+
+    def test_removed_deck(self):
+        self.storage.save_decks({"geo": make_deck(), "old": make_deck()})
+        self.storage.update_decks({}, ["geo"])
+        self.assertEqual(list(self.storage.load_summaries()), ["geo"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,131 @@
+from clnki.cardstore import CardStore, summarize
+from clnki.jsonstream import dump_decks
+from clnki.storage import ShardedJsonStorage, SqliteStorage
+import json
+import os
+import sqlite3
+import tempfile
+import unittest
+
+
+def make_deck(front="f"):
+    return CardStore({
+        "1": {"front": front, "back": "b", "is_new": False, "stability": 2.5,
+              "difficulty": 5.0, "due_date": 100, "last_review_date": 90},
+        "2": {"front": front + "2", "back": "", "is_new": True},
+    })
+
+
+def as_dicts(decks):
+    return {deck_name: {card_id: dict(card) for card_id, card in cards.items()}
+            for deck_name, cards in decks.items()}
+
+
+class ShardedJsonStorageTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.storage = ShardedJsonStorage(self.tmp.name, max_workers=1)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def manifest(self):
+        with open(self.storage.manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)["decks"]
+
+    def test_save_then_load(self):
+        decks = {"geo": make_deck(), "a/b: c": make_deck("x")}
+        self.storage.save_decks(decks)
+        manifest = self.manifest()
+        self.assertEqual(list(manifest), ["geo", "a/b: c"])
+        self.assertEqual(sorted(os.listdir(self.storage.shard_dir)), sorted(manifest.values()))
+        self.assertEqual(as_dicts(ShardedJsonStorage(self.tmp.name).load_decks()), as_dicts(decks))
+        self.assertEqual(self.storage.load_summaries(),
+                         {deck_name: summarize(cards) for deck_name, cards in decks.items()})
+
+    def test_update_writes_only_changed_shards(self):
+        self.storage.save_decks({"geo": make_deck(), "other": make_deck()})
+        other_path = os.path.join(self.storage.shard_dir, self.manifest()["other"])
+        os.utime(other_path, (0, 0))
+        self.storage.update_decks({"geo": make_deck("changed")}, ["geo", "other"])
+        self.assertEqual(os.stat(other_path).st_mtime, 0)
+        self.assertEqual(self.storage.load_deck("geo")["1"]["front"], "changed")
+        self.assertIsNotNone(self.storage.load_summaries())
+
+    def test_new_empty_and_removed_decks(self):
+        self.storage.save_decks({"geo": make_deck(), "old": make_deck()})
+        old_shard = self.manifest()["old"]
+        self.storage.update_decks({}, ["geo", "empty"])
+        self.assertEqual(list(self.manifest()), ["geo", "empty"])
+        self.assertNotIn(old_shard, os.listdir(self.storage.shard_dir))
+        self.assertEqual(self.storage.deck_names(), ["geo", "empty"])
+        self.assertEqual(len(self.storage.load_deck("empty")), 0)
+
+    def test_summaries_out_of_date(self):
+        self.storage.save_decks({"geo": make_deck()})
+        with open(self.storage.manifest_path, 'w', encoding='utf-8') as f:
+            json.dump({"decks": {}}, f)  # as saved by something else
+        self.assertIsNone(self.storage.load_summaries())
+
+    def test_moves_from_decks_json(self):
+        with open(self.storage.decks_path, 'w', encoding='utf-8') as f:
+            dump_decks({"geo": make_deck(), "other": make_deck("x")}, f)
+        self.assertEqual(self.storage.deck_names(), ["geo", "other"])
+        self.assertEqual(self.storage.load_deck("geo"), CardStore())  # no shards yet
+        self.assertEqual(dict(self.storage.iter_decks(["other"]))["other"]["1"]["front"], "x")
+
+        self.storage.update_decks({"geo": make_deck("changed")}, ["geo", "other"])
+        self.assertEqual(as_dicts(self.storage.load_decks()),
+                         as_dicts({"geo": make_deck("changed"), "other": make_deck("x")}))
+
+
+class SqliteStorageTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "clnki.db")
+        self.storage = SqliteStorage(self.path)
+
+    def tearDown(self):
+        self.storage.close()
+        self.tmp.cleanup()
+
+    def test_schema(self):
+        conn = sqlite3.connect(self.path)
+        tables = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        indexes = {name for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        columns = [row[1] for row in conn.execute("PRAGMA table_info(cards)")]
+        conn.close()
+        self.assertLessEqual({"decks", "cards", "revlog", "settings"}, tables)
+        self.assertIn("cards_deck_due", indexes)
+        self.assertEqual(columns, ["deck", "card_id", "front", "back", "is_new", "stability",
+                                   "difficulty", "due_date", "last_review_date", "priority"])
+
+    def test_save_then_load(self):
+        decks = {"geo": make_deck(), "empty": CardStore()}
+        self.storage.save_decks(decks)
+        self.storage.close()
+        self.storage = SqliteStorage(self.path)
+        self.assertEqual(as_dicts(self.storage.load_decks()), as_dicts(decks))
+        self.assertEqual(self.storage.load_summaries(),
+                         {deck_name: summarize(cards) for deck_name, cards in decks.items()})
+        self.assertEqual(self.storage.deck_names(), ["geo", "empty"])
+
+    def test_update(self):
+        self.storage.save_decks({"geo": make_deck(), "old": make_deck()})
+        self.storage.update_decks({"geo": make_deck("changed"), "new": make_deck()}, ["geo", "new"])
+        self.assertEqual(sorted(self.storage.deck_names()), ["geo", "new"])
+        self.assertEqual(self.storage.load_deck("geo")["1"]["front"], "changed")
+        self.assertEqual(len(self.storage.load_deck("old")), 0)
+
+    def test_reviews_and_settings(self):
+        entries = [["geo", "1", "2024-01-10", None, 3, True, None, None],
+                   ["geo", "1", "2024-01-12", 2, 1, False, 2.5, 5.0]]
+        self.storage.append_reviews(entries)
+        self.assertEqual(list(self.storage.iter_reviews()), entries)
+        self.assertIsNone(self.storage.load_settings())
+        self.storage.save_settings({"new_cards_per_day": 5, "fsrs-desired-R": 0.9})
+        self.assertEqual(self.storage.load_settings(), {"new_cards_per_day": 5, "fsrs-desired-R": 0.9})
+
+
+if __name__ == "__main__":
+    unittest.main()